@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+
+from sentinelhub import DataCollection, SentinelHubSession
+
+from .response_cache import request_key
+from .sentinel_utils import DATA_FOLDER, filter_dates, get_dates_intervals, \
+    get_preview_evalscript, get_preview_request, parse_scenes, select_dates_by_orbit, \
+    selection_intervals
+from .wfs_fetcher import split_date_range, wfs_request_params, wfs_service_url
+
+# aiohttp is only needed by the asyncio engine, the rest of the plugin runs
+# without it
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# open connections shared by every order multiplexed on one client
+DEFAULT_MAX_CONNECTIONS = 16
+
+# responses with these statuses are retried with exponential backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_RETRIES = 3
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class AsyncOrderClient:
+    '''
+    asyncio engine that orders default mosaic previews end to end (WFS
+    catalog query, process API request, file write) without blocking, so many
+    orders can be multiplexed on one event loop over one aiohttp session.
+
+    Use it as an async context manager, or call close() when done:
+
+        async with AsyncOrderClient(config) as client:
+            files = await asyncio.gather(*[
+                client.order_preview(bbox, [112], [6, 7], [2020], 0.2)
+                for bbox in bboxes
+            ])
+
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * max_connections bounds the number of concurrent HTTP requests
+    * cache is an optional response_cache.ResponseCache for the previews
+    * data_folder is the folder the previews are written to
+    * max_retries is the number of times a rate limited or failed request is
+      retried
+    '''
+
+    def __init__(self, config, max_connections=DEFAULT_MAX_CONNECTIONS, cache=None,
+                 data_folder=DATA_FOLDER, max_retries=DEFAULT_MAX_RETRIES):
+        self.config = config
+        self.max_connections = max_connections
+        self.cache = cache
+        self.data_folder = data_folder
+        self.max_retries = max_retries
+
+        self._http = None
+        self._auth = None
+        self._auth_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self):
+        if self._http is None:
+            if aiohttp is None:
+                raise ImportError(
+                    'The asyncio order engine needs aiohttp, install it with '
+                    '"pip install -r requirements-async.txt" or "pip install aiohttp"')
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.config.download_timeout_seconds))
+        return self._http
+
+    async def _request(self, method, url, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            async with self._session().request(method, url, **kwargs) as response:
+                if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                response.raise_for_status()
+                return await response.read()
+
+    async def _run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def auth_headers(self):
+        '''
+        OAuth headers of the process API. sentinelhub fetches and refreshes the
+        token with blocking requests, so that runs on the default executor.
+        '''
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            if self._auth is None:
+                self._auth = await self._run_blocking(SentinelHubSession, self.config)
+            return await self._run_blocking(lambda: self._auth.session_headers)
+
+    async def get_json(self, url, params):
+        '''
+        GET a JSON document
+        '''
+        params = {key: str(value) for key, value in params.items()}
+        return json.loads(await self._request('GET', url, params=params))
+
+    async def post(self, url, payload, headers):
+        '''
+        POST a JSON payload and return the raw response body
+        '''
+        return await self._request('POST', url, json=payload, headers=headers)
+
+    async def query_scenes(self, bbox, start_date, end_date, max_cc,
+                           data_collection=DataCollection.SENTINEL2_L2A):
+        '''
+        Query the WFS catalog for the scenes of a bounding box between two
+        inclusive yyyy-mm-dd dates, see sentinel_utils.query_scenes. Long date
+        ranges are split into sub-ranges that are paged concurrently.
+        '''
+        url = wfs_service_url(self.config, data_collection)
+        page_size = self.config.max_wfs_records_per_query
+
+        async def fetch_range(range_start, range_end):
+            params = wfs_request_params(
+                bbox, range_start, range_end, max_cc, data_collection, page_size)
+            features = []
+            offset = 0
+            while True:
+                page = (await self.get_json(url, {**params, 'FEATURE_OFFSET': offset}))['features']
+                features += page
+
+                # a short page is the last one
+                if len(page) < page_size:
+                    return features
+                offset += page_size
+
+        pages = await asyncio.gather(*[
+            fetch_range(*sub_range) for sub_range in split_date_range(start_date, end_date)
+        ])
+
+        return parse_scenes([feature for page in pages for feature in page])
+
+    async def download(self, request):
+        '''
+        Run a preview request built by sentinel_utils.get_preview_request and
+        return the path of the response file, see sentinel_utils.download_preview
+        '''
+        if self.cache is not None:
+            key = request_key(request)
+            cached_path = await self._run_blocking(self.cache.get, key)
+            if cached_path is not None:
+                return cached_path
+
+        download_request = request.download_list[0]
+        headers = {**download_request.headers, **await self.auth_headers()}
+        data = await self.post(download_request.url, download_request.post_values, headers)
+
+        _, output_file = download_request.get_storage_paths()
+        await self._run_blocking(_write_file, output_file, data)
+
+        if self.cache is not None:
+            output_file = await self._run_blocking(self.cache.put, key, output_file)
+
+        return output_file
+
+    async def order_preview(self, bbox, orbits, months, years, max_cc,
+                            evalscript_options=None, with_dates=False):
+        '''
+        Order a default mosaic preview and return the path of the downloaded
+        file.
+
+        * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+        * orbits is a list of relative orbit numbers
+        * months and years are lists of integer months (1-12) and years
+        * max_cc is the maximum allowed cloud cover (0-1 scale)
+        * evalscript_options are keyword arguments of evalscript.build_evalscript
+        * with_dates returns a (path, list of yyyy-mm-dd dates) tuple instead
+        '''
+        # only the selected months are queried, see sentinel_utils.get_preview_dates
+        interval_scenes = await asyncio.gather(*[
+            self.query_scenes(bbox, start_date, end_date, max_cc)
+            for start_date, end_date in selection_intervals(months, years)
+        ])
+        scenes = [scene for scenes in interval_scenes for scene in scenes]
+
+        dates = select_dates_by_orbit(scenes, orbits)
+        dates_filt = filter_dates(dates, months=months, years=years)
+
+        time_intervals = get_dates_intervals(dates_filt)
+        request = get_preview_request(
+            get_preview_evalscript(
+                dates_filt, inputs=len(time_intervals), **(evalscript_options or {})),
+            bbox,
+            time_intervals,
+            max_cc,
+            self.config,
+            data_folder=self.data_folder)
+        output_file = await self.download(request)
+
+        if with_dates:
+            return output_file, dates_filt
+        return output_file
+
+    async def close(self):
+        '''
+        Close the HTTP session
+        '''
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+async def order_preview_async(bbox, orbits, months, years, max_cc, config,
+                              client=None, cache=None):
+    '''
+    Order a default mosaic preview on the running event loop and return the
+    path of the downloaded file, see AsyncOrderClient.order_preview. Pass a
+    shared client to multiplex many orders over one session.
+    '''
+    if client is not None:
+        return await client.order_preview(bbox, orbits, months, years, max_cc)
+
+    async with AsyncOrderClient(config, cache=cache) as client:
+        return await client.order_preview(bbox, orbits, months, years, max_cc)
+
+
+def order_previews(orders, config, max_connections=DEFAULT_MAX_CONNECTIONS, cache=None,
+                   data_folder=DATA_FOLDER):
+    '''
+    Run many preview orders concurrently on a new event loop, for callers
+    without one (a QgsTask or the command line, see cli.run_batch_async).
+
+    * orders is a list of dicts of AsyncOrderClient.order_preview keyword
+      arguments: bbox, orbits, months, years and max_cc, optionally
+      evalscript_options and with_dates
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * max_connections bounds the number of concurrent HTTP requests
+    * cache is an optional response_cache.ResponseCache
+    * data_folder is the folder the previews are written to
+
+    Returns a list of (order, output file, exception) tuples in the order of
+    orders, output file is None when the order failed and a (path, dates)
+    tuple for orders with_dates
+    '''
+    async def run_orders():
+        async with AsyncOrderClient(config, max_connections=max_connections, cache=cache,
+                                    data_folder=data_folder) as client:
+            return await asyncio.gather(
+                *[client.order_preview(**order) for order in orders],
+                return_exceptions=True)
+
+    results = []
+    for order, result in zip(orders, asyncio.run(run_orders())):
+        if isinstance(result, Exception):
+            results.append((order, None, result))
+        else:
+            results.append((order, result, None))
+
+    return results
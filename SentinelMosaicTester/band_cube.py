@@ -0,0 +1,337 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from osgeo import gdal, osr
+from sentinelhub import DataCollection, get_image_dimension, MimeType, \
+    SentinelHubRequest
+
+from .compositor import INVALID_SCL_CLASSES, PREVIEW_BANDS, composite_stack, \
+    cumulative_year_counts
+from .sentinel_utils import get_time_interval
+from .tracing import trace_span
+
+DEFAULT_CUBE_FOLDER = os.path.join(
+    os.path.expanduser('~'), '.cache', 'sentinel_mosaic_tester', 'cubes'
+)
+
+# scenes fetched per process API request, each returns 4 bands per scene so
+# this bounds the output bands and the size of a decoded response
+DEFAULT_CHUNK_DATES = 16
+
+# returns the raw preview bands of every scene so they can be composited
+# locally, band i * 4 + j of the output is band j of scene i and the scene
+# dates are returned in the userdata response
+RAW_BANDS_EVALSCRIPT = """
+//VERSION=3
+function setup() {
+return {
+    input: [{
+    bands: [
+        "B08", // near infrared
+        "B03", // green
+        "B02", // blue
+        "SCL" // pixel classification
+    ],
+    units: "DN"
+    }],
+    output: [
+    {
+        id: "default",
+        bands: 4,
+        sampleType: SampleType.UINT16
+    }
+    ],
+    mosaicking: "ORBIT"
+};
+}
+// acceptable images are ones collected on specified dates
+function filterScenes(availableScenes, inputMetadata) {
+var allowedDates = [%s]; // format with python
+return availableScenes.filter(function (scene) {
+    var sceneDateStr = scene.date.toISOString().split("T")[0]; //converting date and time to string and rounding to day precision
+    return allowedDates.includes(sceneDateStr);
+});
+}
+// one set of bands per scene
+function updateOutput(outputs, collection) {
+Object.values(outputs).forEach(function (output) {
+    output.bands = collection.scenes.length * 4;
+});
+}
+function updateOutputMetadata(scenes, inputMetadata, outputMetadata) {
+var orbits = scenes.orbits || scenes;
+outputMetadata.userData = {
+    dates: orbits.map(function (scene) {
+    // ORBIT mosaicking passes dateFrom as an ISO string
+    return new Date(scene.dateFrom || scene.date).toISOString().split("T")[0];
+    })
+};
+}
+function evaluatePixel(samples, scenes) {
+var values = new Array(samples.length * 4);
+for (var i = 0; i < samples.length; i++) {
+    values[i * 4] = samples[i].B08;
+    values[i * 4 + 1] = samples[i].B03;
+    values[i * 4 + 2] = samples[i].B02;
+    values[i * 4 + 3] = samples[i].SCL;
+}
+return {
+    default: values
+};
+}
+"""
+
+
+def cube_folder(bbox, max_cc, size, folder=DEFAULT_CUBE_FOLDER):
+    '''
+    Folder a band cube of a bounding box, maximum cloud cover and (width,
+    height) size is stored in, size is None for the default 512 pixel width
+    '''
+    coords = ','.join(f'{coord:.6f}' for coord in bbox)
+    cube_id = hashlib.md5(f'{bbox.crs.epsg}|{coords}|{max_cc:.4f}|{size}'.encode()).hexdigest()
+    return os.path.join(folder, cube_id)
+
+
+def write_geotiff(path, array, bbox):
+    '''
+    Write a (band, y, x) array covering a WGS84 bounding box to a GeoTIFF
+    '''
+    n_bands, height, width = array.shape
+    gdal_type = gdal.GDT_UInt16 if array.dtype == np.uint16 else gdal.GDT_Float32
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        path, width, height, n_bands, gdal_type, options=['COMPRESS=DEFLATE'])
+
+    min_x, min_y, max_x, max_y = bbox
+    dataset.SetGeoTransform(
+        (min_x, (max_x - min_x) / width, 0, max_y, 0, -(max_y - min_y) / height))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(bbox.crs.epsg)
+    dataset.SetProjection(srs.ExportToWkt())
+
+    for i in range(n_bands):
+        dataset.GetRasterBand(i + 1).WriteArray(array[i])
+
+    # closing the dataset flushes it to disk
+    dataset = None
+
+    return path
+
+
+def read_geotiff(path):
+    '''
+    Read every band of a GeoTIFF into a (band, y, x) array
+    '''
+    dataset = gdal.Open(path)
+    array = dataset.ReadAsArray()
+    dataset = None
+
+    # single band rasters are read as (y, x)
+    return array.reshape(-1, *array.shape[-2:])
+
+
+class BandCube:
+    '''
+    Raw preview bands of every scene of an AOI stored on disk as a memory
+    mapped (time, band, y, x) uint16 array, bands ordered as PREVIEW_BANDS.
+
+    The cube is fetched once, in requests of a bounded number of scenes, and
+    every later month/year/orbit selection is composited locally from it.
+
+    * folder holds cube.json (dates, relative orbits per date, bbox, size,
+      max_cc and the name of the data file) and the .npy data file
+    '''
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'cube.json')) as f:
+            self.metadata = json.load(f)
+        self.dates = self.metadata['dates']
+        self.orbits = self.metadata['orbits']
+        data = np.load(
+            os.path.join(folder, self.metadata.get('data_file', 'cube.npy')), mmap_mode='r')
+        # the data file is allocated for every requested date, dates the
+        # service had no data for are left at the end
+        self.data = data[:len(self.dates)]
+
+    @classmethod
+    def exists(cls, folder):
+        '''
+        True if a cube has been fetched into a folder
+        '''
+        return os.path.exists(os.path.join(folder, 'cube.json'))
+
+    @classmethod
+    def fetch(cls, folder, bbox, scenes, max_cc, config, size=None,
+              chunk_dates=DEFAULT_CHUNK_DATES, progress=None, tracer=None, orbits=None):
+        '''
+        Download the raw bands of a set of scenes and store them as a cube.
+
+        Scenes are requested chunk_dates dates at a time and every response is
+        written into the memory mapped data file as it arrives, so neither
+        the requests nor the memory use grow with the number of scenes. The
+        cube is written to a new data file and only replaces the folder's
+        current cube once complete, by replacing cube.json, so tasks reading
+        the old cube are not disturbed.
+
+        * folder is the folder the cube is written to
+        * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+        * scenes are scene records (see sentinel_utils.parse_scene) of the
+          dates to fetch, their relative orbits are kept for later selection
+        * max_cc is the maximum allowed cloud cover (0-1 scale)
+        * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+        * size is the (width, height) of the cube, 512 pixels wide by default
+        * chunk_dates is the number of dates fetched per request
+        * progress is an optional callable called with the fraction of the
+          chunks fetched so far
+        * tracer is an optional tracing.Tracer that times the download of
+          every chunk
+        * orbits are the relative orbits the scenes were selected for, kept so
+          covers can tell which orbits the cube holds, by default the orbits
+          of the scenes
+        '''
+        if size is None:
+            size = (512, get_image_dimension(bbox=bbox, width=512))
+        width, height = size
+
+        date_orbits = {}
+        for scene in scenes:
+            date_orbits.setdefault(scene['date'], set()).add(scene['relative_orbit'])
+        assert len(date_orbits) > 0, 'No scenes to fetch for the band cube.'
+        dates = sorted(date_orbits)
+        if orbits is None:
+            orbits = {scene['relative_orbit'] for scene in scenes}
+
+        os.makedirs(folder, exist_ok=True)
+        data_file = f'cube_{dt.datetime.now():%Y%m%dT%H%M%S%f}.npy'
+        data = np.lib.format.open_memmap(
+            os.path.join(folder, data_file), mode='w+', dtype=np.uint16,
+            shape=(len(dates), len(PREVIEW_BANDS), height, width))
+
+        scene_dates = []
+        try:
+            chunks = [dates[i:i + chunk_dates] for i in range(0, len(dates), chunk_dates)]
+            for n_chunk, chunk in enumerate(chunks):
+                date_string = ', '.join([f'"{date}"' for date in chunk])
+                request = SentinelHubRequest(
+                    evalscript=RAW_BANDS_EVALSCRIPT % date_string,
+                    input_data=[
+                        SentinelHubRequest.input_data(
+                            data_collection=DataCollection.SENTINEL2_L2A,
+                            time_interval=get_time_interval(chunk[0], chunk[-1]),
+                            maxcc=max_cc
+                        )
+                    ],
+                    responses=[
+                        SentinelHubRequest.output_response('default', MimeType.TIFF),
+                        SentinelHubRequest.output_response('userdata', MimeType.JSON)
+                    ],
+                    bbox=bbox,
+                    size=size,
+                    config=config
+                )
+                with trace_span(tracer, 'download', chunk=n_chunk, dates=len(chunk)):
+                    response = request.get_data()[0]
+                fetched_dates = response['userdata.json']['dates']
+
+                # (y, x, time * band) -> (time, band, y, x)
+                bands = response['default.tif'].reshape(
+                    height, width, len(fetched_dates), len(PREVIEW_BANDS))
+                start = len(scene_dates)
+                data[start:start + len(fetched_dates)] = bands.transpose(2, 3, 0, 1)
+                scene_dates += fetched_dates
+                del response, bands
+
+                if progress is not None:
+                    progress((n_chunk + 1) / len(chunks))
+            data.flush()
+            del data
+        except Exception:
+            del data
+            os.remove(os.path.join(folder, data_file))
+            raise
+
+        metadata = {
+            'dates': scene_dates,
+            'requested_dates': dates,
+            'orbits': [sorted(date_orbits.get(date, [])) for date in scene_dates],
+            'fetched_orbits': sorted(set(orbits)),
+            'bbox': list(bbox),
+            'crs': bbox.crs.epsg,
+            'size': [width, height],
+            'max_cc': max_cc,
+            'data_file': data_file,
+            'fetched': dt.datetime.now().isoformat()
+        }
+        previous_data_file = None
+        if cls.exists(folder):
+            with open(os.path.join(folder, 'cube.json')) as f:
+                previous_data_file = json.load(f).get('data_file', 'cube.npy')
+
+        # readers open cube.json first, replacing it switches them to the new
+        # data file at once
+        fd, tmp_path = tempfile.mkstemp(prefix='.cube', suffix='.json', dir=folder)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, os.path.join(folder, 'cube.json'))
+
+        if previous_data_file is not None:
+            try:
+                os.remove(os.path.join(folder, previous_data_file))
+            except OSError:
+                # still memory mapped by a reader on Windows, or already gone
+                pass
+
+        return cls(folder)
+
+    def covers(self, scenes, orbits):
+        '''
+        True if the cube was fetched for every one of a list of relative
+        orbits and every date of a list of scene records was fetched into it
+        (dates the service had no data for count as fetched). Cubes fetched
+        before their orbits were recorded cover none.
+        '''
+        if not set(orbits) <= set(self.metadata.get('fetched_orbits', [])):
+            return False
+        dates = set(self.metadata['requested_dates'])
+        return all(scene['date'] in dates for scene in scenes)
+
+    def select(self, orbits, months, years):
+        '''
+        Return the time indices of the cube's scenes from a list of relative
+        orbits, months and years
+        '''
+        selected = []
+        for i, (date, date_orbits) in enumerate(zip(self.dates, self.orbits)):
+            date = dt.date.fromisoformat(date)
+            if date.month in months and date.year in years and \
+                    any(orbit in orbits for orbit in date_orbits):
+                selected.append(i)
+
+        assert len(selected) > 0, \
+            'None of the cached scenes satisfy the desired orbits/months/years.'
+
+        return selected
+
+    def composite(self, orbits, months, years, invalid_scl=INVALID_SCL_CLASSES):
+        '''
+        Composite the cube's scenes from a list of relative orbits, months and
+        years locally, see compositor.composite_median
+        '''
+        stack = self.data[self.select(orbits, months, years)]
+        return composite_stack(stack, invalid_scl=invalid_scl)
+
+    def year_counts(self, orbits, months, years, invalid_scl=INVALID_SCL_CLASSES):
+        '''
+        Count the valid samples of the cube's scenes from a list of relative
+        orbits and months for cumulative sets of years locally, most recent
+        year first, see compositor.cumulative_year_counts
+        '''
+        selected = self.select(orbits, months, years)
+        return cumulative_year_counts(
+            self.data[selected], [self.dates[i] for i in selected], years,
+            invalid_scl=invalid_scl)
@@ -0,0 +1,320 @@
+import argparse
+import csv
+import os
+import re
+import shutil
+import sys
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from osgeo import ogr, osr
+from sentinelhub import BBox, CRS, SHConfig
+
+from . import async_orders
+from .compositor import INVALID_SCL_CLASSES
+from .evalscript import DEFAULT_BANDS, REDUCERS
+from .orbit_footprints import suggest_orbits
+from .preview_sweep import DEFAULT_MAX_WORKERS
+from .response_cache import ResponseCache
+from .scene_catalog import SceneCatalog
+from .sentinel_utils import DATA_FOLDER, download_preview, get_preview_dates, \
+    get_preview_evalscript, get_preview_request
+from .wfs_fetcher import WfsFetcher
+
+SUMMARY_COLUMNS = ('aoi', 'status', 'file', 'orbits', 'n_dates', 'dates', 'error')
+
+
+def parse_int_list(text):
+    '''
+    Parse a comma separated list of integers, e.g. "112,69"
+    '''
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def aoi_file_name(aoi_id):
+    '''
+    File name (without extension) of an AOI's preview, AOI ids come from
+    attribute values so anything but letters, digits, dots and dashes is
+    replaced by underscores
+    '''
+    return re.sub(r'[^\w.-]', '_', aoi_id)
+
+
+def check_file_names(aois):
+    '''
+    Assert that no two AOIs write the same preview file, which would let
+    concurrent orders overwrite each other. Names are compared ignoring case
+    for case insensitive file systems (Windows, macOS).
+    '''
+    aoi_ids = {}
+    for aoi_id, _ in aois:
+        aoi_ids.setdefault(aoi_file_name(aoi_id).lower(), []).append(aoi_id)
+    clashes = [ids for ids in aoi_ids.values() if len(ids) > 1]
+    assert len(clashes) == 0, \
+        f'AOI ids map to the same file name: {clashes}, choose another id field'
+
+
+def read_aois(path, id_field=None):
+    '''
+    Read the areas of interest of every layer of an OGR vector file as a list
+    of (AOI id, WGS84 bounding box) tuples
+
+    * path is any vector file OGR can open (GeoPackage, shapefile, GeoJSON...)
+    * id_field is the attribute that names each AOI, by default features are
+      named <layer name>_<feature id>
+    '''
+    dataset = ogr.Open(path)
+    assert dataset is not None, f'Could not open {path}'
+
+    wgs84 = osr.SpatialReference()
+    wgs84.ImportFromEPSG(4326)
+    wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    aois = []
+    for i in range(dataset.GetLayerCount()):
+        layer = dataset.GetLayer(i)
+
+        transform = None
+        layer_srs = layer.GetSpatialRef()
+        if layer_srs is not None:
+            layer_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(layer_srs, wgs84)
+
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if geometry is None:
+                continue
+            geometry = geometry.Clone()
+            if transform is not None:
+                geometry.Transform(transform)
+
+            min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+            if id_field is None:
+                aoi_id = f'{layer.GetName()}_{feature.GetFID()}'
+            else:
+                aoi_id = str(feature.GetField(id_field))
+            aois.append((aoi_id, BBox(bbox=[min_x, min_y, max_x, max_y], crs=CRS.WGS84)))
+
+    check_file_names(aois)
+
+    return aois
+
+
+def order_aoi(aoi_id, bbox, orbits, months, years, max_cc, config, output_folder,
+              catalog=None, cache=None, evalscript_options=None):
+    '''
+    Order the default mosaic preview of one AOI and copy it to
+    <output_folder>/<aoi_id>.tif. Returns the AOI's summary row.
+
+    * orbits is a list of relative orbits, or None to use every orbit that
+      intersects the AOI
+    * evalscript_options are keyword arguments of evalscript.build_evalscript
+    * see get_preview_dates for the remaining arguments
+    '''
+    if orbits is None:
+        orbits = [orbit for orbit, _ in suggest_orbits(bbox)]
+
+    dates, time_intervals = get_preview_dates(
+        bbox, orbits, months, years, max_cc, config, catalog=catalog)
+    request = get_preview_request(
+        get_preview_evalscript(dates, inputs=len(time_intervals), **(evalscript_options or {})),
+        bbox, time_intervals, max_cc, config)
+
+    output_file = os.path.join(output_folder, f'{aoi_file_name(aoi_id)}.tif')
+    shutil.copyfile(download_preview(request, cache=cache), output_file)
+
+    return {
+        'aoi': aoi_id,
+        'status': 'ok',
+        'file': output_file,
+        'orbits': ' '.join(str(orbit) for orbit in orbits),
+        'n_dates': len(dates),
+        'dates': ' '.join(dates),
+        'error': ''
+    }
+
+
+def run_batch(aois, orbits, months, years, max_cc, config, output_folder,
+              catalog=None, cache=None, max_workers=DEFAULT_MAX_WORKERS, progress=None,
+              evalscript_options=None):
+    '''
+    Order the default mosaic preview of many AOIs with a bounded thread pool.
+    A failing AOI is recorded in its summary row and does not stop the batch.
+
+    * aois is a list of (AOI id, WGS84 bounding box) tuples, see read_aois
+    * progress is an optional callable that receives each finished summary row
+
+    Returns the summary rows in the order of aois
+    '''
+    check_file_names(aois)
+    os.makedirs(output_folder, exist_ok=True)
+
+    rows = [None] * len(aois)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                order_aoi, aoi_id, bbox, orbits, months, years, max_cc, config,
+                output_folder, catalog=catalog, cache=cache,
+                evalscript_options=evalscript_options): i
+            for i, (aoi_id, bbox) in enumerate(aois)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                rows[i] = future.result()
+            except Exception as e:
+                rows[i] = {
+                    'aoi': aois[i][0], 'status': 'failed', 'file': '', 'orbits': '',
+                    'n_dates': 0, 'dates': '', 'error': repr(e)
+                }
+            if progress is not None:
+                progress(rows[i])
+
+    return rows
+
+
+def run_batch_async(aois, orbits, months, years, max_cc, config, output_folder,
+                    cache=None, max_connections=async_orders.DEFAULT_MAX_CONNECTIONS,
+                    progress=None, evalscript_options=None, data_folder=DATA_FOLDER):
+    '''
+    Order the default mosaic preview of many AOIs concurrently on one event
+    loop with the asyncio engine (see async_orders.order_previews), which
+    multiplexes every catalog query and process request over one aiohttp
+    session instead of a thread per AOI. Needs aiohttp.
+
+    * max_connections bounds the number of concurrent HTTP requests
+    * data_folder is the folder the responses are downloaded to
+    * see run_batch for the remaining arguments, the local scene catalog is
+      not used by this engine
+
+    Returns the summary rows in the order of aois
+    '''
+    check_file_names(aois)
+    os.makedirs(output_folder, exist_ok=True)
+
+    orders = []
+    for _, bbox in aois:
+        aoi_orbits = orbits
+        if aoi_orbits is None:
+            aoi_orbits = [orbit for orbit, _ in suggest_orbits(bbox)]
+        orders.append({
+            'bbox': bbox, 'orbits': aoi_orbits, 'months': months, 'years': years,
+            'max_cc': max_cc, 'evalscript_options': evalscript_options, 'with_dates': True
+        })
+
+    results = async_orders.order_previews(
+        orders, config, max_connections=max_connections, cache=cache, data_folder=data_folder)
+
+    rows = []
+    for (aoi_id, _), (order, result, exception) in zip(aois, results):
+        if exception is None:
+            output_file, dates = result
+            aoi_file = os.path.join(output_folder, f'{aoi_file_name(aoi_id)}.tif')
+            shutil.copyfile(output_file, aoi_file)
+            row = {
+                'aoi': aoi_id,
+                'status': 'ok',
+                'file': aoi_file,
+                'orbits': ' '.join(str(orbit) for orbit in order['orbits']),
+                'n_dates': len(dates),
+                'dates': ' '.join(dates),
+                'error': ''
+            }
+        else:
+            row = {
+                'aoi': aoi_id, 'status': 'failed', 'file': '', 'orbits': '',
+                'n_dates': 0, 'dates': '', 'error': repr(exception)
+            }
+        rows.append(row)
+        if progress is not None:
+            progress(row)
+
+    return rows
+
+
+def write_summary(path, rows):
+    '''
+    Write summary rows to a CSV file
+    '''
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m SentinelMosaicTester.cli',
+        description='Order a default Sentinel 2 mosaic preview GeoTIFF for every '
+                    'feature of a vector file and write a summary CSV.')
+    parser.add_argument('aois', help='vector file of areas of interest')
+    parser.add_argument('output_folder', help='folder the previews and summary.csv are written to')
+    parser.add_argument('--months', type=parse_int_list, required=True,
+                        help='comma separated months, e.g. 6,7,8')
+    parser.add_argument('--years', type=parse_int_list, required=True,
+                        help='comma separated years, e.g. 2019,2020')
+    parser.add_argument('--orbits', type=parse_int_list, default=None,
+                        help='comma separated relative orbits, every orbit that '
+                             'intersects an AOI by default')
+    parser.add_argument('--max-cc', type=float, default=0.5,
+                        help='maximum cloud cover (0-1 scale), default 0.5')
+    parser.add_argument('--id-field', default=None,
+                        help='attribute that names each AOI, <layer>_<fid> by default')
+    parser.add_argument('--bands', type=lambda text: text.split(','), default=list(DEFAULT_BANDS),
+                        help=f'comma separated output bands, default {",".join(DEFAULT_BANDS)}')
+    parser.add_argument('--exclude-scl', type=parse_int_list, default=list(INVALID_SCL_CLASSES),
+                        help='comma separated SCL classes treated as cloudy, default '
+                             f'{",".join(str(scl) for scl in INVALID_SCL_CLASSES)}')
+    parser.add_argument('--reducer', choices=list(REDUCERS), default='median',
+                        help='how the valid samples of a pixel are reduced, default median')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f'concurrent AOIs of the threads engine, default {DEFAULT_MAX_WORKERS}')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help='threads orders every AOI on a thread pool, async multiplexes '
+                             'all of them on one event loop (needs aiohttp), default threads')
+    parser.add_argument('--connections', type=int,
+                        default=async_orders.DEFAULT_MAX_CONNECTIONS,
+                        help='concurrent HTTP requests of the async engine, default '
+                             f'{async_orders.DEFAULT_MAX_CONNECTIONS}')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not use the local scene catalog and response cache')
+    args = parser.parse_args(argv)
+
+    assert 0 <= args.max_cc <= 1, 'max-cc must be between 0 and 1'
+
+    config = SHConfig()
+    if args.no_cache:
+        catalog, cache = None, None
+    else:
+        catalog, cache = SceneCatalog(fetcher=WfsFetcher(config)), ResponseCache()
+
+    aois = read_aois(args.aois, id_field=args.id_field)
+    print(f'ordering previews for {len(aois)} AOIs')
+
+    def progress(row):
+        print(f"{row['aoi']}: {row['status']} {row['error']}".rstrip())
+
+    evalscript_options = {
+        'bands': args.bands, 'exclude_scl': args.exclude_scl, 'reducer': args.reducer}
+    if args.engine == 'async':
+        rows = run_batch_async(
+            aois, args.orbits, args.months, args.years, args.max_cc, config,
+            args.output_folder, cache=cache, max_connections=args.connections,
+            progress=progress, evalscript_options=evalscript_options)
+    else:
+        rows = run_batch(
+            aois, args.orbits, args.months, args.years, args.max_cc, config,
+            args.output_folder, catalog=catalog, cache=cache, max_workers=args.workers,
+            progress=progress, evalscript_options=evalscript_options)
+    summary_file = write_summary(os.path.join(args.output_folder, 'summary.csv'), rows)
+
+    n_failed = sum(row['status'] != 'ok' for row in rows)
+    print(f'{len(rows) - n_failed} of {len(rows)} previews ordered, summary written to {summary_file}')
+
+    return 1 if n_failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import numpy as np
+
+# band order of the preview evalscript input, also the band axis order of the
+# stacks composited here
+PREVIEW_BANDS = ('B08', 'B03', 'B02', 'SCL')
+
+# scene classification classes the preview evalscript's validate() rejects
+INVALID_SCL_CLASSES = (
+    1,  # SC_SATURATED_DEFECTIVE
+    3,  # SC_CLOUD_SHADOW
+    8,  # SC_CLOUD_MEDIUM_PROBA
+    9,  # SC_CLOUD_HIGH_PROBA
+    10,  # SC_THIN_CIRRUS
+    11,  # SC_SNOW_ICE
+)
+
+# rows composited at once, bounds the size of the sorted temporary arrays
+DEFAULT_CHUNK_ROWS = 256
+
+# share of the pixels a year set must give enough valid samples, so a few
+# permanently cloudy, water or no data pixels don't rule out every year set
+DEFAULT_COVERAGE = 0.99
+
+
+def masked_upper_median(values, mask):
+    '''
+    Median along the first (time) axis of the samples where mask is True,
+    picked the same way as the evalscript's median reducer: the value at index
+    floor(n / 2) of the sorted samples, so the upper of the two middle values
+    when n is even. Pixels without samples are 0.
+
+    * values is a (time, y, x) array
+    * mask is a boolean (time, y, x) array of the samples to include
+    '''
+    # excluded samples sort to the end
+    filled = np.where(mask, values.astype(np.float32), np.inf)
+    filled.sort(axis=0)
+
+    n = mask.sum(axis=0)
+    index = np.minimum(n // 2, values.shape[0] - 1)
+    median = np.take_along_axis(filled, index[np.newaxis], axis=0)[0]
+
+    return np.where(n > 0, median, 0)
+
+
+def composite_median(b08, b03, b02, scl, invalid_scl=INVALID_SCL_CLASSES,
+                     chunk_rows=DEFAULT_CHUNK_ROWS):
+    '''
+    Reproduce the preview evalscript's cloud-free median composite locally.
+
+    Samples with a zero B02, B03 or B08 value are ignored. Each pixel is the
+    per-band median of its valid samples (SCL not in invalid_scl), or of its
+    invalid samples if it has no valid ones, or 0 if it has neither.
+
+    * b08, b03, b02 and scl are (time, y, x) arrays of one AOI
+    * invalid_scl is a sequence of SCL classes treated as cloudy
+    * chunk_rows is the number of rows composited at once
+
+    Returns a (3, y, x) uint16 array of the NIR, green and blue medians
+    '''
+    n_times, height, width = scl.shape
+    assert n_times > 0, 'At least one scene is needed to build a composite.'
+
+    composite = np.zeros((3, height, width), dtype=np.uint16)
+    for row in range(0, height, chunk_rows):
+        rows = slice(row, row + chunk_rows)
+        bands = [b08[:, rows], b03[:, rows], b02[:, rows]]
+
+        has_data = (bands[0] > 0) & (bands[1] > 0) & (bands[2] > 0)
+        is_valid = has_data & ~np.isin(scl[:, rows], invalid_scl)
+        is_invalid = has_data & ~is_valid
+
+        # fall back to the cloudy samples where there are no clear ones
+        use_valid = is_valid.any(axis=0)
+        mask = np.where(use_valid, is_valid, is_invalid)
+
+        for i, band in enumerate(bands):
+            composite[i, rows] = masked_upper_median(band, mask)
+
+    return composite
+
+
+def composite_stack(stack, invalid_scl=INVALID_SCL_CLASSES, chunk_rows=DEFAULT_CHUNK_ROWS):
+    '''
+    Composite a (time, band, y, x) stack with bands ordered as PREVIEW_BANDS,
+    see composite_median
+    '''
+    return composite_median(
+        stack[:, 0], stack[:, 1], stack[:, 2], stack[:, 3],
+        invalid_scl=invalid_scl, chunk_rows=chunk_rows)
+
+
+def cumulative_year_counts(stack, dates, years, invalid_scl=INVALID_SCL_CLASSES,
+                           chunk_rows=DEFAULT_CHUNK_ROWS):
+    '''
+    Count the valid samples of every pixel of a (time, band, y, x) stack
+    (bands ordered as PREVIEW_BANDS) for cumulative sets of years, the same
+    way the evalscript's validate() accepts them: every band has data and the
+    SCL class is not in invalid_scl.
+
+    * dates are the yyyy-mm-dd acquisition dates of the stack's time axis
+    * years are the years to count, samples of other years are ignored
+
+    Returns a (len(years), y, x) uint16 array where band i counts the valid
+    samples of the i + 1 most recent years, e.g. 2021, then 2021 and 2020...
+    '''
+    recent_years = sorted(set(years), reverse=True)
+    sample_years = np.array([int(date[:4]) for date in dates])
+    height, width = stack.shape[2:]
+
+    counts = np.zeros((len(recent_years), height, width), dtype=np.uint16)
+    for row in range(0, height, chunk_rows):
+        rows = slice(row, row + chunk_rows)
+        chunk = stack[:, :, rows]
+        has_data = (chunk[:, 0] > 0) & (chunk[:, 1] > 0) & (chunk[:, 2] > 0)
+        is_valid = has_data & ~np.isin(chunk[:, 3], invalid_scl)
+
+        total = 0
+        for i, year in enumerate(recent_years):
+            total = total + is_valid[sample_years == year].sum(axis=0)
+            counts[i, rows] = total
+
+    return counts
+
+
+def year_set_coverage(counts, threshold):
+    '''
+    Fraction of the pixels with at least threshold valid samples, per band of
+    cumulative_year_counts
+    '''
+    return (counts >= threshold).reshape(len(counts), -1).mean(axis=1)
+
+
+def minimal_year_set(counts, years, threshold, coverage=DEFAULT_COVERAGE):
+    '''
+    Smallest set of the most recent years whose cumulative valid sample count
+    (see cumulative_year_counts) reaches threshold on at least a coverage
+    fraction of the pixels, as a sorted list of years, or None when even all
+    of the years fall short
+    '''
+    assert 0 < coverage <= 1, 'coverage must be a fraction of the pixels between 0 and 1'
+    recent_years = sorted(set(years), reverse=True)
+    for i, year_set_share in enumerate(year_set_coverage(counts, threshold)):
+        if year_set_share >= coverage:
+            return sorted(recent_years[:i + 1])
+
+    return None
@@ -0,0 +1,108 @@
+import datetime as dt
+
+from sentinelhub import get_image_dimension
+
+from .date_index import DateIndex
+from .orbit_footprints import suggest_orbits
+from .sentinel_utils import selection_intervals
+from .tiled_mosaic import split_bbox
+
+# one processing unit is a 512 x 512 pixel output of 3 input bands and one
+# data sample, smaller outputs are billed at least 1% of that
+PU_PIXELS = 512 * 512
+PU_BANDS = 3
+MIN_PU_AREA = 0.01
+
+# input bands of the default preview evalscript: B08, B03, B02 and SCL
+PREVIEW_BANDS = 4
+
+# Sentinel 2A and 2B together pass over each relative orbit every 5 days
+REVISIT_DAYS = 5
+
+
+def processing_units(width, height, n_samples, n_bands=PREVIEW_BANDS):
+    '''
+    Approximate Sentinel Hub processing units of one process API request with
+    an output of width x height pixels that reads n_bands bands from
+    n_samples acquisitions (dates of an ORBIT mosaicking evalscript)
+    '''
+    area = max(width * height / PU_PIXELS, MIN_PU_AREA)
+    return area * n_bands / PU_BANDS * max(n_samples, 1)
+
+
+def span_days(start_date, end_date):
+    '''
+    Number of days of an inclusive yyyy-mm-dd date span
+    '''
+    return (dt.date.fromisoformat(end_date) - dt.date.fromisoformat(start_date)).days + 1
+
+
+def estimate_preview_cost(bbox, orbits, months, years, max_cc, catalog=None, resolution=None):
+    '''
+    Estimate the number of dates, scenes and tiles and the processing units of
+    a default mosaic preview before ordering it, without any network request.
+
+    Dates and scenes come from the scene catalog cache where it covers the
+    selection. Selected months that are not cached are predicted from the
+    orbit footprints: every relative orbit that covers the bounding box is
+    assumed to contribute one date per revisit, before cloud filtering.
+
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * orbits is a list of relative orbit numbers
+    * months and years are lists of integer months (1-12) and years
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * catalog is an optional scene_catalog.SceneCatalog
+    * resolution is the target pixel size in meters of a tiled preview, or
+      None for a single 512 pixel wide image
+
+    Returns a dict with the number of dates (cached and predicted), scenes,
+    tiles and requests and the processing units
+    '''
+    intervals = selection_intervals(months, years)
+    if catalog is None:
+        scenes, missing = [], intervals
+    else:
+        scenes, missing = catalog.get_cached_interval_scenes(bbox, intervals, max_cc)
+
+    # cached scenes are limited to the selected months already
+    scenes = [scene for scene in scenes if scene['relative_orbit'] in orbits]
+    dates = DateIndex(scenes).dates
+    tiles = {scene['tile'] for scene in scenes}
+    n_scenes = len(scenes)
+
+    covering_orbits = {orbit for orbit, _ in suggest_orbits(bbox)} & set(orbits)
+    n_missing_days = sum(span_days(start, end) for start, end in missing)
+    predicted_dates = round(n_missing_days * len(covering_orbits) / REVISIT_DAYS)
+    n_scenes += predicted_dates * max(len(tiles), 1)
+
+    if resolution is None:
+        sizes = [(512, get_image_dimension(bbox=bbox, width=512))]
+    else:
+        sizes = [tile_size for _, tile_size in split_bbox(bbox, resolution)]
+    n_dates = len(dates) + predicted_dates
+
+    return {
+        'dates': n_dates,
+        'predicted_dates': predicted_dates,
+        'scenes': n_scenes,
+        'tiles': len(tiles),
+        'requests': len(sizes),
+        'processing_units': sum(
+            processing_units(width, height, n_dates) for width, height in sizes)
+    }
+
+
+def format_cost_estimate(estimate):
+    '''
+    One line summary of estimate_preview_cost for the dock widget
+    '''
+    text = f"~{estimate['processing_units']:.1f} PU: {estimate['dates']} dates, " \
+           f"{estimate['scenes']} scenes"
+    if estimate['tiles'] > 0:
+        text += f" on {estimate['tiles']} tiles"
+    if estimate['requests'] > 1:
+        text += f", {estimate['requests']} requests"
+    if estimate['predicted_dates'] > 0:
+        text += f" ({estimate['predicted_dates']} dates predicted, not cached)"
+
+    return text
@@ -0,0 +1,81 @@
+import calendar
+
+from bisect import bisect_left, bisect_right
+
+
+class DateIndex:
+    '''
+    Acquisition dates of a list of scene records (see sentinel_utils.parse_scene)
+    deduplicated into a sorted array, with the tiles and relative orbits seen
+    on every date. Dates are yyyy-mm-dd strings, which sort chronologically,
+    so date range and month queries are binary searches.
+
+    * dates is the sorted list of unique acquisition dates
+    * tiles maps every date to the sorted list of its tiles
+    * orbits maps every date to the sorted list of its relative orbits
+    '''
+
+    def __init__(self, scenes):
+        tiles = {}
+        orbits = {}
+        orbit_dates = {}
+        for scene in scenes:
+            date = scene['date']
+            tiles.setdefault(date, set()).add(scene['tile'])
+            orbits.setdefault(date, set()).add(scene['relative_orbit'])
+            orbit_dates.setdefault(scene['relative_orbit'], set()).add(date)
+
+        self.dates = sorted(tiles)
+        self.tiles = {date: sorted(tiles[date]) for date in self.dates}
+        self.orbits = {date: sorted(orbits[date]) for date in self.dates}
+        self._orbit_dates = orbit_dates
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _orbit_date_set(self, orbits):
+        if type(orbits) is int:
+            orbits = [orbits]
+        allowed = set()
+        for orbit in orbits:
+            allowed |= self._orbit_dates.get(orbit, set())
+        return allowed
+
+    def _slice(self, start_date, end_date):
+        return self.dates[bisect_left(self.dates, start_date):bisect_right(self.dates, end_date)]
+
+    def orbit_dates(self, orbits):
+        '''
+        Sorted dates with a scene on any of a list of relative orbits
+        '''
+        allowed = self._orbit_date_set(orbits)
+        return [date for date in self.dates if date in allowed]
+
+    def range_dates(self, start_date, end_date, orbits=None):
+        '''
+        Sorted dates between two inclusive yyyy-mm-dd dates, optionally only
+        the ones with a scene on a list of relative orbits
+        '''
+        dates = self._slice(start_date, end_date)
+        if orbits is None:
+            return dates
+        allowed = self._orbit_date_set(orbits)
+        return [date for date in dates if date in allowed]
+
+    def month_dates(self, months, years, orbits=None):
+        '''
+        Sorted dates in any of a list of months (1-12) of any of a list of
+        years, optionally only the ones with a scene on a list of relative
+        orbits
+        '''
+        dates = []
+        for year in sorted(set(years)):
+            for month in sorted(set(months)):
+                last_day = calendar.monthrange(year, month)[1]
+                dates += self._slice(
+                    f'{year:04d}-{month:02d}-01', f'{year:04d}-{month:02d}-{last_day:02d}')
+
+        if orbits is None:
+            return dates
+        allowed = self._orbit_date_set(orbits)
+        return [date for date in dates if date in allowed]
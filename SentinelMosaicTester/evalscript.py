@@ -0,0 +1,452 @@
+import functools
+
+from .compositor import INVALID_SCL_CLASSES
+
+# output bands of the default preview: false color near infrared, green, blue
+DEFAULT_BANDS = ('B08', 'B03', 'B02')
+
+# Sentinel 2 L2A scene classification classes
+SCL_CLASS_NAMES = {
+    0: 'SC_NODATA',
+    1: 'SC_SATURATED_DEFECTIVE',
+    2: 'SC_DARK_FEATURE_SHADOW',
+    3: 'SC_CLOUD_SHADOW',
+    4: 'SC_VEGETATION',
+    5: 'SC_NOT_VEGETATED',
+    6: 'SC_WATER',
+    7: 'SC_CLOUD_LOW_PROBA',
+    8: 'SC_CLOUD_MEDIUM_PROBA',
+    9: 'SC_CLOUD_HIGH_PROBA',
+    10: 'SC_THIN_CIRRUS',
+    11: 'SC_SNOW_ICE',
+}
+
+# reducers pick the k-th smallest of a pixel's samples, k given as a JS
+# expression of the number of samples n
+REDUCERS = {
+    'median': 'Math.floor(n / 2)',
+    'first_quartile': 'Math.floor(n / 4)',
+    'third_quartile': 'Math.floor(3 * n / 4)',
+    'min': '0',
+    'max': 'n - 1',
+}
+
+SAMPLE_TYPES = ('UINT8', 'UINT16', 'FLOAT32')
+
+# per-pixel statistics of the samples besides the REDUCERS, with their output
+# sample type and JS expression
+COUNT_STATISTICS = {
+    # number of valid (cloud-free) samples
+    'valid_count': ('UINT16', 'nValid'),
+    # proportion of the samples with data that are invalid (cloudy)
+    'invalid_fraction': ('FLOAT32', 'nInvalid / (nValid + nInvalid)'),
+}
+
+# statistics of a default preview ordered with statistics, one response each
+DEFAULT_STATISTICS = ('median', 'first_quartile', 'valid_count', 'invalid_fraction')
+
+OUTPUT_TEMPLATE = """    {
+        id: "%(id)s",
+        bands: %(n_bands)d,
+        sampleType: SampleType.%(sample_type)s
+    }"""
+
+INPUT_TEMPLATE = """{
+%(datasource)s    bands: [%(input_bands)s],
+    units: "DN"
+    }"""
+
+SETUP_TEMPLATE = """
+//VERSION=3
+// based on this evalscript:
+// https://github.com/sentinel-hub/custom-scripts/blob/master/sentinel-2/cloudless_mosaic/L2A-first_quartile_4bands.js
+function setup() {
+return {
+    input: [%(inputs)s],
+    output: [
+%(outputs)s
+    ],
+    mosaicking: "ORBIT"
+};
+}
+"""
+
+FILTER_SCENES = """// acceptable images are ones collected on specified dates
+function filterScenes(availableScenes, inputMetadata) {
+var allowedDates = [%s]; // format with python
+return availableScenes.filter(function (scene) {
+    var sceneDateStr = scene.date.toISOString().split("T")[0]; //converting date and time to string and rounding to day precision
+    return allowedDates.includes(sceneDateStr);
+});
+}
+"""
+
+# with several inputs (one per cluster of dates) the request is a data fusion
+# request: every input's scenes are filtered and its samples arrive under its
+# id, they are concatenated into one stack in input order
+INPUTS_DECLARATION = """// one process API input per cluster of dates
+var INPUTS = [%s];
+"""
+
+PRE_PROCESS_SCENES = """// acceptable images are ones collected on specified dates
+function preProcessScenes(collections) {
+var allowedDates = [%s]; // format with python
+for (var d = 0; d < INPUTS.length; d++) {
+    var scenes = collections[INPUTS[d]].scenes;
+    scenes.orbits = scenes.orbits.filter(function (orbit) {
+    return allowedDates.includes(orbit.dateFrom.split("T")[0]);
+    });
+}
+return collections;
+}
+"""
+
+FUSION_EVALUATE_PIXEL = """// the samples%(and_scenes)s of every input as one stack
+function evaluatePixel(samples, scenes) {
+var stack = [];%(declare_orbits)s
+for (var d = 0; d < INPUTS.length; d++) {
+    stack = stack.concat(samples[INPUTS[d]]);%(concat_orbits)s
+}
+return evaluateStack(stack%(stack_scenes)s);
+}
+"""
+
+SELECT_FUNCTION = """// sample buffers reused by every pixel, grown to the longest stack
+var buffers = [];
+var capacity = 0;
+function reserve(n) {
+if (n > capacity) {
+    capacity = n;
+    for (var b = 0; b < %(n_bands)d; b++) {
+    buffers[b] = new Float32Array(n);
+    }
+}
+}
+// k-th smallest of the first n values: quickselect with a median of three
+// pivot, finished by an insertion sort once a partition is small. Reorders
+// the values in place.
+function select(values, n, k) {
+var left = 0;
+var right = n - 1;
+while (right - left > 16) {
+    var x = values[left];
+    var y = values[(left + right) >> 1];
+    var z = values[right];
+    var pivot = x < y ? (y < z ? y : (x < z ? z : x)) : (x < z ? x : (y < z ? z : y));
+    var i = left;
+    var j = right;
+    while (i <= j) {
+    while (values[i] < pivot) {
+        i++;
+    }
+    while (values[j] > pivot) {
+        j--;
+    }
+    if (i <= j) {
+        var swap = values[i];
+        values[i] = values[j];
+        values[j] = swap;
+        i++;
+        j--;
+    }
+    }
+    if (k <= j) {
+    right = j;
+    } else if (k >= i) {
+    left = i;
+    } else {
+    return values[k];
+    }
+}
+for (var a = left + 1; a <= right; a++) {
+    var value = values[a];
+    var b = a - 1;
+    while (b >= left && values[b] > value) {
+    values[b + 1] = values[b];
+    b--;
+    }
+    values[b + 1] = value;
+}
+return values[k];
+}
+"""
+
+EVALUATE_PIXEL_TEMPLATE = """// %(reducer)s of the valid samples of every band, or of the invalid ones when
+// a pixel has no valid samples
+function %(function_name)s(samples, scenes) {
+reserve(samples.length);
+var n = 0;
+var nInvalid = 0;
+for (var i = 0; i < samples.length; i++) {
+    var sample = samples[i];
+    if (%(nonzero)s) {
+    if (validate(sample)) {
+%(store)s
+        n++;
+    } else {
+        nInvalid++;
+    }
+    }
+}
+var nValid = n;
+if (n === 0 && nInvalid > 0) {
+    // no valid samples, every sample with data is an invalid one
+    for (var i = 0; i < samples.length; i++) {
+    var sample = samples[i];
+    if (%(nonzero)s) {
+%(store)s
+        n++;
+    }
+    }
+}
+if (n === 0) {
+    return {
+%(empty)s
+    };
+}
+%(result)s
+}
+"""
+
+
+YEAR_COUNTS_EVALUATE_PIXEL = """// valid samples of every pixel counted per year, most recent year first, and
+// accumulated: band i counts the samples of YEARS[0] to YEARS[i]
+var YEARS = [%(years)s];
+function %(function_name)s(samples, scenes) {
+var counts = new Array(YEARS.length).fill(0);
+for (var i = 0; i < samples.length; i++) {
+    var sample = samples[i];
+    if (%(nonzero)s && validate(sample)) {
+    // ORBIT mosaicking passes the acquisition time as an ISO string
+    var year = new Date(scenes.orbits[i].dateFrom).getUTCFullYear();
+    var y = YEARS.indexOf(year);
+    if (y >= 0) {
+        counts[y]++;
+    }
+    }
+}
+for (var y = 1; y < counts.length; y++) {
+    counts[y] += counts[y - 1];
+}
+return {
+    year_counts: counts
+};
+}
+"""
+
+
+def validate_function(exclude_scl):
+    '''
+    JS validate function that rejects samples whose SCL class is in
+    exclude_scl, with a lookup table instead of a chain of comparisons
+    '''
+    excluded = [int(scl_class in exclude_scl) for scl_class in sorted(SCL_CLASS_NAMES)]
+    names = ', '.join(SCL_CLASS_NAMES[scl_class] for scl_class in exclude_scl)
+    return (
+        f'// 1 for the SCL classes treated as invalid: {names}\n'
+        f'var EXCLUDED_SCL = [{", ".join(map(str, excluded))}];\n'
+        'function validate(samples) {\n'
+        'return EXCLUDED_SCL[samples.SCL] !== 1;\n'
+        '}\n'
+    )
+
+
+def output_block(output_id, n_bands, sample_type):
+    '''
+    One output of the setup function
+    '''
+    return OUTPUT_TEMPLATE % {'id': output_id, 'n_bands': n_bands, 'sample_type': sample_type}
+
+
+def input_ids(inputs):
+    '''
+    Ids of the process API inputs of a data fusion request of several inputs,
+    see sentinel_utils.get_preview_request
+    '''
+    return [f'l2a_{i}' for i in range(inputs)]
+
+
+def input_parts(bands, inputs, with_scenes=False):
+    '''
+    The setup inputs, the scene filter and the evaluatePixel wrapper of a
+    script with one input, or several inputs concatenated into one stack for
+    evaluateStack. The filter's list of allowed dates is left as a %s
+    placeholder. with_scenes passes the ORBIT scenes on to evaluateStack.
+    '''
+    input_bands = ', '.join(f'"{band}"' for band in (*bands, 'SCL'))
+    if inputs == 1:
+        setup_inputs = INPUT_TEMPLATE % {'datasource': '', 'input_bands': input_bands}
+        return setup_inputs, FILTER_SCENES, 'evaluatePixel', ''
+
+    ids = input_ids(inputs)
+    setup_inputs = ', '.join(
+        INPUT_TEMPLATE % {'datasource': f'    datasource: "{input_id}",\n', 'input_bands': input_bands}
+        for input_id in ids)
+    scene_filter = INPUTS_DECLARATION % ', '.join(f'"{input_id}"' for input_id in ids) + \
+        PRE_PROCESS_SCENES
+    wrapper = FUSION_EVALUATE_PIXEL % {
+        'and_scenes': ' and scenes' if with_scenes else '',
+        'declare_orbits': '\nvar orbits = [];' if with_scenes else '',
+        'concat_orbits': '\n    orbits = orbits.concat(scenes[INPUTS[d]].orbits);' if with_scenes else '',
+        'stack_scenes': ', {orbits: orbits}' if with_scenes else '',
+    }
+    return setup_inputs, scene_filter, 'evaluateStack', wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def compile_evalscript(bands, exclude_scl, reducer, sample_type, statistics=None, inputs=1):
+    '''
+    Compose an evalscript template from setup, the scene filter, validate,
+    the reducer and evaluatePixel. The list of allowed dates is left as a %s
+    placeholder. Templates are cached per parameter combination, see
+    build_evalscript for the parameters (bands, exclude_scl and statistics as
+    tuples).
+    '''
+    band_values = [f'sample.{band}' for band in bands]
+
+    def reduced(index):
+        return ', '.join(f'select(buffers[{i}], n, {index})' for i in range(len(bands)))
+
+    if statistics is None:
+        outputs = [output_block('default', len(bands), sample_type)]
+        empty = f'    default: [{", ".join("0" for _ in bands)}]'
+        result = f'var k = {REDUCERS[reducer]};\nreturn {{\n    default: [{reduced("k")}]\n}};'
+        description = reducer
+    else:
+        outputs, empty_values, values = [], [], []
+        for statistic in statistics:
+            if statistic in REDUCERS:
+                outputs.append(output_block(statistic, len(bands), sample_type))
+                empty_values.append(f'    {statistic}: [{", ".join("0" for _ in bands)}]')
+                values.append(f'    {statistic}: [{reduced(REDUCERS[statistic])}]')
+            else:
+                statistic_type, expression = COUNT_STATISTICS[statistic]
+                outputs.append(output_block(statistic, 1, statistic_type))
+                empty_values.append(f'    {statistic}: [0]')
+                values.append(f'    {statistic}: [{expression}]')
+        empty = ',\n'.join(empty_values)
+        result = 'return {\n' + ',\n'.join(values) + '\n};'
+        description = f'statistics ({", ".join(statistics)})'
+
+    setup_inputs, scene_filter, function_name, wrapper = input_parts(bands, inputs)
+    parts = [
+        SETUP_TEMPLATE % {
+            'inputs': setup_inputs,
+            'outputs': ',\n'.join(outputs),
+        },
+        scene_filter,
+        validate_function(exclude_scl),
+        SELECT_FUNCTION % {'n_bands': len(bands)},
+        EVALUATE_PIXEL_TEMPLATE % {
+            'function_name': function_name,
+            'reducer': description,
+            'nonzero': ' && '.join(f'{value} > 0' for value in band_values),
+            'store': '\n'.join(
+                f'        buffers[{i}][n] = {value};' for i, value in enumerate(band_values)),
+            'empty': empty,
+            'result': result,
+        },
+        wrapper,
+    ]
+
+    return ''.join(parts)
+
+
+def build_evalscript(dates, bands=DEFAULT_BANDS, exclude_scl=INVALID_SCL_CLASSES,
+                     reducer='median', sample_type='UINT16', statistics=None, inputs=1):
+    '''
+    Build an ORBIT mosaicking evalscript that composites the samples of a
+    list of acquisition dates pixel by pixel.
+
+    * dates is a list of yyyy-mm-dd dates, scenes on other dates are dropped
+    * bands are the bands to reduce, also the output band order
+    * exclude_scl are the SCL classes treated as invalid (cloudy) samples
+    * reducer is one of REDUCERS
+    * sample_type is the output sample type, one of SAMPLE_TYPES
+    * statistics is an optional list of REDUCERS and COUNT_STATISTICS names,
+      e.g. DEFAULT_STATISTICS. The script then returns one response per
+      statistic, named after it, instead of a single "default" response of
+      the reducer.
+    * inputs is the number of process API inputs the dates are ordered in,
+      one per cluster of dates (see sentinel_utils.get_dates_intervals)
+
+    Identical parameters return identical scripts, so they share response
+    cache entries.
+    '''
+    assert reducer in REDUCERS, f'reducer must be one of {", ".join(REDUCERS)}'
+    assert sample_type in SAMPLE_TYPES, f'sample_type must be one of {", ".join(SAMPLE_TYPES)}'
+    assert len(bands) > 0 and 'SCL' not in bands, 'bands must be a list of spectral bands'
+    assert set(exclude_scl) <= set(SCL_CLASS_NAMES), \
+        f'exclude_scl must be SCL classes between 0 and {max(SCL_CLASS_NAMES)}'
+    if statistics is not None:
+        unknown = [
+            statistic for statistic in statistics
+            if statistic not in REDUCERS and statistic not in COUNT_STATISTICS
+        ]
+        assert len(unknown) == 0, f'Unknown statistics: {unknown}'
+        assert len(set(statistics)) == len(statistics) > 0, \
+            'statistics must be a list of distinct statistics'
+        statistics = tuple(statistics)
+
+    assert inputs > 0, 'At least one input is needed.'
+
+    template = compile_evalscript(
+        tuple(bands), tuple(sorted(set(exclude_scl))), reducer, sample_type, statistics, inputs)
+    date_string = ', '.join([f'"{date}"' for date in dates])
+
+    return template % date_string
+
+
+@functools.lru_cache(maxsize=None)
+def compile_year_counts_evalscript(years, exclude_scl, inputs=1):
+    '''
+    Compose a year count evalscript template, the list of allowed dates is
+    left as a %s placeholder. See build_year_counts_evalscript for the
+    parameters (years most recent first and exclude_scl as tuples).
+    '''
+    band_values = [f'sample.{band}' for band in DEFAULT_BANDS]
+    year_list = ', '.join(map(str, years))
+    setup_inputs, scene_filter, function_name, wrapper = input_parts(
+        DEFAULT_BANDS, inputs, with_scenes=True)
+    parts = [
+        SETUP_TEMPLATE % {
+            'inputs': setup_inputs,
+            'outputs': output_block('year_counts', len(years), 'UINT16'),
+        },
+        scene_filter,
+        validate_function(exclude_scl),
+        YEAR_COUNTS_EVALUATE_PIXEL % {
+            'function_name': function_name,
+            'n_years': len(years),
+            'years': year_list,
+            'nonzero': ' && '.join(f'{value} > 0' for value in band_values),
+        },
+        wrapper,
+    ]
+
+    return ''.join(parts)
+
+
+def build_year_counts_evalscript(dates, years, exclude_scl=INVALID_SCL_CLASSES, inputs=1):
+    '''
+    Build an ORBIT mosaicking evalscript that counts the valid samples of every
+    pixel for cumulative sets of years, with the preview's validate() rules.
+    The single "year_counts" UINT16 response has one band per year: band i
+    counts the samples of the i + 1 most recent years, the same layout as
+    compositor.cumulative_year_counts computes from a band cube.
+
+    * dates is a list of yyyy-mm-dd dates, scenes on other dates are dropped
+    * years are the years to count, samples of other years are ignored
+    * exclude_scl are the SCL classes treated as invalid (cloudy) samples
+    * inputs is the number of process API inputs, see build_evalscript
+    '''
+    assert len(years) > 0, 'At least one year is needed to count observations.'
+    assert set(exclude_scl) <= set(SCL_CLASS_NAMES), \
+        f'exclude_scl must be SCL classes between 0 and {max(SCL_CLASS_NAMES)}'
+    assert inputs > 0, 'At least one input is needed.'
+
+    template = compile_year_counts_evalscript(
+        tuple(sorted(set(years), reverse=True)), tuple(sorted(set(exclude_scl))), inputs)
+    date_string = ', '.join([f'"{date}"' for date in dates])
+
+    return template % date_string
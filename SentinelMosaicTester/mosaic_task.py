@@ -0,0 +1,582 @@
+import datetime as dt
+import hashlib
+import os
+
+from qgis.core import Qgis, QgsMessageLog, QgsProject, QgsRasterLayer, QgsTask
+
+from .band_cube import BandCube, cube_folder, read_geotiff, write_geotiff
+from .compositor import DEFAULT_COVERAGE, minimal_year_set, year_set_coverage
+from .evalscript import build_year_counts_evalscript
+from .preview_sweep import DEFAULT_MAX_WORKERS, run_sweep, sweep_layer_name
+from .sentinel_utils import download_preview, extract_outputs, get_preview_dates, \
+    get_preview_evalscript, get_preview_request, get_year_span, query_scenes
+from .tiled_mosaic import download_tiled_preview, get_tiled_preview_requests
+from .tracing import trace_span, write_trace
+
+
+def report_trace(tracer, name):
+    '''
+    Write the Chrome trace of an order to tracing.DEFAULT_TRACE_FOLDER, which
+    keeps the most recent traces only, and log its per-stage timings
+    '''
+    if tracer is None:
+        return
+
+    trace_file = write_trace(tracer)
+    QgsMessageLog.logMessage(
+        f'{name} timings:\n{tracer.summary_text()}\ntrace: {trace_file}',
+        level=Qgis.Info
+        )
+
+
+class MosaicPreviewTask(QgsTask):
+    '''
+    Background task that orders a mosaic preview from Sentinel Hub and adds
+    the resulting raster to QGIS once it has downloaded.
+
+    The catalog query, evalscript build and download run on a worker thread
+    so the map canvas stays responsive. Only finished() touches the QGIS
+    interface because it is called back on the main thread.
+
+    * iface is the QgsInterface the layer is added to
+    * layer_name is the name of the raster layer added to QGIS
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * evalscript and time_interval order a custom evalscript as is, otherwise
+      the default preview evalscript is built from orbits, months and years
+    * catalog is an optional scene_catalog.SceneCatalog for the date query
+    * resolution is an optional pixel size in meters, the bounding box is then
+      ordered as a grid of tiles and loaded as a VRT instead of a single 512
+      pixel wide image
+    * cache is an optional response_cache.ResponseCache for the download
+    * tracer is an optional tracing.Tracer, every stage of the order is timed
+      and the trace is written and summarized in the QGIS log when the task
+      finishes, see report_trace
+    * statistics is an optional list of statistics (see
+      evalscript.build_evalscript) of a default 512 pixel preview, ordered in
+      one request and added as one layer each in a group named layer_name
+    '''
+
+    def __init__(self, iface, layer_name, bbox, max_cc, config,
+                 evalscript=None, time_interval=None,
+                 orbits=None, months=None, years=None, catalog=None,
+                 resolution=None, cache=None, tracer=None, statistics=None):
+        super().__init__(f'Mosaic preview: {layer_name}', QgsTask.CanCancel)
+        self.iface = iface
+        self.layer_name = layer_name
+        self.bbox = bbox
+        self.max_cc = max_cc
+        self.config = config
+        self.evalscript = evalscript
+        self.time_interval = time_interval
+        self.orbits = orbits
+        self.months = months
+        self.years = years
+        self.catalog = catalog
+        self.resolution = resolution
+        self.cache = cache
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.name = layer_name
+        self.statistics = statistics
+        assert statistics is None or (evalscript is None and resolution is None), \
+            'Statistics are only ordered for default 512 pixel previews.'
+
+        self.output_file = None
+        self.output_files = None
+        self.exception = None
+
+    def run(self):
+        '''
+        Query dates, build the evalscript and download the preview. Runs on a
+        worker thread, must not touch the GUI.
+        '''
+        try:
+            evalscript, time_interval = self.evalscript, self.time_interval
+            if evalscript is None:
+                QgsMessageLog.logMessage(
+                    f'{self.layer_name}: querying dates for bbox',
+                    level=Qgis.Info
+                    )
+                dates, time_interval = get_preview_dates(
+                    self.bbox,
+                    orbits=self.orbits,
+                    months=self.months,
+                    years=self.years,
+                    max_cc=self.max_cc,
+                    config=self.config,
+                    catalog=self.catalog,
+                    tracer=self.tracer)
+                with trace_span(self.tracer, 'evalscript build', dates=len(dates)):
+                    evalscript = get_preview_evalscript(dates, statistics=self.statistics)
+            self.setProgress(30)
+
+            if self.isCanceled():
+                return False
+
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: requesting preview image',
+                level=Qgis.Info
+                )
+            with trace_span(self.tracer, 'request build'):
+                if self.statistics is not None:
+                    requests = [get_preview_request(
+                        evalscript, self.bbox, time_interval, self.max_cc, self.config,
+                        output_ids=self.statistics)]
+                elif self.resolution is None:
+                    requests = [get_preview_request(
+                        evalscript, self.bbox, time_interval, self.max_cc, self.config)]
+                else:
+                    requests = get_tiled_preview_requests(
+                        evalscript, self.bbox, time_interval, self.max_cc, self.config,
+                        resolution=self.resolution)
+            if self.resolution is not None:
+                QgsMessageLog.logMessage(
+                    f'{self.layer_name}: {len(requests)} tiles at {self.resolution} m',
+                    level=Qgis.Info
+                    )
+            self.setProgress(40)
+
+            if self.isCanceled():
+                return False
+
+            if self.resolution is None:
+                self.output_file = download_preview(
+                    requests[0], cache=self.cache, tracer=self.tracer)
+                if self.statistics is not None:
+                    with trace_span(self.tracer, 'disk write', outputs=len(self.statistics)):
+                        self.output_files = extract_outputs(self.output_file)
+            else:
+                self.output_file = download_tiled_preview(
+                    requests, self.config, cache=self.cache, tracer=self.tracer)
+            self.setProgress(100)
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return not self.isCanceled()
+
+    def finished(self, result):
+        '''
+        Add the downloaded preview to QGIS or report why it failed. Called on
+        the main thread once run() returns.
+        '''
+        if result:
+            with trace_span(self.tracer, 'layer load'):
+                if self.output_files is None:
+                    self.iface.addRasterLayer(self.output_file, self.layer_name)
+                else:
+                    self.add_statistic_layers()
+            report_trace(self.tracer, self.layer_name)
+        elif self.exception is not None:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: {self.exception!r}',
+                level=Qgis.Critical
+                )
+            self.iface.messageBar().pushMessage(
+                'Mosaic preview failed', str(self.exception), level=Qgis.Critical)
+            report_trace(self.tracer, self.layer_name)
+        else:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: canceled',
+                level=Qgis.Info
+                )
+
+    def add_statistic_layers(self):
+        '''
+        Add one layer per statistic to a new layer group
+        '''
+        project = QgsProject.instance()
+        group = project.layerTreeRoot().insertGroup(0, self.layer_name)
+        for statistic, output_file in self.output_files.items():
+            layer = QgsRasterLayer(output_file, statistic)
+            project.addMapLayer(layer, False)
+            group.addLayer(layer)
+
+
+class MosaicSweepTask(QgsTask):
+    '''
+    Background task that orders default mosaic previews for many orbit, month
+    and year combinations of the same bounding box and loads them into a
+    single layer group.
+
+    * iface is the QgsInterface used to report errors
+    * group_name is the name of the layer group the previews are added to
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * configurations is a list of dicts created by
+      preview_sweep.sweep_configurations
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * catalog is an optional scene_catalog.SceneCatalog for the date query
+    * cache is an optional response_cache.ResponseCache for the downloads
+    * max_workers is the number of concurrent process API requests
+    * tracer is an optional tracing.Tracer, see MosaicPreviewTask
+    '''
+
+    def __init__(self, iface, group_name, bbox, configurations, max_cc, config,
+                 catalog=None, cache=None, max_workers=DEFAULT_MAX_WORKERS, tracer=None):
+        super().__init__(f'Mosaic sweep: {group_name}', QgsTask.CanCancel)
+        self.iface = iface
+        self.group_name = group_name
+        self.bbox = bbox
+        self.configurations = configurations
+        self.max_cc = max_cc
+        self.config = config
+        self.catalog = catalog
+        self.cache = cache
+        self.max_workers = max_workers
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.name = group_name
+
+        self.results = []
+        self.exception = None
+
+    def run(self):
+        '''
+        Query the catalog once and download every preview. Runs on a worker
+        thread, must not touch the GUI.
+        '''
+        n_configurations = len(self.configurations)
+        try:
+            self.results = run_sweep(
+                self.bbox,
+                self.configurations,
+                max_cc=self.max_cc,
+                config=self.config,
+                catalog=self.catalog,
+                cache=self.cache,
+                max_workers=self.max_workers,
+                is_canceled=self.isCanceled,
+                progress=lambda n_done: self.setProgress(100 * n_done / n_configurations),
+                tracer=self.tracer)
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return not self.isCanceled()
+
+    def finished(self, result):
+        '''
+        Add the downloaded previews to a new layer group or report why they
+        failed. Called on the main thread once run() returns.
+        '''
+        if self.exception is not None:
+            QgsMessageLog.logMessage(
+                f'{self.group_name}: {self.exception!r}',
+                level=Qgis.Critical
+                )
+            self.iface.messageBar().pushMessage(
+                'Mosaic sweep failed', str(self.exception), level=Qgis.Critical)
+            report_trace(self.tracer, self.group_name)
+            return
+
+        if not result:
+            QgsMessageLog.logMessage(
+                f'{self.group_name}: canceled',
+                level=Qgis.Info
+                )
+            return
+
+        project = QgsProject.instance()
+        with trace_span(self.tracer, 'layer load', layers=len(self.results)):
+            group = project.layerTreeRoot().insertGroup(0, self.group_name)
+            for configuration, output_file, exception in self.results:
+                layer_name = sweep_layer_name(configuration)
+                if output_file is None:
+                    QgsMessageLog.logMessage(
+                        f'{self.group_name}: {layer_name}: {exception!r}',
+                        level=Qgis.Warning
+                        )
+                    continue
+
+                layer = QgsRasterLayer(output_file, layer_name)
+                project.addMapLayer(layer, False)
+                group.addLayer(layer)
+        report_trace(self.tracer, self.group_name)
+
+
+class CubePreviewTask(QgsTask):
+    '''
+    Background task that composites a default mosaic preview locally from the
+    raw band cube of a bounding box and adds it to QGIS.
+
+    The cube is fetched the first time, for every orbit and year the AOI
+    might be previewed with, in requests of a bounded number of scenes, so
+    later month, year and orbit changes are composited from disk without
+    another request.
+
+    * iface is the QgsInterface the layer is added to
+    * layer_name is the name of the raster layer added to QGIS
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * orbits, months and years select the scenes to composite
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * fetch_orbits and fetch_years are the orbits and years fetched into the
+      cube when it has to be (re)fetched
+    * catalog is an optional scene_catalog.SceneCatalog for the date query
+    * tracer is an optional tracing.Tracer, see MosaicPreviewTask
+    '''
+
+    def __init__(self, iface, layer_name, bbox, orbits, months, years, max_cc, config,
+                 fetch_orbits, fetch_years, catalog=None, tracer=None):
+        super().__init__(f'Mosaic preview: {layer_name}', QgsTask.CanCancel)
+        self.iface = iface
+        self.layer_name = layer_name
+        self.bbox = bbox
+        self.orbits = orbits
+        self.months = months
+        self.years = years
+        self.max_cc = max_cc
+        self.config = config
+        self.fetch_orbits = sorted(set(fetch_orbits) | set(orbits))
+        self.fetch_years = sorted(set(fetch_years) | set(years))
+        self.catalog = catalog
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.name = layer_name
+
+        self.output_file = None
+        self.exception = None
+
+    def run(self):
+        '''
+        Fetch the cube if needed and composite the preview. Runs on a worker
+        thread, must not touch the GUI.
+        '''
+        try:
+            start_date, end_date = get_year_span(self.fetch_years)
+            with trace_span(self.tracer, 'catalog query'):
+                if self.catalog is None:
+                    scenes = query_scenes(
+                        self.bbox, start_date, end_date, self.max_cc, self.config,
+                        tracer=self.tracer)
+                else:
+                    scenes = self.catalog.get_scenes(
+                        self.bbox, start_date, end_date, self.max_cc, self.config,
+                        tracer=self.tracer)
+            self.setProgress(10)
+
+            if self.isCanceled():
+                return False
+
+            folder = cube_folder(self.bbox, self.max_cc, size=None)
+            needed = [
+                scene for scene in scenes
+                if scene['relative_orbit'] in self.orbits and
+                dt.date.fromisoformat(scene['date']).month in self.months and
+                dt.date.fromisoformat(scene['date']).year in self.years
+            ]
+            cube = BandCube(folder) if BandCube.exists(folder) else None
+            if cube is None or not cube.covers(needed, self.orbits):
+                QgsMessageLog.logMessage(
+                    f'{self.layer_name}: fetching band cube for orbits {self.fetch_orbits} '
+                    f'and years {self.fetch_years}',
+                    level=Qgis.Info
+                    )
+                cube = BandCube.fetch(
+                    folder,
+                    self.bbox,
+                    [scene for scene in scenes if scene['relative_orbit'] in self.fetch_orbits],
+                    max_cc=self.max_cc,
+                    config=self.config,
+                    orbits=self.fetch_orbits,
+                    progress=lambda fraction: self.setProgress(10 + 60 * fraction),
+                    tracer=self.tracer)
+            self.setProgress(70)
+
+            if self.isCanceled():
+                return False
+
+            with trace_span(self.tracer, 'composite'):
+                composite = cube.composite(self.orbits, self.months, self.years)
+            selection = f'{self.orbits}|{self.months}|{self.years}'
+            with trace_span(self.tracer, 'disk write'):
+                self.output_file = write_geotiff(
+                    os.path.join(
+                        folder, f'composite_{hashlib.md5(selection.encode()).hexdigest()}.tif'),
+                    composite,
+                    self.bbox)
+            self.setProgress(100)
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return not self.isCanceled()
+
+    def finished(self, result):
+        '''
+        Add the composite to QGIS or report why it failed. Called on the main
+        thread once run() returns.
+        '''
+        if result:
+            with trace_span(self.tracer, 'layer load'):
+                self.iface.addRasterLayer(self.output_file, self.layer_name)
+            report_trace(self.tracer, self.layer_name)
+        elif self.exception is not None:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: {self.exception!r}',
+                level=Qgis.Critical
+                )
+            self.iface.messageBar().pushMessage(
+                'Mosaic preview failed', str(self.exception), level=Qgis.Critical)
+            report_trace(self.tracer, self.layer_name)
+        else:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: canceled',
+                level=Qgis.Info
+                )
+
+
+class YearCountTask(QgsTask):
+    '''
+    Background task that counts the valid (cloud-free) observations of every
+    pixel for cumulative sets of years, most recent year first, adds the
+    counts to QGIS as one band per year set and reports the fewest recent
+    years that give (nearly) every pixel at least threshold valid
+    observations.
+
+    The counts are computed locally when a band cube of the bounding box
+    covers the selection, otherwise they are ordered as one process API
+    request instead of a preview per year set.
+
+    * iface is the QgsInterface the layer is added to
+    * layer_name is the name of the raster layer added to QGIS
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * orbits and months select the scenes to count
+    * years are the years to count, the layer's band i counts the i + 1 most
+      recent of them
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * threshold is the number of valid observations every pixel should have
+    * coverage is the share of the pixels that must reach threshold, see
+      compositor.minimal_year_set
+    * catalog is an optional scene_catalog.SceneCatalog for the date query
+    * cache is an optional response_cache.ResponseCache for the download
+    '''
+
+    def __init__(self, iface, layer_name, bbox, orbits, months, years, max_cc, config,
+                 threshold, coverage=DEFAULT_COVERAGE, catalog=None, cache=None):
+        super().__init__(f'Valid observation count: {layer_name}', QgsTask.CanCancel)
+        self.iface = iface
+        self.layer_name = layer_name
+        self.bbox = bbox
+        self.orbits = orbits
+        self.months = months
+        self.years = years
+        self.max_cc = max_cc
+        self.config = config
+        self.threshold = threshold
+        self.coverage = coverage
+        self.catalog = catalog
+        self.cache = cache
+
+        self.output_file = None
+        self.pixel_shares = None
+        self.year_set = None
+        self.exception = None
+
+    def run(self):
+        '''
+        Count the observations from the band cube or order the counts. Runs on
+        a worker thread, must not touch the GUI.
+        '''
+        try:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: querying dates for bbox',
+                level=Qgis.Info
+                )
+            dates, time_intervals = get_preview_dates(
+                self.bbox,
+                orbits=self.orbits,
+                months=self.months,
+                years=self.years,
+                max_cc=self.max_cc,
+                config=self.config,
+                catalog=self.catalog)
+            self.setProgress(20)
+
+            if self.isCanceled():
+                return False
+
+            folder = cube_folder(self.bbox, self.max_cc, size=None)
+            cube = BandCube(folder) if BandCube.exists(folder) else None
+            if cube is not None and cube.covers([{'date': date} for date in dates], self.orbits):
+                QgsMessageLog.logMessage(
+                    f'{self.layer_name}: counting observations in the band cube',
+                    level=Qgis.Info
+                    )
+                counts = cube.year_counts(self.orbits, self.months, self.years)
+                selection = f'{self.orbits}|{self.months}|{self.years}'
+                self.output_file = write_geotiff(
+                    os.path.join(
+                        folder, f'year_counts_{hashlib.md5(selection.encode()).hexdigest()}.tif'),
+                    counts,
+                    self.bbox)
+            else:
+                QgsMessageLog.logMessage(
+                    f'{self.layer_name}: requesting observation counts',
+                    level=Qgis.Info
+                    )
+                request = get_preview_request(
+                    build_year_counts_evalscript(dates, self.years, inputs=len(time_intervals)),
+                    self.bbox, time_intervals, self.max_cc, self.config,
+                    output_ids=('year_counts',))
+                self.output_file = download_preview(request, cache=self.cache)
+                counts = read_geotiff(self.output_file)
+            self.setProgress(90)
+
+            self.pixel_shares = year_set_coverage(counts, self.threshold)
+            self.year_set = minimal_year_set(
+                counts, self.years, self.threshold, coverage=self.coverage)
+            self.setProgress(100)
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return not self.isCanceled()
+
+    def finished(self, result):
+        '''
+        Add the counts to QGIS and report the year set, or report why it
+        failed. Called on the main thread once run() returns.
+        '''
+        if result:
+            self.iface.addRasterLayer(self.output_file, self.layer_name)
+            recent_years = sorted(set(self.years), reverse=True)
+            coverage_lines = [
+                f'band {i + 1} ({recent_years[i]}-{recent_years[0]}): '
+                f'{share:.1%} of pixels with at least {self.threshold} valid observations'
+                for i, share in enumerate(self.pixel_shares)
+            ]
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}:\n' + '\n'.join(coverage_lines),
+                level=Qgis.Info
+                )
+            if self.year_set is None:
+                self.iface.messageBar().pushMessage(
+                    'Valid observation count',
+                    f'only {max(self.pixel_shares):.1%} of pixels reach {self.threshold} valid '
+                    f'observations with every year (target {self.coverage:.0%}), '
+                    f'add months or orbits',
+                    level=Qgis.Warning)
+            else:
+                self.iface.messageBar().pushMessage(
+                    'Valid observation count',
+                    f'years {", ".join(map(str, self.year_set))} give '
+                    f'{self.pixel_shares[len(self.year_set) - 1]:.1%} of pixels at least '
+                    f'{self.threshold} valid observations',
+                    level=Qgis.Success)
+        elif self.exception is not None:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: {self.exception!r}',
+                level=Qgis.Critical
+                )
+            self.iface.messageBar().pushMessage(
+                'Valid observation count failed', str(self.exception), level=Qgis.Critical)
+        else:
+            QgsMessageLog.logMessage(
+                f'{self.layer_name}: canceled',
+                level=Qgis.Info
+                )
@@ -0,0 +1,300 @@
+import functools
+import json
+import os
+import sys
+
+import numpy as np
+
+# nominal footprints of the 143 Sentinel 2 relative orbits, see the README for
+# how this file was created
+ORBITS_GEOJSON = os.path.join(os.path.dirname(__file__), 'sentinel_orbits.geojson')
+
+# the same footprints precompiled by build_footprint_file
+ORBITS_FOOTPRINTS = os.path.join(os.path.dirname(__file__), 'sentinel_orbits.footprints')
+
+# footprint file layout: a fixed header followed by flat arrays, each starting
+# on an 8 byte boundary so they can be viewed straight out of a memory map
+FOOTPRINT_MAGIC = b'S2OF'
+FOOTPRINT_VERSION = 1
+FOOTPRINT_HEADER = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('n_orbits', '<u4'),
+    ('n_polygons', '<u4'),
+    ('n_rings', '<u4'),
+    ('n_points', '<u4'),
+])
+
+
+def footprint_array_specs(header):
+    '''
+    Return the (name, dtype, shape) of each array in a footprint file, in the
+    order they are stored
+    '''
+    n_orbits = int(header['n_orbits'])
+    return [
+        # relative orbit numbers
+        ('orbits', np.dtype('<i4'), (n_orbits,)),
+        # per-orbit min_x, min_y, max_x, max_y
+        ('bounds', np.dtype('<f4'), (n_orbits, 4)),
+        # orbit i owns polygons orbit_offsets[i]:orbit_offsets[i + 1]
+        ('orbit_offsets', np.dtype('<i4'), (n_orbits + 1,)),
+        # polygon j owns rings polygon_offsets[j]:polygon_offsets[j + 1], the
+        # first one is the exterior
+        ('polygon_offsets', np.dtype('<i4'), (int(header['n_polygons']) + 1,)),
+        # ring k owns points ring_offsets[k]:ring_offsets[k + 1]
+        ('ring_offsets', np.dtype('<i4'), (int(header['n_rings']) + 1,)),
+        # lon, lat pairs
+        ('coords', np.dtype('<f4'), (int(header['n_points']), 2)),
+    ]
+
+
+def clip_ring(ring, min_x=-180.0, max_x=180.0):
+    '''
+    Clip a closed ring of (x, y) points to min_x <= x <= max_x and return the
+    clipped closed ring, or None if nothing of the ring (area) is left
+    '''
+    points = [tuple(point[:2]) for point in ring[:-1]]
+    for inside, edge_x in ((lambda x: x >= min_x, min_x), (lambda x: x <= max_x, max_x)):
+        clipped = []
+        for k, (x, y) in enumerate(points):
+            previous_x, previous_y = points[k - 1]
+            if inside(x) != inside(previous_x):
+                # the segment crosses the edge
+                clipped.append((
+                    edge_x,
+                    previous_y + (edge_x - previous_x) * (y - previous_y) / (x - previous_x)
+                ))
+            if inside(x):
+                clipped.append((x, y))
+        points = clipped
+
+    # shoelace formula, drops slivers that only touch the edge
+    area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+    if len(points) < 3 or area == 0:
+        return None
+    return points + points[:1]
+
+
+def wrap_polygon(rings):
+    '''
+    Split a polygon (list of rings, exterior first) whose x runs past the
+    antimeridian into its parts within [-180, 180], the parts past it are
+    shifted by 360 degrees to the other side
+    '''
+    polygons = []
+    for shift in (0, 360, -360):
+        exterior = clip_ring([(x + shift, y) for x, y, *_ in rings[0]])
+        if exterior is None:
+            continue
+        interiors = [clip_ring([(x + shift, y) for x, y, *_ in ring]) for ring in rings[1:]]
+        polygons.append([exterior] + [ring for ring in interiors if ring is not None])
+    return polygons
+
+
+def footprint_arrays(features):
+    '''
+    Flatten GeoJSON orbit features (MultiPolygon or Polygon geometries with an
+    OrbitRelative property) into the footprint file arrays. Footprints that
+    cross the antimeridian are wrapped into [-180, 180] so they match
+    bounding boxes on either side of it.
+    '''
+    orbits, orbit_offsets, polygon_offsets, ring_offsets, coords = [], [0], [0], [0], []
+    for feature in features:
+        geometry = feature['geometry']
+        polygons = geometry['coordinates']
+        if geometry['type'] == 'Polygon':
+            polygons = [polygons]
+
+        orbits.append(int(feature['properties']['OrbitRelative']))
+        for rings in (part for polygon in polygons for part in wrap_polygon(polygon)):
+            for ring in rings:
+                coords.extend(ring)
+                ring_offsets.append(len(coords))
+            polygon_offsets.append(len(ring_offsets) - 1)
+        orbit_offsets.append(len(polygon_offsets) - 1)
+
+    arrays = {
+        'orbits': np.array(orbits, dtype='<i4'),
+        'orbit_offsets': np.array(orbit_offsets, dtype='<i4'),
+        'polygon_offsets': np.array(polygon_offsets, dtype='<i4'),
+        'ring_offsets': np.array(ring_offsets, dtype='<i4'),
+        'coords': np.array(coords, dtype='<f4').reshape(-1, 2),
+    }
+
+    # bounds of the float32 coordinates so they agree with the stored polygons
+    coords = arrays['coords']
+    first_points = arrays['ring_offsets'][arrays['polygon_offsets'][arrays['orbit_offsets']]]
+    arrays['bounds'] = np.stack([
+        np.minimum.reduceat(coords[:, 0], first_points[:-1]),
+        np.minimum.reduceat(coords[:, 1], first_points[:-1]),
+        np.maximum.reduceat(coords[:, 0], first_points[:-1]),
+        np.maximum.reduceat(coords[:, 1], first_points[:-1]),
+    ], axis=1).astype('<f4')
+
+    return arrays
+
+
+def build_footprint_file(geojson_path=ORBITS_GEOJSON, out_path=ORBITS_FOOTPRINTS):
+    '''
+    Convert the orbit GeoJSON into the compact footprint file read by
+    OrbitFootprints.from_file, with the footprints wrapped into [-180, 180]
+    (see footprint_arrays)
+    '''
+    with open(geojson_path) as f:
+        arrays = footprint_arrays(json.load(f)['features'])
+
+    header = np.zeros((), dtype=FOOTPRINT_HEADER)
+    header['magic'] = FOOTPRINT_MAGIC
+    header['version'] = FOOTPRINT_VERSION
+    header['n_orbits'] = len(arrays['orbits'])
+    header['n_polygons'] = len(arrays['polygon_offsets']) - 1
+    header['n_rings'] = len(arrays['ring_offsets']) - 1
+    header['n_points'] = len(arrays['coords'])
+
+    with open(out_path, 'wb') as f:
+        f.write(header.tobytes())
+        for name, dtype, shape in footprint_array_specs(header):
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+
+class OrbitFootprints:
+    '''
+    Array-backed index of the footprints of the Sentinel 2 relative orbits.
+
+    Polygons are kept as flat coordinate buffers plus offsets so they can be
+    memory-mapped from a footprint file without parsing. Shapely geometries
+    are only built for orbits whose bounding box touches a query.
+
+    * arrays is a dict of the footprint arrays created by footprint_arrays
+    '''
+
+    def __init__(self, arrays):
+        self.orbits = arrays['orbits']
+        self.bounds = arrays['bounds']
+        self.orbit_offsets = arrays['orbit_offsets']
+        self.polygon_offsets = arrays['polygon_offsets']
+        self.ring_offsets = arrays['ring_offsets']
+        self.coords = arrays['coords']
+        self._geometries = {}
+
+    @classmethod
+    def from_geojson(cls, path=ORBITS_GEOJSON):
+        '''
+        Load orbit footprints from a GeoJSON with an OrbitRelative property
+        '''
+        with open(path) as f:
+            return cls(footprint_arrays(json.load(f)['features']))
+
+    @classmethod
+    def from_file(cls, path=ORBITS_FOOTPRINTS):
+        '''
+        Memory-map orbit footprints from a file written by build_footprint_file
+        '''
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        header = np.frombuffer(buffer, dtype=FOOTPRINT_HEADER, count=1)[0]
+        assert header['magic'] == FOOTPRINT_MAGIC and header['version'] == FOOTPRINT_VERSION, \
+            f'{path} is not a version {FOOTPRINT_VERSION} orbit footprint file'
+
+        arrays = {}
+        offset = FOOTPRINT_HEADER.itemsize
+        for name, dtype, shape in footprint_array_specs(header):
+            offset += -offset % 8
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += count * dtype.itemsize
+
+        return cls(arrays)
+
+    def polygons(self, i):
+        '''
+        Return the polygons of the i-th orbit as lists of (n, 2) coordinate
+        arrays, exterior ring first. The arrays are views into the coordinate
+        buffer, nothing is copied.
+        '''
+        polygons = []
+        for j in range(self.orbit_offsets[i], self.orbit_offsets[i + 1]):
+            polygons.append([
+                self.coords[self.ring_offsets[k]:self.ring_offsets[k + 1]]
+                for k in range(self.polygon_offsets[j], self.polygon_offsets[j + 1])
+            ])
+        return polygons
+
+    def geometry(self, i):
+        '''
+        Return the i-th orbit footprint as a shapely MultiPolygon
+        '''
+        if i not in self._geometries:
+            # shapely is imported here so the plugin loads without it, only
+            # orbit suggestions need it
+            import shapely
+
+            from shapely.geometry import Polygon, MultiPolygon
+
+            geometry = MultiPolygon([
+                Polygon(rings[0], rings[1:]) for rings in self.polygons(i)
+            ])
+            # prepared geometries speed up the repeated intersection tests,
+            # shapely.prepare only exists from Shapely 2.0
+            if hasattr(shapely, 'prepare'):
+                shapely.prepare(geometry)
+            self._geometries[i] = geometry
+        return self._geometries[i]
+
+    def suggest_orbits(self, bbox, min_coverage=0.0):
+        '''
+        Return the relative orbits that intersect a bounding box ranked by the
+        proportion of the bounding box they cover.
+
+        * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+        * min_coverage drops orbits that cover less than this proportion (0-1)
+
+        Returns a list of (relative orbit, coverage proportion) tuples
+        '''
+        min_x, min_y, max_x, max_y = bbox
+        candidates = np.flatnonzero(
+            (self.bounds[:, 0] <= max_x) & (self.bounds[:, 2] >= min_x) &
+            (self.bounds[:, 1] <= max_y) & (self.bounds[:, 3] >= min_y)
+        )
+
+        aoi = bbox.geometry
+        suggestions = []
+        for i in candidates:
+            geometry = self.geometry(i)
+            if not geometry.intersects(aoi):
+                continue
+            if aoi.area > 0:
+                coverage = geometry.intersection(aoi).area / aoi.area
+            else:
+                # point or line extents are either covered or not
+                coverage = 1.0
+            if coverage > 0 and coverage >= min_coverage:
+                suggestions.append((int(self.orbits[i]), coverage))
+
+        return sorted(suggestions, key=lambda suggestion: (-suggestion[1], suggestion[0]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_orbit_footprints(path=ORBITS_FOOTPRINTS):
+    '''
+    Load the orbit footprints once per session, falling back to parsing the
+    GeoJSON if the footprint file has not been built
+    '''
+    if os.path.exists(path):
+        return OrbitFootprints.from_file(path)
+    return OrbitFootprints.from_geojson()
+
+
+def suggest_orbits(bbox, min_coverage=0.0):
+    '''
+    Return the (relative orbit, coverage proportion) tuples of the orbits that
+    intersect a bounding box, best covering orbit first
+    '''
+    return load_orbit_footprints().suggest_orbits(bbox, min_coverage=min_coverage)
+
+
+if __name__ == '__main__':
+    # python orbit_footprints.py [geojson] [footprint file]
+    build_footprint_file(*sys.argv[1:3])
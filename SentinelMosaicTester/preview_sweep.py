@@ -0,0 +1,131 @@
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .date_index import DateIndex
+from .sentinel_utils import download_preview, filter_dates, get_dates_intervals, \
+    get_preview_evalscript, get_preview_request, month_intervals, query_scene_intervals, \
+    select_dates_by_orbit
+from .tracing import trace_span
+
+# Sentinel Hub rate limits process API requests per account, keep the number
+# of concurrent downloads modest
+DEFAULT_MAX_WORKERS = 4
+
+
+def parse_sweep_sets(text):
+    '''
+    Parse a sweep input string into a list of integer sets. Sets are separated
+    by semicolons and values within a set by commas, e.g. "112,69; 112; 69"
+    '''
+    sets = []
+    for set_string in text.split(';'):
+        if set_string.strip():
+            sets.append([int(value) for value in set_string.split(',')])
+
+    assert len(sets) > 0, f'No values supplied in "{text}"'
+
+    return sets
+
+
+def sweep_configurations(orbit_sets, month_sets, year_sets):
+    '''
+    Expand lists of orbit, month and year sets into every combination of the
+    three. Returns a list of dicts with orbits, months and years keys.
+    '''
+    return [
+        {'orbits': orbits, 'months': months, 'years': years}
+        for orbits, months, years in itertools.product(orbit_sets, month_sets, year_sets)
+    ]
+
+
+def sweep_layer_name(configuration):
+    '''
+    Name a preview layer after its orbits, months and years
+    '''
+    return ' '.join([
+        'orbits:', ' & '.join(str(x) for x in configuration['orbits']),
+        'months:', ' & '.join(str(x) for x in configuration['months']),
+        'years:', ' & '.join(str(x) for x in configuration['years'])
+    ])
+
+
+def run_sweep(bbox, configurations, max_cc, config, catalog=None, cache=None,
+              max_workers=DEFAULT_MAX_WORKERS, is_canceled=None, progress=None, tracer=None):
+    '''
+    Order a default mosaic preview for every sweep configuration. The scene
+    catalog is queried once for the months of all configurations and each
+    configuration's dates are selected from that result locally, then the
+    previews are downloaded concurrently by a bounded thread pool.
+
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * configurations is a list of dicts created by sweep_configurations
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * catalog is an optional scene_catalog.SceneCatalog
+    * cache is an optional response_cache.ResponseCache for the downloads
+    * max_workers is the number of concurrent process API requests
+    * is_canceled is an optional callable, downloads that have not started yet
+      are skipped once it returns True
+    * progress is an optional callable that receives the number of finished
+      configurations
+    * tracer is an optional tracing.Tracer that times the catalog query and
+      every configuration's date filtering, evalscript build and download
+
+    Returns a list of (configuration, output file, exception) tuples in the
+    order of configurations, output file is None when the preview failed
+    '''
+    # one catalog query shared by every configuration, limited to the months
+    # some configuration selects
+    intervals = month_intervals({
+        (year, month)
+        for configuration in configurations
+        for year in configuration['years']
+        for month in configuration['months']
+    })
+    with trace_span(tracer, 'catalog query', intervals=len(intervals)):
+        if catalog is None:
+            scenes = [
+                scene
+                for interval_scenes in query_scene_intervals(
+                    bbox, intervals, max_cc, config, tracer=tracer)
+                for scene in interval_scenes
+            ]
+        else:
+            scenes = catalog.get_interval_scenes(bbox, intervals, max_cc, config, tracer=tracer)
+    # every configuration selects its dates from the same scenes
+    index = DateIndex(scenes)
+
+    def order(configuration):
+        if is_canceled is not None and is_canceled():
+            return None
+
+        layer_name = sweep_layer_name(configuration)
+        with trace_span(tracer, 'date filtering', configuration=layer_name):
+            dates = select_dates_by_orbit(index, configuration['orbits'])
+            dates_filt = filter_dates(
+                dates, months=configuration['months'], years=configuration['years'])
+            time_intervals = get_dates_intervals(dates_filt)
+
+        with trace_span(tracer, 'evalscript build', configuration=layer_name,
+                        dates=len(dates_filt)):
+            evalscript = get_preview_evalscript(dates_filt, inputs=len(time_intervals))
+        request = get_preview_request(evalscript, bbox, time_intervals, max_cc, config)
+        return download_preview(request, cache=cache, tracer=tracer)
+
+    results = [None] * len(configurations)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(order, configuration): i
+            for i, configuration in enumerate(configurations)
+        }
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                results[i] = (configurations[i], future.result(), None)
+            except Exception as e:
+                results[i] = (configurations[i], None, e)
+            if progress is not None:
+                progress(n_done)
+
+    return results
@@ -0,0 +1,86 @@
+import re
+
+# Sentinel 2 granule (tile) IDs as returned by the WFS service, e.g.
+# S2B_OPER_MSI_L2A_TL_VGS1_20210310T201253_A020963_T15TVG_N02.14
+#
+# S{sat}_{file_class}_{file_category}_{level}_{descriptor}_{site_centre}_
+# {creation_date}_A{absolute_orbit}_T{tile}_{processing_baseline}
+#
+# the site centre is padded with underscores when it is shorter than four
+# characters (SGS_), so fields before the creation date are matched lazily
+S2_GRANULE_ID_PATTERN = re.compile(
+    r'S(?P<sat>2[AB])_'
+    r'(?P<file_class>[^_]+)_'
+    r'(?P<file_category>[^_]+)_'
+    r'(?P<level>[^_]+)_'
+    r'(?P<descriptor>[^_]+)_'
+    r'(?P<site_centre>.+?)_'
+    r'(?P<creation_date>\d{8}T\d{6})_'
+    r'A(?P<absolute_orbit>\d+)_'
+    r'T(?P<tile>[0-9A-Z]{5})_'
+    r'(?P<processing_baseline>.+)'
+)
+
+
+class ProductId:
+    '''
+    Fields of a parsed Sentinel 2 granule ID, absolute_orbit is an int and
+    every other field a string
+    '''
+
+    __slots__ = (
+        'product_id', 'sat', 'file_class', 'file_category', 'level',
+        'descriptor', 'site_centre', 'creation_date', 'absolute_orbit', 'tile',
+        'processing_baseline'
+    )
+
+    def __init__(self, product_id, sat, file_class, file_category, level,
+                 descriptor, site_centre, creation_date, absolute_orbit, tile,
+                 processing_baseline):
+        self.product_id = product_id
+        self.sat = sat
+        self.file_class = file_class
+        self.file_category = file_category
+        self.level = level
+        self.descriptor = descriptor
+        self.site_centre = site_centre
+        self.creation_date = creation_date
+        self.absolute_orbit = absolute_orbit
+        self.tile = tile
+        self.processing_baseline = processing_baseline
+
+    def __repr__(self):
+        return f'ProductId({self.product_id!r})'
+
+
+def _from_match(product_id, match):
+    if match is None:
+        raise ValueError(f'Unrecognized Sentinel 2 product ID: {product_id}')
+
+    (sat, file_class, file_category, level, descriptor, site_centre,
+     creation_date, absolute_orbit, tile, processing_baseline) = match.groups()
+
+    return ProductId(
+        product_id, sat, file_class, file_category, level, descriptor,
+        site_centre, creation_date, int(absolute_orbit), tile,
+        processing_baseline)
+
+
+def parse_product_id(product_id):
+    '''
+    Parse a Sentinel 2 granule ID into a ProductId, raises a ValueError if the
+    ID does not follow the granule naming convention
+    '''
+    return _from_match(product_id, S2_GRANULE_ID_PATTERN.fullmatch(product_id))
+
+
+def parse_product_ids(product_ids):
+    '''
+    Parse a list of Sentinel 2 granule IDs (e.g. a whole WFS page) into a list
+    of ProductIds, see parse_product_id
+    '''
+    fullmatch = S2_GRANULE_ID_PATTERN.fullmatch
+    return [
+        _from_match(product_id, fullmatch(product_id))
+        for product_id in product_ids
+    ]
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_FOLDER = os.path.join(
+    os.path.expanduser('~'), '.cache', 'sentinel_mosaic_tester', 'responses'
+)
+
+# least recently used responses are evicted once the cache grows past this
+DEFAULT_MAX_SIZE = 1024 ** 3
+
+
+def request_key(request):
+    '''
+    Hash the full payload of a SentinelHubRequest (service URL, evalscript,
+    bbox, time interval, max_cc, size, responses, ...) into a cache key.
+    Credentials are not part of the payload so every account shares entries.
+    '''
+    payload = [
+        {'url': download_request.url, 'post_values': download_request.post_values}
+        for download_request in request.download_list
+    ]
+    payload_string = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(payload_string.encode()).hexdigest()
+
+
+class ResponseCache:
+    '''
+    Content-addressed on-disk cache of downloaded Sentinel Hub responses.
+
+    Files are stored under the hash of the request payload that produced them,
+    so ordering an identical preview again returns the cached file without
+    another (billed) process API request.
+
+    The folder is scanned once into an in-memory index of key: (path, size,
+    last use), lookups and eviction only touch the index afterwards. Last use
+    is also kept as the file modification time so LRU order survives restarts.
+
+    Responses that are still in use (tiles of an order whose VRT is being
+    built, files of layers loaded in QGIS) are pinned by an owner and never
+    evicted until the owner releases them.
+
+    * folder is the cache directory, created on first use
+    * max_size is the total size in bytes the cache is trimmed to
+    '''
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_size=DEFAULT_MAX_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._index = None
+        self._pins = {}
+
+    def _load_index(self):
+        # call with the lock held
+        if self._index is not None:
+            return self._index
+
+        self._index = {}
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                if not entry.is_file() or entry.name.startswith('.'):
+                    continue
+                stat = entry.stat()
+                self._index[entry.name.split('.')[0]] = (
+                    entry.path, stat.st_size, stat.st_mtime)
+
+        return self._index
+
+    def _pin(self, owner, paths):
+        # call with the lock held
+        if owner is not None:
+            self._pins.setdefault(owner, set()).update(
+                os.path.abspath(path) for path in paths)
+
+    def get(self, key, owner=None):
+        '''
+        Return the path of the cached response for a key or None on a miss.
+        An owner pins the response until it is released, see pin.
+        '''
+        with self._lock:
+            index = self._load_index()
+            if key not in index:
+                return None
+            path, size, _ = index[key]
+            try:
+                # mark as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                # deleted outside of the cache
+                del index[key]
+                return None
+            index[key] = (path, size, time.time())
+            self._pin(owner, [path])
+
+        return path
+
+    def put(self, key, path, owner=None):
+        '''
+        Copy a downloaded response into the cache under a key, evict the least
+        recently used responses if the cache is over its size limit and return
+        the path of the cached copy. An owner pins the copy until it is
+        released, see pin.
+        '''
+        os.makedirs(self.folder, exist_ok=True)
+        extension = os.path.splitext(path)[1]
+        cached_path = os.path.join(self.folder, f'{key}{extension}')
+
+        # copy to a temporary name first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(prefix='.', dir=self.folder)
+        os.close(fd)
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, cached_path)
+
+        with self._lock:
+            self._load_index()[key] = (cached_path, os.path.getsize(cached_path), time.time())
+            self._pin(owner, [cached_path])
+
+        self.evict()
+
+        return cached_path
+
+    def pin(self, owner, paths):
+        '''
+        Keep a list of cached paths from being evicted until owner (any
+        hashable, e.g. an order id or the source of a QGIS layer) is released.
+        Paths outside of the cache are ignored by eviction anyway.
+        '''
+        with self._lock:
+            self._pin(owner, paths)
+
+    def release(self, owner):
+        '''
+        Let the paths pinned by an owner be evicted again
+        '''
+        with self._lock:
+            self._pins.pop(owner, None)
+
+    def evict(self):
+        '''
+        Delete least recently used responses until the cache fits max_size.
+        The most recently used response and pinned responses are always kept,
+        responses that can't be deleted (e.g. open in QGIS on Windows) are
+        skipped.
+        '''
+        with self._lock:
+            index = self._load_index()
+            pinned = set().union(*self._pins.values())
+            entries = sorted(index.items(), key=lambda item: item[1][2])
+            size = sum(entry_size for _, (_, entry_size, _) in entries)
+            for key, (path, entry_size, _) in entries[:-1]:
+                if size <= self.max_size:
+                    break
+                if os.path.abspath(path) in pinned:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del index[key]
+                size -= entry_size
+
+    def size(self):
+        '''
+        Total size in bytes of the cached responses
+        '''
+        with self._lock:
+            return sum(entry_size for _, entry_size, _ in self._load_index().values())
+
+    def clear(self):
+        '''
+        Delete every cached response that can be deleted
+        '''
+        with self._lock:
+            index = self._load_index()
+            for key, (path, _, _) in list(index.items()):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del index[key]
@@ -0,0 +1,273 @@
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+
+from sentinelhub import DataCollection
+
+from .sentinel_utils import query_scene_intervals
+
+DEFAULT_CATALOG_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'sentinel_mosaic_tester', 'scene_catalog.sqlite'
+)
+
+# cached catalog spans are re-queried after this many seconds
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# scenes show up in the WFS catalog a few days after acquisition so spans this
+# close to the query time are never marked as covered
+RECENT_DAYS = 5
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS coverage (
+    query_key TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (query_key);
+CREATE TABLE IF NOT EXISTS scenes (
+    query_key TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sat TEXT NOT NULL,
+    absolute_orbit INTEGER NOT NULL,
+    relative_orbit INTEGER NOT NULL,
+    tile TEXT NOT NULL,
+    cloud_cover REAL,
+    PRIMARY KEY (query_key, product_id)
+);
+CREATE INDEX IF NOT EXISTS scenes_date ON scenes (query_key, date);
+'''
+
+SCENE_COLUMNS = (
+    'product_id', 'date', 'sat', 'absolute_orbit', 'relative_orbit', 'tile', 'cloud_cover'
+)
+
+
+def catalog_key(bbox, max_cc, data_collection):
+    '''
+    Build the cache key for a catalog query. Coordinates are rounded to ~10 cm
+    so re-digitizing the same AOI hits the same cache entry.
+    '''
+    coords = ','.join(f'{coord:.6f}' for coord in bbox)
+    return f'{data_collection.name}|{bbox.crs.epsg}|{coords}|{max_cc:.4f}'
+
+
+def missing_spans(start_date, end_date, covered):
+    '''
+    Return the (start, end) date spans between start_date and end_date
+    (inclusive dt.date objects) that are not covered by any of the covered
+    (start, end) spans.
+    '''
+    one_day = dt.timedelta(days=1)
+    spans = []
+    cursor = start_date
+    for span_start, span_end in sorted(covered):
+        if span_end < cursor:
+            continue
+        if span_start > end_date:
+            break
+        if span_start > cursor:
+            spans.append((cursor, span_start - one_day))
+        cursor = max(cursor, span_end + one_day)
+        if cursor > end_date:
+            break
+
+    if cursor <= end_date:
+        spans.append((cursor, end_date))
+
+    return spans
+
+
+class SceneCatalog:
+    '''
+    Persistent on-disk cache of Sentinel 2 scenes returned by the WFS catalog.
+
+    Scenes are stored per (bbox, max_cc, data collection) key together with the
+    date spans that have already been queried for that key. A query only pages
+    the WFS service for the parts of the requested date range that are missing
+    or older than the TTL, everything else is served from SQLite.
+
+    * path is the SQLite database file, created on first use
+    * ttl is the number of seconds a queried date span stays valid
+    * fetcher is an optional wfs_fetcher.WfsFetcher the missing spans are
+      paged with, see sentinel_utils.query_scenes
+    '''
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, ttl=DEFAULT_TTL, fetcher=None):
+        self.path = path
+        self.ttl = ttl
+        self.fetcher = fetcher
+        self._initialized = False
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _connect(self):
+        if not self._initialized:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+                conn.executescript(CATALOG_SCHEMA)
+            self._initialized = True
+
+        # connections are not shared between threads, open one per operation
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _key_lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _covered_spans(self, conn, key, expire=True):
+        now = time.time()
+        if expire:
+            with conn:
+                conn.execute(
+                    'DELETE FROM coverage WHERE query_key = ? AND fetched_at < ?',
+                    (key, now - self.ttl)
+                )
+        rows = conn.execute(
+            'SELECT start_date, end_date FROM coverage WHERE query_key = ? AND fetched_at >= ?',
+            (key, now - self.ttl)
+        )
+        return [
+            (dt.date.fromisoformat(start), dt.date.fromisoformat(end))
+            for start, end in rows
+        ]
+
+    def _store_span(self, conn, key, span_start, span_end, scenes):
+        with conn:
+            conn.execute(
+                'DELETE FROM scenes WHERE query_key = ? AND date BETWEEN ? AND ?',
+                (key, span_start.isoformat(), span_end.isoformat())
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(key, *[scene[col] for col in SCENE_COLUMNS]) for scene in scenes]
+            )
+
+            # never mark the last few days as covered, they are still filling in
+            covered_end = min(span_end, dt.date.today() - dt.timedelta(days=RECENT_DAYS))
+            if covered_end >= span_start:
+                conn.execute(
+                    'INSERT INTO coverage VALUES (?, ?, ?, ?)',
+                    (key, span_start.isoformat(), covered_end.isoformat(), time.time())
+                )
+
+    def get_scenes(self, bbox, start_date, end_date, max_cc, config,
+                   data_collection=DataCollection.SENTINEL2_L2A, tracer=None):
+        '''
+        Return scene records (see sentinel_utils.parse_scene) for a bounding box
+        between two dates, sorted by date. Date spans that are not in the cache
+        are queried from the WFS service and stored before returning.
+
+        * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+        * start_date and end_date are date strings formatted as yyyy-mm-dd
+        * max_cc is the maximum allowed cloud cover (0-1 scale)
+        * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+        * tracer is an optional tracing.Tracer that times the WFS queries
+        '''
+        return self.get_interval_scenes(
+            bbox, [(start_date, end_date)], max_cc, config, data_collection=data_collection,
+            tracer=tracer)
+
+    def get_interval_scenes(self, bbox, intervals, max_cc, config,
+                            data_collection=DataCollection.SENTINEL2_L2A, tracer=None):
+        '''
+        Return scene records for a bounding box within a list of disjoint
+        (start, end) yyyy-mm-dd date spans (see sentinel_utils.selection_intervals),
+        sorted by date. The missing parts of every span are queried from the
+        WFS service concurrently, timed by an optional tracing.Tracer.
+        '''
+        key = catalog_key(bbox, max_cc, data_collection)
+        intervals = [
+            (dt.date.fromisoformat(start), dt.date.fromisoformat(end))
+            for start, end in intervals
+        ]
+
+        with self._key_lock(key), self._connect() as conn:
+            # top up the cache with only the spans that are missing
+            covered = self._covered_spans(conn, key)
+            spans = [
+                span
+                for start, end in intervals
+                for span in missing_spans(start, end, covered)
+            ]
+            if len(spans) > 0:
+                span_scenes = query_scene_intervals(
+                    bbox,
+                    [(span_start.isoformat(), span_end.isoformat()) for span_start, span_end in spans],
+                    max_cc=max_cc,
+                    config=config,
+                    data_collection=data_collection,
+                    fetcher=self.fetcher,
+                    tracer=tracer
+                )
+                for (span_start, span_end), scenes in zip(spans, span_scenes):
+                    self._store_span(conn, key, span_start, span_end, scenes)
+
+            rows = []
+            for start, end in intervals:
+                rows += conn.execute(
+                    f'SELECT {", ".join(SCENE_COLUMNS)} FROM scenes '
+                    'WHERE query_key = ? AND date BETWEEN ? AND ? ORDER BY date, product_id',
+                    (key, start.isoformat(), end.isoformat())
+                ).fetchall()
+
+        return [dict(zip(SCENE_COLUMNS, row)) for row in sorted(set(rows), key=lambda row: (row[1], row[0]))]
+
+    def get_cached_interval_scenes(self, bbox, intervals, max_cc,
+                                   data_collection=DataCollection.SENTINEL2_L2A):
+        '''
+        Return the cached scene records for a bounding box within a list of
+        (start, end) yyyy-mm-dd date spans without querying the WFS service,
+        and the (start, end) spans that are not in the cache (or expired).
+
+        Meant for the GUI thread: it never writes and does not take the key
+        lock that get_interval_scenes holds across its WFS queries, the reads
+        run in one SQLite transaction so they see a consistent snapshot.
+        '''
+        key = catalog_key(bbox, max_cc, data_collection)
+        intervals = [
+            (dt.date.fromisoformat(start), dt.date.fromisoformat(end))
+            for start, end in intervals
+        ]
+
+        with self._connect() as conn:
+            conn.execute('BEGIN')
+            covered = self._covered_spans(conn, key, expire=False)
+            spans = [
+                (span_start.isoformat(), span_end.isoformat())
+                for start, end in intervals
+                for span_start, span_end in missing_spans(start, end, covered)
+            ]
+
+            rows = []
+            for start, end in intervals:
+                rows += conn.execute(
+                    f'SELECT {", ".join(SCENE_COLUMNS)} FROM scenes '
+                    'WHERE query_key = ? AND date BETWEEN ? AND ?',
+                    (key, start.isoformat(), end.isoformat())
+                ).fetchall()
+            conn.rollback()
+
+        # scenes of partly fetched spans are left to the caller's estimate of
+        # the missing spans
+        rows = [
+            row for row in set(rows)
+            if not any(start <= row[1] <= end for start, end in spans)
+        ]
+        scenes = [dict(zip(SCENE_COLUMNS, row)) for row in sorted(rows, key=lambda row: (row[1], row[0]))]
+        return scenes, spans
+
+    def clear(self):
+        '''
+        Remove every cached scene and queried span
+        '''
+        with self._connect() as conn, conn:
+            conn.execute('DELETE FROM coverage')
+            conn.execute('DELETE FROM scenes')
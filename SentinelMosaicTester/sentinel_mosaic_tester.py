@@ -21,9 +21,9 @@
  *                                                                         *
  ***************************************************************************/
 """
-from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
+from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt, QTimer
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import QAction, QProgressBar
+from qgis.PyQt.QtWidgets import QAction
 # Initialize Qt resources from file resources.py
 from .resources import *
 
@@ -32,11 +32,22 @@ from .sentinel_mosaic_tester_dockwidget import SentinelMosaicTesterDockWidget
 
 # import custom utils
 from .sentinel_utils import *
+from .scene_catalog import SceneCatalog
+from .response_cache import ResponseCache
+from .tracing import Tracer
+from .wfs_fetcher import WfsFetcher
+from .mosaic_task import CubePreviewTask, MosaicPreviewTask, MosaicSweepTask, YearCountTask
+from .preview_sweep import parse_sweep_sets, sweep_configurations
+from .orbit_footprints import suggest_orbits
+from .cost_estimate import estimate_preview_cost, format_cost_estimate
+from .evalscript import DEFAULT_STATISTICS
 
 import os.path
 
+from osgeo import gdal
 from qgis.core import (
     Qgis,
+    QgsApplication,
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
     QgsProject,
@@ -45,11 +56,11 @@ from qgis.core import (
     QgsGeometry,
     QgsVectorLayer,
     QgsFeature,
+    QgsMapLayerType,
     QgsMessageLog
     )
 
 import numpy as np
-import parse
 import re
 import time
 
@@ -62,6 +73,16 @@ from sentinelhub import BBox, CRS, DataCollection, \
 # assumes sentinelhub authentication is set via sentinelhub.config
 config = SHConfig()
 
+# local cache of WFS catalog queries shared by every mosaic order, missing
+# date spans are paged concurrently over one pooled session
+scene_catalog = SceneCatalog(fetcher=WfsFetcher(config))
+
+# local cache of downloaded previews so identical orders are not paid twice
+response_cache = ResponseCache()
+
+# quiet time after the last settings change before the cost is re-estimated
+COST_ESTIMATE_DELAY_MS = 300
+
 class SentinelMosaicTester:
     """QGIS Plugin Implementation."""
 
@@ -104,6 +125,16 @@ class SentinelMosaicTester:
         self.dockwidget = None
         self.first_start = None
 
+        # mosaic orders that are queued or running in the background
+        self.tasks = []
+
+        # re-estimate the cost once settings stop changing, not on every
+        # keystroke
+        self.cost_estimate_timer = QTimer()
+        self.cost_estimate_timer.setSingleShot(True)
+        self.cost_estimate_timer.setInterval(COST_ESTIMATE_DELAY_MS)
+        self.cost_estimate_timer.timeout.connect(self.update_cost_estimate)
+
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -204,6 +235,38 @@ class SentinelMosaicTester:
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        # keep cached responses of loaded layers from being evicted
+        project = QgsProject.instance()
+        project.layersAdded.connect(self.pin_layer_files)
+        project.layersWillBeRemoved.connect(self.release_layer_files)
+        self.pin_layer_files(project.mapLayers().values())
+
+    def pin_layer_files(self, layers):
+        """Pin the files of raster layers (a VRT and its tiles) in the response cache.
+
+        :param layers: layers added to the project
+        :type layers: list of QgsMapLayer
+        """
+        for layer in layers:
+            if layer.type() != QgsMapLayerType.RasterLayer:
+                continue
+            dataset = gdal.Open(layer.source())
+            if dataset is None:
+                continue
+            response_cache.pin(layer.id(), dataset.GetFileList() or [])
+            dataset = None
+            # the layer holds the pins of the order that produced it from now on
+            response_cache.release(layer.source())
+
+    def release_layer_files(self, layer_ids):
+        """Let the response cache evict the files of removed layers.
+
+        :param layer_ids: ids of the layers being removed
+        :type layer_ids: list of str
+        """
+        for layer_id in layer_ids:
+            response_cache.release(layer_id)
+
     #--------------------------------------------------------------------------
 
     def onClosePlugin(self):
@@ -228,6 +291,15 @@ class SentinelMosaicTester:
 
         #print "** UNLOAD SentinelMosaicTester"
 
+        # stop any mosaic orders still in flight
+        for task in list(self.tasks):
+            task.cancel()
+        self.cost_estimate_timer.stop()
+
+        project = QgsProject.instance()
+        project.layersAdded.disconnect(self.pin_layer_files)
+        project.layersWillBeRemoved.disconnect(self.release_layer_files)
+
         for action in self.actions:
             self.iface.removePluginMenu(
                 self.tr(u'&SentinelMosaicTester'),
@@ -236,21 +308,23 @@ class SentinelMosaicTester:
         # remove the toolbar
         del self.toolbar
 
-    def get_bounding_box(self, default=True):
+    def get_bounding_box(self, default=True, layer=None, log=True):
         '''
         Return bounding box for the mosaic
 
         Parameters:
         default (boolean): True if calling function if run_default_evalscript, False if run_custom_evalscript
+        layer (QgsMapLayer): layer to use instead of the one selected on the default or custom tab
+        log (boolean): False to skip logging the bounding box, e.g. while estimating costs
         
         Returns: 
         bbox (Bbox): Bbox object
         '''
 
         # get bounding box from selected layer
-        if default:
+        if layer is None and default:
             layer = self.dockwidget.default_selected_layer.currentLayer()
-        else:
+        elif layer is None:
             layer = self.dockwidget.custom_selected_layer.currentLayer()
         src_crs = layer.crs()
         layer_extent = layer.extent()
@@ -264,42 +338,86 @@ class SentinelMosaicTester:
         max_x = layer_extent.xMaximum()
         max_y = layer_extent.yMaximum()
         
-        QgsMessageLog.logMessage(
-            f'bounding box: {min_x}, {min_y}, {max_x}, {max_y}',
-            level=Qgis.Info
-            )
+        if log:
+            QgsMessageLog.logMessage(
+                f'bounding box: {min_x}, {min_y}, {max_x}, {max_y}',
+                level=Qgis.Info
+                )
         
         bbox = BBox(bbox=[min_x, min_y, max_x, max_y], crs=CRS.WGS84)
 
         return bbox
 
-    #--------------------------------------------------------------------------
+    def submit_task(self, task):
+        '''
+        Queue a background task with the QGIS task manager. The task manager
+        runs queued tasks concurrently and shows their progress and a cancel
+        button in the status bar.
 
-    def run_default_evalscript(self):
-        """
-        Run operations given default evalscript code and return a raster layer based on specifications
-        """
+        Parameters:
+        task (QgsTask): task to queue
+        '''
+        # keep a reference until the task is done, QGIS crashes if python
+        # garbage collects a task that is still queued or running
+        self.tasks.append(task)
+        task.taskCompleted.connect(lambda: self.tasks.remove(task))
+        task.taskTerminated.connect(lambda: self.tasks.remove(task))
 
-        progressMessageBar = self.iface.messageBar().createMessage('Getting mosaic preview')
-        progress = QProgressBar()
-        progress.setMaximum(3)
-        progress.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-        progressMessageBar.layout().addWidget(progress)
-        self.iface.messageBar().pushWidget(progressMessageBar, Qgis.Info)
+        QgsApplication.taskManager().addTask(task)
+        QgsMessageLog.logMessage(
+            f'queued {task.description()} ({len(self.tasks)} in flight)',
+            level=Qgis.Info
+            )
 
-        # get bounding box
+    def suggest_relative_orbits(self):
+        '''
+        Fill the relative orbit input with the orbits that intersect the
+        bounding box, best covering orbit first
+        '''
         bbox = self.get_bounding_box()
+        suggestions = suggest_orbits(bbox)
+        assert len(suggestions) > 0, 'No Sentinel 2 orbits cover the bounding box.'
 
-        # make list of relative orbits
-        orbit_string = self.dockwidget.relative_orbit.text()
-        orbits = [int(orbit) for orbit in orbit_string.split(',')]
-        orbit_list_string = ' & '.join([str(x) for x in orbits])
+        coverage_string = ', '.join(
+            [f'{orbit} ({coverage:.0%})' for orbit, coverage in suggestions])
         QgsMessageLog.logMessage(
-            f'orbits: {orbit_list_string}',
+            f'orbit coverage: {coverage_string}',
             level=Qgis.Info
             )
 
-        # filter down to desired months/years
+        self.dockwidget.relative_orbit.setText(
+            ','.join([str(orbit) for orbit, _ in suggestions]))
+
+    def filter_orbits(self, bbox, orbits):
+        '''
+        Drop the orbits whose footprint does not touch a bounding box, with a
+        warning. The footprints are nominal, so if none of the orbits would be
+        left they are all kept and only the warning is shown.
+
+        Returns the kept orbits and the orbits whose footprint touches the
+        bounding box
+        '''
+        covering_orbits = [orbit for orbit, _ in suggest_orbits(bbox)]
+        skipped_orbits = [orbit for orbit in orbits if orbit not in covering_orbits]
+        if len(skipped_orbits) == len(orbits):
+            self.iface.messageBar().pushMessage(
+                'Mosaic preview',
+                f'none of the orbits cover the bounding box (suggested: {covering_orbits}), '
+                'ordering them anyway',
+                level=Qgis.Warning)
+        elif len(skipped_orbits) > 0:
+            self.iface.messageBar().pushMessage(
+                'Mosaic preview',
+                f'skipping orbits that do not cover the bounding box: {skipped_orbits}',
+                level=Qgis.Warning)
+            orbits = [orbit for orbit in orbits if orbit in covering_orbits]
+
+        return orbits, covering_orbits
+
+    def selected_months(self):
+        '''
+        Return the months (1-12) checked on the default tab
+        '''
         months = []
         if self.dockwidget.month_january.isChecked():
             months.append(1)
@@ -325,13 +443,13 @@ class SentinelMosaicTester:
             months.append(11)
         if self.dockwidget.month_december.isChecked():
             months.append(12)
-        
-        month_string = ' & '.join([str(x) for x in months])
-        QgsMessageLog.logMessage(
-            f'months: {month_string}',
-            level=Qgis.Info
-            )
 
+        return months
+
+    def selected_years(self):
+        '''
+        Return the years checked on the default tab
+        '''
         years = []
         if self.dockwidget.year_2018.isChecked():
             years.append(2018)
@@ -341,85 +459,193 @@ class SentinelMosaicTester:
             years.append(2020)
         if self.dockwidget.year_2021.isChecked():
             years.append(2021)
-        
-        year_string = ' & '.join([str(x) for x in years])
-        QgsMessageLog.logMessage(
-            f'years: {year_string}',
-            level=Qgis.Info
-            )
-        progress.setValue(1)
 
-        # date range for mosaicing
-        max_cc = float(self.dockwidget.default_max_cc.text())
-        # validate max_cc input
-        assert max_cc >= 0 and max_cc <= 1, 'Please enter a max cloud cover proportion between 0 and 1.'
+        return years
+
+    def schedule_cost_estimate(self, *args):
+        '''
+        Update the cost estimate once the settings have not changed for
+        COST_ESTIMATE_DELAY_MS, every change restarts the timer
+        '''
+        self.cost_estimate_timer.start()
+
+    def update_cost_estimate(self):
+        '''
+        Show the estimated dates, scenes and processing units of the default
+        preview settings, from the local scene catalog and orbit footprints
+        '''
+        try:
+            bbox = self.get_bounding_box(log=False)
+            orbits = [int(orbit) for orbit in self.dockwidget.relative_orbit.text().split(',')]
+            max_cc = float(self.dockwidget.default_max_cc.text())
+            resolution_input = self.dockwidget.default_resolution.text()
+            resolution = float(resolution_input) if len(resolution_input) != 0 else None
+            estimate = estimate_preview_cost(
+                bbox,
+                orbits,
+                self.selected_months(),
+                self.selected_years(),
+                max_cc,
+                catalog=scene_catalog,
+                resolution=resolution)
+        except Exception:
+            # settings are incomplete while they are being edited
+            self.dockwidget.default_cost_label.setText('Estimated cost: -')
+            return
+
+        self.dockwidget.default_cost_label.setText(
+            f'Estimated cost: {format_cost_estimate(estimate)}')
+
+    #--------------------------------------------------------------------------
+
+    def run_default_evalscript(self):
+        """
+        Run operations given default evalscript code and return a raster layer based on specifications
+        """
+
+        # time every stage of the order
+        tracer = Tracer()
+
+        # get bounding box
+        with tracer.span('bbox transform'):
+            bbox = self.get_bounding_box()
+
+        # make list of relative orbits
+        orbit_string = self.dockwidget.relative_orbit.text()
+        orbits = [int(orbit) for orbit in orbit_string.split(',')]
 
-        first_year, last_year = str(min(years)), str(max(years))
-        start_date, end_date = f'{first_year}-01-01', f'{last_year}-12-30'
+        # skip orbits whose footprint does not touch the bounding box
+        orbits, covering_orbits = self.filter_orbits(bbox, orbits)
 
-        # query dates
+        orbit_list_string = ' & '.join([str(x) for x in orbits])
         QgsMessageLog.logMessage(
-            'querying dates for bbox',
+            f'orbits: {orbit_list_string}',
             level=Qgis.Info
             )
 
-        dates = get_dates_by_orbit(
-            bbox,
-            start_date=start_date,
-            end_date=end_date,
-            max_cc=max_cc,
-            target_orbit=orbits,
-            config=config)
+        # filter down to desired months/years
+        months = self.selected_months()
         
-        progress.setValue(2)
-
-        # filter dates down to desired months/years
-        dates_filt = filter_dates(dates, months=months, years=years)
-
-        # add dates to evalscript
-        date_string = ', '.join([f'"{date}"' for date in dates_filt])
-        preview_eval = PREVIEW_EVALSCRIPT % date_string
+        month_string = ' & '.join([str(x) for x in months])
+        QgsMessageLog.logMessage(
+            f'months: {month_string}',
+            level=Qgis.Info
+            )
 
-        # set time interval
-        time_interval = [dt.datetime.strptime(
-            date, '%Y-%m-%d').date() for date in [start_date, end_date]]
+        years = self.selected_years()
         
+        year_string = ' & '.join([str(x) for x in years])
         QgsMessageLog.logMessage(
-            'requesting preview image',
+            f'years: {year_string}',
             level=Qgis.Info
             )
 
-        preview_request = SentinelHubRequest(
-            evalscript=preview_eval,
-            data_folder='/tmp/mosaic_tests',
-            input_data=[
-                SentinelHubRequest.input_data(
-                    data_collection=DataCollection.SENTINEL2_L2A,
-                    time_interval=time_interval,
-                    maxcc=max_cc
-                )
-            ],
-            responses=[
-                SentinelHubRequest.output_response('default', MimeType.TIFF)
-            ],
-            bbox=bbox,
-            size=(512, get_image_dimension(bbox=bbox, width=512)),
-            config=config
-        )
-
-        preview_request.get_data(save_data=True)
-        progress.setValue(3)
-        output_file = '/tmp/mosaic_tests' + '/' + preview_request.get_filename_list()[0]
-        
-        # add file to QGIS
+        # date range for mosaicing
+        max_cc = float(self.dockwidget.default_max_cc.text())
+        # validate max_cc input
+        assert max_cc >= 0 and max_cc <= 1, 'Please enter a max cloud cover proportion between 0 and 1.'
+
+        # order tiles at a target resolution instead of a single 512 pixel image
+        resolution_input = self.dockwidget.default_resolution.text()
+        if len(resolution_input) != 0:
+            resolution = float(resolution_input)
+            assert resolution > 0, 'Please enter a resolution in meters greater than 0.'
+        else:
+            resolution = None
+
         default_layer_name_input = self.dockwidget.default_layer_name_input.text()
         if len(default_layer_name_input) != 0:
             layer_name = default_layer_name_input
         else:
             layer_name = ' '.join(
                 ['orbits:', orbit_list_string, 'months:', month_string, 'years:', year_string])
-        self.iface.addRasterLayer(output_file, layer_name)
-        self.iface.messageBar().clearWidgets()
+
+        # order the median, first quartile, valid count and cloudy fraction in
+        # one request, loaded as a layer group
+        if self.dockwidget.default_statistics.isChecked():
+            assert resolution is None, 'Statistics are only ordered as 512 pixel previews, please clear the resolution.'
+            statistics = DEFAULT_STATISTICS
+        else:
+            statistics = None
+
+        if self.dockwidget.default_use_cube.isChecked():
+            assert statistics is None, 'Band cube previews are composited locally, please uncheck statistics.'
+            assert resolution is None, 'Band cube previews are always 512 pixels wide, please clear the resolution.'
+
+            # fetch every orbit and year the AOI could be previewed with once,
+            # later changes are composited from the cube on disk
+            task = CubePreviewTask(
+                self.iface,
+                layer_name,
+                bbox,
+                orbits=orbits,
+                months=months,
+                years=years,
+                max_cc=max_cc,
+                config=config,
+                fetch_orbits=covering_orbits,
+                fetch_years=[2018, 2019, 2020, 2021],
+                catalog=scene_catalog,
+                tracer=tracer)
+        else:
+            # query, download and load the preview in the background
+            task = MosaicPreviewTask(
+                self.iface,
+                layer_name,
+                bbox,
+                max_cc=max_cc,
+                config=config,
+                orbits=orbits,
+                months=months,
+                years=years,
+                catalog=scene_catalog,
+                resolution=resolution,
+                cache=response_cache,
+                tracer=tracer,
+                statistics=statistics)
+        self.submit_task(task)
+
+        return None
+
+    def count_valid_observations(self):
+        """
+        Count the valid observations of every pixel for cumulative sets of
+        years and report the fewest recent years that reach the minimum
+        """
+        bbox = self.get_bounding_box()
+
+        orbits = [int(orbit) for orbit in self.dockwidget.relative_orbit.text().split(',')]
+        orbits, _ = self.filter_orbits(bbox, orbits)
+
+        months = self.selected_months()
+        assert len(months) > 0, 'Please select at least one month.'
+
+        max_cc = float(self.dockwidget.default_max_cc.text())
+        assert max_cc >= 0 and max_cc <= 1, 'Please enter a max cloud cover proportion between 0 and 1.'
+
+        threshold = int(self.dockwidget.count_threshold.text())
+        assert threshold > 0, 'Please enter a minimum number of valid observations greater than 0.'
+
+        orbit_list_string = ' & '.join([str(x) for x in orbits])
+        month_string = ' & '.join([str(x) for x in months])
+        layer_name = ' '.join(
+            ['valid observations', 'orbits:', orbit_list_string, 'months:', month_string])
+
+        # count every year the preview could include, so one request answers
+        # how many years are needed
+        task = YearCountTask(
+            self.iface,
+            layer_name,
+            bbox,
+            orbits=orbits,
+            months=months,
+            years=[2018, 2019, 2020, 2021],
+            max_cc=max_cc,
+            config=config,
+            threshold=threshold,
+            catalog=scene_catalog,
+            cache=response_cache)
+        self.submit_task(task)
 
         return None
 
@@ -429,15 +655,12 @@ class SentinelMosaicTester:
         Run operations given user inputted custom evalscript code and return a raster layer based on specifications
         """
         
-        progressMessageBar = self.iface.messageBar().createMessage('Getting mosaic preview')
-        progress = QProgressBar()
-        progress.setMaximum(3)
-        progress.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-        progressMessageBar.layout().addWidget(progress)
-        self.iface.messageBar().pushWidget(progressMessageBar, Qgis.Info)
+        # time every stage of the order
+        tracer = Tracer()
 
         # get bounding box
-        bbox = self.get_bounding_box(default=False)
+        with tracer.span('bbox transform'):
+            bbox = self.get_bounding_box(default=False)
 
         # validate and set time interval
         start_date, end_date = self.dockwidget.start_date.text(), self.dockwidget.end_date.text()
@@ -458,42 +681,73 @@ class SentinelMosaicTester:
         # grab user inputted custom evalscript and substitute generic
         custom_evalscript_code = self.dockwidget.custom_evalscript_code.toPlainText()
         preview_eval = custom_evalscript_code
-        
-        QgsMessageLog.logMessage(
-            'requesting preview image',
-            level=Qgis.Info
-            )
-        
-        preview_request = SentinelHubRequest(
-            evalscript=preview_eval,
-            data_folder='/tmp/mosaic_tests',
-            input_data=[
-                SentinelHubRequest.input_data(
-                    data_collection=DataCollection.SENTINEL2_L2A,
-                    time_interval=time_interval,
-                    maxcc=max_cc
-                )
-            ],
-            responses=[
-                SentinelHubRequest.output_response('default', MimeType.TIFF)
-            ],
-            bbox=bbox,
-            size=(512, get_image_dimension(bbox=bbox, width=512)),
-            config=config
-        )
-
-        preview_request.get_data(save_data=True)
-        progress.setValue(3)
-        output_file = '/tmp/mosaic_tests' + '/' + preview_request.get_filename_list()[0]
-        
-        # add file to QGIS
+
         custom_layer_name_input = self.dockwidget.custom_layer_name_input.text()
         if len(custom_layer_name_input) != 0:
             layer_name = custom_layer_name_input
         else:
             layer_name = 'custom_evalscript_layer'
-        self.iface.addRasterLayer(output_file, layer_name)
-        self.iface.messageBar().clearWidgets()
+
+        # download and load the preview in the background
+        task = MosaicPreviewTask(
+            self.iface,
+            layer_name,
+            bbox,
+            max_cc=max_cc,
+            config=config,
+            evalscript=preview_eval,
+            time_interval=time_interval,
+            cache=response_cache,
+            tracer=tracer)
+        self.submit_task(task)
+
+        return None
+
+    def run_preview_sweep(self):
+        """
+        Order default evalscript previews for every combination of the orbit, month and year sets and load them as a layer group
+        """
+
+        # time every stage of the sweep
+        tracer = Tracer()
+
+        # get bounding box
+        with tracer.span('bbox transform'):
+            bbox = self.get_bounding_box(layer=self.dockwidget.sweep_selected_layer.currentLayer())
+
+        # expand the sets into every combination
+        orbit_sets = parse_sweep_sets(self.dockwidget.sweep_orbit_sets.text())
+        month_sets = parse_sweep_sets(self.dockwidget.sweep_month_sets.text())
+        year_sets = parse_sweep_sets(self.dockwidget.sweep_year_sets.text())
+        configurations = sweep_configurations(orbit_sets, month_sets, year_sets)
+        QgsMessageLog.logMessage(
+            f'sweep: {len(configurations)} combinations',
+            level=Qgis.Info
+            )
+
+        # set and validate max_cc
+        max_cc = float(self.dockwidget.sweep_max_cc.text())
+
+        assert max_cc >= 0 and max_cc <= 1, 'Please enter a max cloud cover proportion between 0 and 1.'
+
+        sweep_group_name_input = self.dockwidget.sweep_group_name_input.text()
+        if len(sweep_group_name_input) != 0:
+            group_name = sweep_group_name_input
+        else:
+            group_name = f'preview sweep ({len(configurations)} combinations)'
+
+        # query, download and load the previews in the background
+        task = MosaicSweepTask(
+            self.iface,
+            group_name,
+            bbox,
+            configurations,
+            max_cc=max_cc,
+            config=config,
+            catalog=scene_catalog,
+            cache=response_cache,
+            tracer=tracer)
+        self.submit_task(task)
 
         return None
 
@@ -522,4 +776,23 @@ class SentinelMosaicTester:
 
             # run different functions depending on custom evalscript or default
             self.dockwidget.order_mosaic_default_btn.clicked.connect(self.run_default_evalscript)
-            self.dockwidget.order_mosaic_custom_evalscript_btn.clicked.connect(self.run_custom_evalscript)
\ No newline at end of file
+            self.dockwidget.order_mosaic_custom_evalscript_btn.clicked.connect(self.run_custom_evalscript)
+            self.dockwidget.order_sweep_btn.clicked.connect(self.run_preview_sweep)
+            self.dockwidget.count_observations_btn.clicked.connect(self.count_valid_observations)
+            self.dockwidget.suggest_orbits_btn.clicked.connect(self.suggest_relative_orbits)
+            # re-estimate the cost of the default preview as settings change
+            for checkbox in [
+                    self.dockwidget.month_january, self.dockwidget.month_february,
+                    self.dockwidget.month_march, self.dockwidget.month_april,
+                    self.dockwidget.month_may, self.dockwidget.month_june,
+                    self.dockwidget.month_july, self.dockwidget.month_august,
+                    self.dockwidget.month_september, self.dockwidget.month_october,
+                    self.dockwidget.month_november, self.dockwidget.month_december,
+                    self.dockwidget.year_2018, self.dockwidget.year_2019,
+                    self.dockwidget.year_2020, self.dockwidget.year_2021]:
+                checkbox.toggled.connect(self.schedule_cost_estimate)
+            self.dockwidget.relative_orbit.textChanged.connect(self.schedule_cost_estimate)
+            self.dockwidget.default_max_cc.textChanged.connect(self.schedule_cost_estimate)
+            self.dockwidget.default_resolution.textChanged.connect(self.schedule_cost_estimate)
+            self.dockwidget.default_selected_layer.layerChanged.connect(self.schedule_cost_estimate)
+            self.update_cost_estimate()
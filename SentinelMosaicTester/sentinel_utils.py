@@ -1,127 +1,32 @@
+import calendar
 import datetime as dt
-import parse
-
-from sentinelhub import DataCollection, WebFeatureService
-
-S2_GRANULE_ID_FMT = (
-    'S{sat}_{file_class}_{file_category}_' +
-    '{level}_{descriptor}_{site_centre}_' +
-    '{creation_date}_A{absolute_orbit}_' +
-    'T{tile}_{processing_baseline}'
-)
-
-PREVIEW_EVALSCRIPT = """
-//VERSION=3
-// based on this evalscript:
-// https://github.com/sentinel-hub/custom-scripts/blob/master/sentinel-2/cloudless_mosaic/L2A-first_quartile_4bands.js
-function setup() {
-return {
-    input: [{
-    bands: [
-        "B08", // near infrared
-        "B03", // green
-        "B02", // blue
-        "SCL" // pixel classification
-    ],
-    units: "DN"
-    }],
-    output: [
-    {
-        id: "default",
-        bands: 3,
-        sampleType: SampleType.UINT16
-    }
-    ],
-    mosaicking: "ORBIT"
-};
-}
-// acceptable images are ones collected on specified dates
-function filterScenes(availableScenes, inputMetadata) {
-var allowedDates = [%s]; // format with python
-return availableScenes.filter(function (scene) {
-    var sceneDateStr = scene.date.toISOString().split("T")[0]; //converting date and time to string and rounding to day precision
-    return allowedDates.includes(sceneDateStr);
-});
-}
-function getValue(values) {
-values.sort(function (a, b) {
-    return a - b;
-});
-return getMedian(values);
-}
-// function for pulling median (second quartile) of values
-function getMedian(sortedValues) {
-var index = Math.floor(sortedValues.length / 2);
-return sortedValues[index];
-}
-function validate(samples) {
-var scl = samples.SCL;
-if (scl === 3) { // SC_CLOUD_SHADOW
-    return false;
-} else if (scl === 9) { // SC_CLOUD_HIGH_PROBA
-    return false;
-} else if (scl === 8) { // SC_CLOUD_MEDIUM_PROBA
-    return false;
-} else if (scl === 7) { // SC_CLOUD_LOW_PROBA
-    // return false;
-} else if (scl === 10) { // SC_THIN_CIRRUS
-    return false;
-} else if (scl === 11) { // SC_SNOW_ICE
-    return false;
-} else if (scl === 1) { // SC_SATURATED_DEFECTIVE
-    return false;
-} else if (scl === 2) { // SC_DARK_FEATURE_SHADOW
-    // return false;
-}
-return true;
-}
-function evaluatePixel(samples, scenes) {
-var clo_b02 = [];
-var clo_b03 = [];
-var clo_b08 = [];
-var clo_b02_invalid = [];
-var clo_b03_invalid = [];
-var clo_b08_invalid = [];
-var a = 0;
-var a_invalid = 0;
-for (var i = 0; i < samples.length; i++) {
-    var sample = samples[i];
-    if (sample.B02 > 0 && sample.B03 > 0 && sample.B08 > 0) {
-    var isValid = validate(sample);
-    if (isValid) {
-        clo_b02[a] = sample.B02;
-        clo_b03[a] = sample.B03;
-        clo_b08[a] = sample.B08;
-        a = a + 1;
-    } else {
-        clo_b02_invalid[a_invalid] = sample.B02;
-        clo_b03_invalid[a_invalid] = sample.B03;
-        clo_b08_invalid[a_invalid] = sample.B08;
-        a_invalid = a_invalid + 1;
-    }
-    }
-}
-var gValue;
-var bValue;
-var nValue;
-if (a > 0) {
-    gValue = getValue(clo_b03);
-    bValue = getValue(clo_b02);
-    nValue = getValue(clo_b08);
-} else if (a_invalid > 0) {
-    gValue = getValue(clo_b03_invalid);
-    bValue = getValue(clo_b02_invalid);
-    nValue = getValue(clo_b08_invalid);
-} else {
-    gValue = 0;
-    bValue = 0;
-    nValue = 0;
-}
-return {
-    default: [nValue, gValue, bValue]
-};
-}
-"""
+import hashlib
+import os
+import tarfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sentinelhub import DataCollection, get_image_dimension, MimeType, \
+    SentinelHubRequest, WebFeatureService
+
+from .date_index import DateIndex
+from .evalscript import build_evalscript, input_ids
+from .product_id import parse_product_id, parse_product_ids
+from .response_cache import request_key
+from .tracing import trace_span
+
+# folder the Sentinel Hub responses are written to
+DATA_FOLDER = '/tmp/mosaic_tests'
+
+# number of WFS catalog queries run at once
+DEFAULT_QUERY_WORKERS = 4
+
+# most process API inputs (time intervals) of one preview request, the
+# closest clusters of dates are merged beyond it
+MAX_PREVIEW_INPUTS = 8
+
 
 def absolute_to_relative_orbit(absolute_orbit, sat):
     '''
@@ -140,23 +45,109 @@ def absolute_to_relative_orbit(absolute_orbit, sat):
     return (absolute_orbit + adj) % 143
 
 
-def get_dates_by_orbit(bbox, start_date, end_date, max_cc, target_orbit, config):
+def absolute_to_relative_orbits(absolute_orbits, sats):
     '''
-    For a given bounding box, query Sentinel 2 imagery collection dates between
-    two dates (start/end_date) that match a specified list of relative orbits
-    and have a maximum cloud cover proportion.
+    Vectorized absolute_to_relative_orbit: translate arrays of absolute orbit
+    numbers and satellite codes ('2A' or '2B') to relative orbit numbers in
+    one operation.
 
-    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
-    * start_date and end_date are date strings formatted as yyyy-mm-dd
-    * max_cc is the maximum allowed cloud cover (0-1 scale)
-    * target_orbit is a list containing relative orbit numbers to be included
-    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * absolute_orbits is an array-like of integer absolute orbits
+    * sats is an array-like of satellite codes of the same length
+
+    Returns an integer numpy array of relative orbits
     '''
-    assert target_orbit is not None, "target_orbit must be specified"
+    absolute_orbits = np.asarray(absolute_orbits, dtype=np.int64)
+    sats = np.asarray(sats)
+    assert absolute_orbits.shape == sats.shape, \
+        'absolute_orbits and sats must have the same length'
 
-    # convert target_orbit to list if just a single orbit
-    if type(target_orbit) is int:
-        target_orbit = [target_orbit]
+    is_2a = sats == '2A'
+    assert np.all(is_2a | (sats == '2B')), \
+        f'Unknown satellites: {sorted(set(sats[~is_2a & (sats != "2B")]))}'
+    adj = np.where(is_2a, -140, -26)
+
+    return (absolute_orbits + adj) % 143
+
+
+def annotate_relative_orbits(scenes):
+    '''
+    Set the relative_orbit of every scene record in a result table (a list of
+    dicts with absolute_orbit and sat keys) with one vectorized conversion.
+    The records are updated in place and returned.
+    '''
+    if len(scenes) == 0:
+        return scenes
+
+    relative_orbits = absolute_to_relative_orbits(
+        [scene['absolute_orbit'] for scene in scenes],
+        [scene['sat'] for scene in scenes]
+    )
+    for scene, relative_orbit in zip(scenes, relative_orbits.tolist()):
+        scene['relative_orbit'] = relative_orbit
+
+    return scenes
+
+
+def scene_record(tile_info, product):
+    '''
+    Build a scene record without its relative orbit from a WFS tile info
+    feature and its parsed product ID (see product_id.parse_product_id)
+    '''
+    return {
+        'product_id': product.product_id,
+        # acquisition date
+        'date': tile_info['properties']['date'],
+        # which satellite? 2A or 2B
+        'sat': product.sat,
+        # absolute orbit is buried in ID after _A string
+        'absolute_orbit': product.absolute_orbit,
+        'relative_orbit': None,
+        'tile': product.tile,
+        'cloud_cover': tile_info['properties'].get('cloudCoverPercentage')
+    }
+
+
+def parse_scene(tile_info):
+    '''
+    Parse a single WFS tile info feature into a scene record: a dict with the
+    product ID, acquisition date, satellite, absolute and relative orbit, tile
+    and cloud cover percentage.
+    '''
+    scene = scene_record(tile_info, parse_product_id(tile_info['properties']['id']))
+
+    # convert to relative orbit
+    scene['relative_orbit'] = absolute_to_relative_orbit(scene['absolute_orbit'], scene['sat'])
+
+    return scene
+
+
+def parse_scenes(tile_infos):
+    '''
+    Parse an iterable of WFS tile info features into scene records (see
+    parse_scene), converting the relative orbits of all of them at once
+    '''
+    tile_infos = list(tile_infos)
+    products = parse_product_ids([tile_info['properties']['id'] for tile_info in tile_infos])
+    return annotate_relative_orbits([
+        scene_record(tile_info, product) for tile_info, product in zip(tile_infos, products)
+    ])
+
+
+def query_scenes(bbox, start_date, end_date, max_cc, config,
+                 data_collection=DataCollection.SENTINEL2_L2A, fetcher=None, tracer=None):
+    '''
+    Query the WFS catalog for all Sentinel 2 scenes that intersect a bounding box
+    between two dates (inclusive) and return them as parsed scene records (see
+    parse_scene) in the order returned by the service.
+
+    * fetcher is an optional wfs_fetcher.WfsFetcher that pages the date range
+      concurrently over a pooled session instead of sequentially
+    * tracer is an optional tracing.Tracer that times the query (every page
+      when a fetcher is used)
+    '''
+    if fetcher is not None:
+        return parse_scenes(fetcher.fetch(
+            bbox, start_date, end_date, max_cc, data_collection=data_collection, tracer=tracer))
 
     # define time window
     search_time_interval = (f'{start_date}T00:00:00', f'{end_date}T23:59:59')
@@ -165,39 +156,129 @@ def get_dates_by_orbit(bbox, start_date, end_date, max_cc, target_orbit, config)
     wfs_iterator = WebFeatureService(
         bbox,
         search_time_interval,
-        data_collection=DataCollection.SENTINEL2_L2A,
+        data_collection=data_collection,
         maxcc=max_cc,
         config=config
     )
 
-    # filter down to dates from specified orbit(s)
-    dates = []
-    for tile_info in wfs_iterator:
-        # raw product ID
-        product_id = tile_info['properties']['id']
+    # the iterator pages the service as it is consumed
+    with trace_span(tracer, 'wfs query', start_date=start_date, end_date=end_date):
+        return parse_scenes(wfs_iterator)
 
-        # parse the product ID
-        product_vals = parse.parse(S2_GRANULE_ID_FMT, product_id)
 
-        # acquisition date
-        date = tile_info['properties']['date']
+def month_intervals(year_months):
+    '''
+    Compile a set of (year, month) pairs into the minimal list of disjoint
+    (start, end) yyyy-mm-dd date spans (inclusive) that cover exactly those
+    months. Consecutive months are merged, also across year boundaries.
+    '''
+    # count months since year 0 so consecutive months differ by one
+    month_numbers = sorted({year * 12 + month - 1 for year, month in year_months})
+    assert len(month_numbers) > 0, 'At least one month and year must be selected.'
 
-        # absolute orbit is buried in ID after _A string
-        absolute_orbit = int(product_vals['absolute_orbit'])
+    runs = []
+    for number in month_numbers:
+        if runs and runs[-1][1] == number - 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
 
-        # which satellite? 2A or 2B
-        sat = product_vals['sat']
-        assert sat in ('2A', '2B')
+    intervals = []
+    for first, last in runs:
+        start = dt.date(first // 12, first % 12 + 1, 1)
+        end_year, end_month = last // 12, last % 12 + 1
+        end = dt.date(end_year, end_month, calendar.monthrange(end_year, end_month)[1])
+        intervals.append((start.isoformat(), end.isoformat()))
+
+    return intervals
+
+
+def selection_intervals(months, years):
+    '''
+    Compile a month/year selection (every selected month of every selected
+    year) into disjoint date spans, see month_intervals
+    '''
+    return month_intervals([(year, month) for year in years for month in months])
 
-        # convert to relative orbit
-        relative_orbit = absolute_to_relative_orbit(absolute_orbit, sat)
 
-        if relative_orbit not in target_orbit:
-            continue
+def query_scene_intervals(bbox, intervals, max_cc, config,
+                          data_collection=DataCollection.SENTINEL2_L2A,
+                          max_workers=DEFAULT_QUERY_WORKERS, fetcher=None, tracer=None):
+    '''
+    Query the WFS catalog for the scenes of several disjoint date spans
+    concurrently, see query_scenes.
 
-        # add date if not already added to list
-        if date not in dates:
-            dates.append(date)
+    * intervals is a list of (start, end) yyyy-mm-dd date strings, e.g.
+      created by selection_intervals
+    * max_workers is the number of spans queried at once
+    * fetcher is an optional wfs_fetcher.WfsFetcher, see query_scenes
+    * tracer is an optional tracing.Tracer, see query_scenes
+
+    Returns a list with one list of scene records per interval
+    '''
+    def query(interval):
+        return query_scenes(
+            bbox,
+            start_date=interval[0],
+            end_date=interval[1],
+            max_cc=max_cc,
+            config=config,
+            data_collection=data_collection,
+            fetcher=fetcher,
+            tracer=tracer
+        )
+
+    if len(intervals) == 1:
+        return [query(intervals[0])]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(query, intervals))
+
+
+def get_dates_by_orbit(bbox, start_date, end_date, max_cc, target_orbit, config,
+                       catalog=None, fetcher=None):
+    '''
+    For a given bounding box, query Sentinel 2 imagery collection dates between
+    two dates (start/end_date) that match a specified list of relative orbits
+    and have a maximum cloud cover proportion.
+
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * start_date and end_date are date strings formatted as yyyy-mm-dd
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * target_orbit is a list containing relative orbit numbers to be included
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * catalog is an optional scene_catalog.SceneCatalog used to serve the query
+      from the local cache instead of paging the WFS service
+    * fetcher is an optional wfs_fetcher.WfsFetcher used when there is no
+      catalog, see query_scenes
+    '''
+    assert target_orbit is not None, "target_orbit must be specified"
+
+    # convert target_orbit to list if just a single orbit
+    if type(target_orbit) is int:
+        target_orbit = [target_orbit]
+
+    if catalog is None:
+        scenes = query_scenes(bbox, start_date, end_date, max_cc, config, fetcher=fetcher)
+    else:
+        scenes = catalog.get_scenes(bbox, start_date, end_date, max_cc, config)
+
+    return select_dates_by_orbit(scenes, target_orbit)
+
+
+def select_dates_by_orbit(scenes, target_orbit):
+    '''
+    Return the unique acquisition dates, sorted, of the scene records (see
+    parse_scene) that belong to a list of relative orbits
+
+    * scenes is a list of scene records or a date_index.DateIndex built from
+      them, pass an index when selecting dates from the same scenes many times
+    '''
+    if not isinstance(scenes, DateIndex):
+        scenes = DateIndex(scenes)
+
+    # filter down to dates from specified orbit(s)
+    dates = scenes.orbit_dates(target_orbit)
 
     assert len(dates) > 0, \
         f'No dates available for this bounding box and relative orbit {target_orbit}'
@@ -220,4 +301,221 @@ def filter_dates(dates, months, years):
     assert len(filtered) > 0, \
         'None of supplied dates satisfy desired months/years and maximum cloud coverage.'
 
-    return filtered
\ No newline at end of file
+    return filtered
+
+
+def get_preview_dates(bbox, orbits, months, years, max_cc, config, catalog=None,
+                      fetcher=None, tracer=None):
+    '''
+    Find the acquisition dates to include in a default mosaic preview and the
+    time intervals that cover them.
+
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * orbits is a list of relative orbit numbers
+    * months and years are lists of integer months (1-12) and years
+    * max_cc is the maximum allowed cloud cover (0-1 scale)
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * catalog is an optional scene_catalog.SceneCatalog
+    * fetcher is an optional wfs_fetcher.WfsFetcher used when there is no
+      catalog, see query_scenes
+    * tracer is an optional tracing.Tracer that times the catalog query and
+      date filtering
+
+    Returns a tuple of (list of yyyy-mm-dd dates, list of [start, end] time
+    intervals of the clusters of dates, see get_dates_intervals)
+    '''
+    # only query the catalog for the selected months
+    intervals = selection_intervals(months, years)
+    with trace_span(tracer, 'catalog query', intervals=len(intervals)):
+        if catalog is None:
+            scenes = [
+                scene
+                for interval_scenes in query_scene_intervals(
+                    bbox, intervals, max_cc, config, fetcher=fetcher, tracer=tracer)
+                for scene in interval_scenes
+            ]
+        else:
+            scenes = catalog.get_interval_scenes(bbox, intervals, max_cc, config, tracer=tracer)
+
+    with trace_span(tracer, 'date filtering', scenes=len(scenes)):
+        dates = select_dates_by_orbit(DateIndex(scenes), orbits)
+
+        # filter dates down to desired months/years
+        dates_filt = filter_dates(dates, months=months, years=years)
+
+    return dates_filt, get_dates_intervals(dates_filt)
+
+
+def get_year_span(years):
+    '''
+    Return the (start, end) yyyy-mm-dd date strings of the catalog query that
+    covers a list of years
+    '''
+    first_year, last_year = str(min(years)), str(max(years))
+    return f'{first_year}-01-01', f'{last_year}-12-31'
+
+
+def get_time_interval(start_date, end_date):
+    '''
+    Convert yyyy-mm-dd start and end date strings into the [start, end] time
+    interval of a process API request
+    '''
+    return [dt.datetime.strptime(
+        date, '%Y-%m-%d').date() for date in [start_date, end_date]]
+
+
+def get_dates_intervals(dates, max_intervals=MAX_PREVIEW_INPUTS):
+    '''
+    Return the process API time intervals of a list of yyyy-mm-dd dates: one
+    tight [start, end] interval per run of consecutive months that contain
+    dates (see month_intervals). Sentinel Hub discovers every scene of an
+    interval before the evalscript drops the ones on other dates, so a
+    selection of the same months in several years should not be requested as
+    one interval over all the years in between.
+
+    * max_intervals caps the number of intervals, the runs with the shortest
+      gap between them are merged first
+
+    Returns a list of [start, end] datetime.date intervals in date order
+    '''
+    assert len(dates) > 0, 'At least one date is needed for a time interval.'
+    assert max_intervals > 0, 'At least one interval must be allowed.'
+
+    dates = sorted(set(dates))
+    runs = []
+    for start, end in month_intervals(
+            [(int(date[:4]), int(date[5:7])) for date in dates]):
+        run_dates = [date for date in dates if start <= date <= end]
+        runs.append([run_dates[0], run_dates[-1]])
+
+    while len(runs) > max_intervals:
+        gaps = [
+            get_time_interval(runs[i][1], runs[i + 1][0])
+            for i in range(len(runs) - 1)
+        ]
+        i = min(range(len(gaps)), key=lambda i: gaps[i][1] - gaps[i][0])
+        runs[i:i + 2] = [[runs[i][0], runs[i + 1][1]]]
+
+    return [get_time_interval(start, end) for start, end in runs]
+
+
+def get_preview_evalscript(dates, **options):
+    '''
+    Build the default preview evalscript for a list of allowed acquisition
+    dates (yyyy-mm-dd), keyword options vary the bands, SCL masking, reducer
+    and sample type, see evalscript.build_evalscript. The script reads one
+    input per time interval of get_dates_intervals unless inputs is given.
+    '''
+    options.setdefault('inputs', len(get_dates_intervals(dates)))
+    return build_evalscript(dates, **options)
+
+
+def get_preview_request(evalscript, bbox, time_interval, max_cc, config,
+                        data_folder=DATA_FOLDER, size=None, output_ids=('default',)):
+    '''
+    Build the Sentinel Hub process API request for a mosaic preview that
+    returns a single TIFF named "default". The preview is 512 pixels wide
+    unless a (width, height) size is given.
+
+    * time_interval is a [start, end] interval, or a list of them (see
+      get_dates_intervals). Several intervals are requested as one input each
+      (data fusion), the evalscript must read them by evalscript.input_ids.
+    * output_ids are the evalscript outputs returned as TIFFs, several outputs
+      are returned in one TAR, see extract_outputs
+    '''
+    if size is None:
+        size = (512, get_image_dimension(bbox=bbox, width=512))
+
+    if isinstance(time_interval[0], (list, tuple)):
+        time_intervals = time_interval
+    else:
+        time_intervals = [time_interval]
+
+    if len(time_intervals) == 1:
+        input_data = [
+            SentinelHubRequest.input_data(
+                data_collection=DataCollection.SENTINEL2_L2A,
+                time_interval=time_intervals[0],
+                maxcc=max_cc
+            )
+        ]
+    else:
+        input_data = [
+            SentinelHubRequest.input_data(
+                data_collection=DataCollection.SENTINEL2_L2A,
+                identifier=identifier,
+                time_interval=interval,
+                maxcc=max_cc
+            )
+            for identifier, interval in zip(input_ids(len(time_intervals)), time_intervals)
+        ]
+
+    return SentinelHubRequest(
+        evalscript=evalscript,
+        data_folder=data_folder,
+        input_data=input_data,
+        responses=[
+            SentinelHubRequest.output_response(output_id, MimeType.TIFF)
+            for output_id in output_ids
+        ],
+        bbox=bbox,
+        size=size,
+        config=config
+    )
+
+
+def download_preview(request, cache=None, tracer=None):
+    '''
+    Run a preview request, save the response to disk and return the path to
+    the downloaded file. If a response_cache.ResponseCache is given, an
+    identical earlier request is served from the cache without downloading.
+    A tracing.Tracer times the cache lookup, the process request (Sentinel
+    Hub processing and the transfer) and the disk write separately.
+    '''
+    if cache is not None:
+        key = request_key(request)
+        with trace_span(tracer, 'cache lookup'):
+            cached_path = cache.get(key)
+        if cached_path is not None:
+            return cached_path
+
+    # Sentinel Hub processing and the transfer, the response stays in memory
+    with trace_span(tracer, 'process request') as details:
+        response = request.get_data(save_data=False, decode_data=False)[0]
+        details['bytes'] = len(response.content)
+
+    with trace_span(tracer, 'disk write', bytes=len(response.content)):
+        # writes request.json next to the response too, so the client can
+        # reuse the saved response of an identical request
+        response.to_local()
+        output_file = os.path.join(request.data_folder, request.get_filename_list()[0])
+        if cache is not None:
+            output_file = cache.put(key, output_file)
+
+    return output_file
+
+
+def extract_outputs(path, data_folder=DATA_FOLDER):
+    '''
+    Extract the TIFF of every output of a multi-response (TAR) preview, see
+    get_preview_request. Identical responses share one folder.
+
+    Returns a dict of output id: TIFF path, in the order of the TAR
+    '''
+    folder = os.path.join(
+        data_folder, f'outputs_{hashlib.md5(os.path.abspath(path).encode()).hexdigest()}')
+    os.makedirs(folder, exist_ok=True)
+
+    output_files = {}
+    with tarfile.open(path) as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            # members are named <output id>.tif
+            name = os.path.basename(member.name)
+            output_file = os.path.join(folder, name)
+            with tar.extractfile(member) as source, open(output_file, 'wb') as target:
+                target.write(source.read())
+            output_files[os.path.splitext(name)[0]] = output_file
+
+    return output_files
@@ -0,0 +1,332 @@
+# coding=utf-8
+"""Local stand-in for the Sentinel Hub services used by the plugin.
+
+Implements enough of the OAuth token endpoint, the WFS catalog and the process
+API for sentinel_utils (get_dates_by_orbit, download_preview) and the
+sentinelhub request flow to run offline, with configurable latency and rate
+limiting so request path changes can be benchmarked.
+
+    with MockSentinelHub(latency=0.05) as server:
+        dates = get_dates_by_orbit(
+            bbox, '2020-01-01', '2020-12-31', 0.5, [112], server.config())
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import datetime as dt
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import tifffile
+
+from sentinelhub import DataCollection, SHConfig
+
+# orbit number offsets of absolute_to_relative_orbit
+ORBIT_ADJUSTMENTS = {'2A': -140, '2B': -26}
+
+# first Sentinel 2A orbit and the average number of orbits per day, used to
+# give generated scenes plausible absolute orbit numbers
+FIRST_ORBIT_DATE = dt.date(2015, 6, 23)
+ORBITS_PER_DAY = 14.3
+
+MAX_WFS_FEATURES = 100
+
+
+def absolute_orbit(relative_orbit, sat, date):
+    '''
+    Absolute orbit of a satellite closest to a date that falls on a relative
+    orbit
+    '''
+    estimate = int((date - FIRST_ORBIT_DATE).days * ORBITS_PER_DAY)
+    offset = (relative_orbit - ORBIT_ADJUSTMENTS[sat] - estimate) % 143
+    return estimate + offset
+
+
+def cloud_cover(product_id):
+    '''
+    Deterministic pseudo random cloud cover percentage of a product
+    '''
+    return int(hashlib.md5(product_id.encode()).hexdigest()[:4], 16) % 10000 / 100
+
+
+def generate_scenes(start_date, end_date, relative_orbits, tiles):
+    '''
+    WFS features of every scene between two dates (inclusive dt.date objects).
+    Each relative orbit is revisited every 5 days, alternating between
+    Sentinel 2A and 2B, and covers every tile.
+    '''
+    features = []
+    date = start_date
+    while date <= end_date:
+        for i, relative_orbit in enumerate(relative_orbits):
+            day = date.toordinal() + i
+            if day % 5 != 0:
+                continue
+            sat = '2A' if (day // 5) % 2 == 0 else '2B'
+            orbit = absolute_orbit(relative_orbit, sat, date)
+            for tile in tiles:
+                product_id = (
+                    f'S{sat}_OPER_MSI_L2A_TL_VGS1_{date:%Y%m%d}T201253_'
+                    f'A{orbit:06d}_T{tile}_N02.14'
+                )
+                features.append({
+                    'type': 'Feature',
+                    'geometry': None,
+                    'properties': {
+                        'id': product_id,
+                        'date': date.isoformat(),
+                        'time': '17:01:09',
+                        'path': f's3://sentinel-s2-l2a/tiles/{tile}/{date:%Y/%-m/%-d}/0',
+                        'crs': 'EPSG:32615',
+                        'mbr': '',
+                        'cloudCoverPercentage': cloud_cover(product_id)
+                    }
+                })
+        date += dt.timedelta(days=1)
+
+    return features
+
+
+class MockSentinelHub:
+    '''
+    Threaded HTTP server that mimics the Sentinel Hub OAuth, WFS and process
+    API endpoints on localhost.
+
+    * relative_orbits are the relative orbits scenes are generated for
+    * tiles are the MGRS tiles each scene covers
+    * latency is the number of seconds every response is delayed
+    * max_requests_per_second throttles the server, requests beyond the limit
+      get a 429 response, None disables throttling
+    * port is the port to listen on, a free one by default
+    '''
+
+    def __init__(self, relative_orbits=(112, 69), tiles=('15TVG',), latency=0.0,
+                 max_requests_per_second=None, port=0):
+        self.relative_orbits = list(relative_orbits)
+        self.tiles = list(tiles)
+        self.latency = latency
+        self.max_requests_per_second = max_requests_per_second
+
+        self.requests = []
+        # JSON payloads of the process API requests
+        self.process_payloads = []
+        self._lock = threading.Lock()
+        self._window = []
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def config(self):
+        '''
+        SHConfig that points the sentinelhub package at this server, only
+        usable while the server is running
+        '''
+        config = SHConfig()
+        config.sh_base_url = self.url
+        config.sh_token_url = f'{self.url}/oauth/token'
+        config.sh_client_id = 'mock-client'
+        config.sh_client_secret = 'mock-secret'
+        config.instance_id = 'mock-instance'
+        config.max_wfs_records_per_query = MAX_WFS_FEATURES
+        config.max_download_attempts = 5
+        config.download_sleep_time = 0.1
+        return config
+
+    def start(self):
+        '''
+        Serve in a background thread. While running, the Sentinel 2 L2A data
+        collection points at this server because sentinelhub prefers a
+        collection's service URL over SHConfig.sh_base_url, and the OAuth
+        client accepts its plain http token endpoint.
+        '''
+        definition = DataCollection.SENTINEL2_L2A.value
+        self._service_url = definition.service_url
+        # collection definitions are frozen dataclasses
+        object.__setattr__(definition, 'service_url', self.url)
+
+        # the OAuth client refuses plain http token endpoints otherwise
+        self._insecure_transport = os.environ.get('OAUTHLIB_INSECURE_TRANSPORT')
+        os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        object.__setattr__(DataCollection.SENTINEL2_L2A.value, 'service_url', self._service_url)
+        if self._insecure_transport is None:
+            os.environ.pop('OAUTHLIB_INSECURE_TRANSPORT', None)
+        else:
+            os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = self._insecure_transport
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def request_count(self, path_prefix):
+        '''
+        Number of requests received for paths starting with a prefix
+        '''
+        with self._lock:
+            return sum(path.startswith(path_prefix) for path in self.requests)
+
+    def _throttled(self):
+        with self._lock:
+            if self.max_requests_per_second is None:
+                return False
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1]
+            if len(self._window) >= self.max_requests_per_second:
+                return True
+            self._window.append(now)
+            return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status, document):
+                self._send(status, json.dumps(document).encode(), 'application/json')
+
+            def _begin(self):
+                path = urlparse(self.path).path
+                with server._lock:
+                    server.requests.append(path)
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._throttled():
+                    self._send(429, b'', 'application/json', {'Retry-After': '1'})
+                    return None
+                return path
+
+            def do_GET(self):
+                path = self._begin()
+                if path is None:
+                    return
+                if not path.startswith('/ogc/wfs/'):
+                    self._send_json(404, {'error': f'unknown path {path}'})
+                    return
+
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                start, end = [
+                    dt.date.fromisoformat(time_string[:10])
+                    for time_string in params['TIME'].split('/')
+                ]
+                max_cc = float(params.get('MAXCC', 100))
+                features = [
+                    feature
+                    for feature in generate_scenes(start, end, server.relative_orbits, server.tiles)
+                    if feature['properties']['cloudCoverPercentage'] <= max_cc
+                ]
+
+                offset = int(params.get('FEATURE_OFFSET', 0))
+                page_size = min(int(params.get('MAXFEATURES', MAX_WFS_FEATURES)), MAX_WFS_FEATURES)
+                self._send_json(200, {
+                    'type': 'FeatureCollection',
+                    'features': features[offset:offset + page_size]
+                })
+
+            def do_POST(self):
+                path = self._begin()
+                if path is None:
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+                if path == '/oauth/token':
+                    self._send_json(200, {
+                        'access_token': 'mock-token',
+                        'token_type': 'Bearer',
+                        'expires_in': 3600,
+                        'expires_at': time.time() + 3600
+                    })
+                elif path == '/api/v1/process':
+                    if self.headers.get('Authorization') != 'Bearer mock-token':
+                        self._send_json(401, {'error': 'unauthorized'})
+                        return
+                    payload = json.loads(body)
+                    with server._lock:
+                        server.process_payloads.append(payload)
+                    output = payload['output']
+                    responses = output.get('responses', [])
+                    identifiers = [response['identifier'] for response in responses]
+
+                    # raw band requests (band_cube) return 4 bands per allowed
+                    # date, every value the date's day of the year, and the
+                    # dates as userdata
+                    dates = re.search(r'allowedDates = \[(.*?)\]', payload['evalscript'])
+                    dates = json.loads(f'[{dates.group(1)}]') if dates else []
+                    if 'userdata' in identifiers:
+                        image = np.repeat(
+                            [dt.date.fromisoformat(date).timetuple().tm_yday for date in dates], 4)
+                        image = np.broadcast_to(
+                            image.astype(np.uint16),
+                            (output['height'], output['width'], len(image)))
+                    else:
+                        image = np.zeros((output['height'], output['width'], 3), dtype=np.uint16)
+                    tiff = io.BytesIO()
+                    tifffile.imwrite(tiff, image)
+
+                    if len(responses) <= 1:
+                        self._send(200, tiff.getvalue(), 'image/tiff')
+                        return
+
+                    # several responses come back as a TAR of <id>.tif files
+                    # and <id>.json user data
+                    archive = io.BytesIO()
+                    with tarfile.open(fileobj=archive, mode='w') as tar:
+                        for identifier in identifiers:
+                            if identifier == 'userdata':
+                                content = json.dumps({'dates': dates}).encode()
+                                info = tarfile.TarInfo('userdata.json')
+                            else:
+                                content = tiff.getvalue()
+                                info = tarfile.TarInfo(f'{identifier}.tif')
+                            info.size = len(content)
+                            tar.addfile(info, io.BytesIO(content))
+                    self._send(200, archive.getvalue(), 'application/x-tar')
+                else:
+                    self._send_json(404, {'error': f'unknown path {path}'})
+
+        return Handler
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""Asyncio order engine test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester import async_orders
+from SentinelMosaicTester.async_orders import AsyncOrderClient
+from SentinelMosaicTester.response_cache import ResponseCache
+from SentinelMosaicTester.sentinel_utils import get_preview_dates, query_scenes
+from SentinelMosaicTester.test.mock_sentinel_hub import MockSentinelHub
+
+
+@unittest.skipIf(async_orders.aiohttp is None, 'the asyncio engine needs aiohttp')
+class AsyncOrdersTest(unittest.TestCase):
+    """Test orders run end to end on one event loop against the mock server."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.server = MockSentinelHub(relative_orbits=[112, 69], tiles=['15TVG', '15TWG']).start()
+        self.config = self.server.config()
+        self.bbox = BBox(bbox=[-93.1, 45.0, -93.0, 45.1], crs=CRS.WGS84)
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.server.stop()
+        self.folder.cleanup()
+
+    def run_client(self, orders):
+        """Run order_preview keyword arguments concurrently on one client."""
+        async def run():
+            async with AsyncOrderClient(
+                    self.config,
+                    cache=ResponseCache(os.path.join(self.folder.name, 'cache')),
+                    data_folder=os.path.join(self.folder.name, 'data')) as client:
+                return await asyncio.gather(*[client.order_preview(**order) for order in orders])
+
+        return asyncio.run(run())
+
+    def test_query_scenes(self):
+        """Test WFS pages are followed like the blocking query."""
+        async def run():
+            async with AsyncOrderClient(self.config) as client:
+                return await client.query_scenes(self.bbox, '2020-01-01', '2020-12-31', 1.0)
+
+        scenes = asyncio.run(run())
+        # two orbits of two tiles every 5 days, more than one 100 feature page
+        self.assertGreater(len(scenes), 200)
+        self.assertEqual(
+            sorted(scenes, key=lambda scene: (scene['date'], scene['tile'])),
+            sorted(query_scenes(self.bbox, '2020-01-01', '2020-12-31', 1.0, self.config),
+                   key=lambda scene: (scene['date'], scene['tile'])))
+
+    def test_order_preview(self):
+        """Test orders share one token, select the same dates and repeat orders are cached."""
+        orders = [
+            {'bbox': self.bbox, 'orbits': [112], 'months': [6, 7], 'years': [2020],
+             'max_cc': 1.0, 'with_dates': True},
+            {'bbox': self.bbox, 'orbits': [69], 'months': [6], 'years': [2020],
+             'max_cc': 1.0, 'with_dates': True, 'evalscript_options': {'reducer': 'max'}},
+        ]
+        results = self.run_client(orders)
+
+        for order, (output_file, dates) in zip(orders, results):
+            self.assertTrue(os.path.exists(output_file))
+            expected_dates, _ = get_preview_dates(
+                order['bbox'], order['orbits'], order['months'], order['years'],
+                order['max_cc'], self.config)
+            self.assertEqual(dates, expected_dates)
+        self.assertEqual(self.server.request_count('/oauth/token'), 1)
+        self.assertEqual(self.server.request_count('/api/v1/process'), 2)
+        self.assertIn('max of the valid samples',
+                      ''.join(payload['evalscript'] for payload in self.server.process_payloads))
+
+        self.run_client(orders[:1])
+        self.assertEqual(self.server.request_count('/api/v1/process'), 2)
+
+    def test_throttling(self):
+        """Test rate limited WFS and process requests are retried."""
+        async def run():
+            async with AsyncOrderClient(
+                    self.config, data_folder=self.folder.name, max_retries=6) as client:
+                # sentinelhub fetches the token, only the engine's own requests
+                # are throttled
+                await client.auth_headers()
+                self.server.max_requests_per_second = 2
+                return await asyncio.gather(*[
+                    client.order_preview(self.bbox, [orbit], [6], [2020], 1.0)
+                    for orbit in (112, 69)
+                ])
+
+        output_files = asyncio.run(run())
+
+        self.assertTrue(all(os.path.exists(output_file) for output_file in output_files))
+        # a token, then a WFS query and a process request per order
+        self.assertGreater(len(self.server.requests), 1 + 2 * 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(AsyncOrdersTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,120 @@
+# coding=utf-8
+"""Band cube test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import datetime as dt
+
+import numpy as np
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.band_cube import BandCube
+from SentinelMosaicTester.compositor import composite_stack
+from SentinelMosaicTester.test.mock_sentinel_hub import MockSentinelHub
+
+DATES = ['2020-06-01', '2020-06-04', '2020-07-01', '2021-06-01']
+ORBITS = [[112], [69], [112], [112]]
+
+
+class BandCubeTest(unittest.TestCase):
+    """Test selections are composited from the cube on disk."""
+
+    def setUp(self):
+        """Write a small cube to a temporary folder."""
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(1, 3000, size=(len(DATES), 4, 5, 6)).astype(np.uint16)
+        self.data[:, 3] = 4
+        np.save(os.path.join(self.folder, 'cube.npy'), self.data)
+        with open(os.path.join(self.folder, 'cube.json'), 'w') as f:
+            json.dump({'dates': DATES, 'requested_dates': DATES + ['2020-08-01'],
+                       'orbits': ORBITS, 'fetched_orbits': [69, 112]}, f)
+
+    def tearDown(self):
+        """Remove the temporary folder."""
+        shutil.rmtree(self.folder)
+
+    def test_covers(self):
+        """Test coverage is checked against the requested dates and fetched orbits."""
+        cube = BandCube(self.folder)
+        self.assertTrue(cube.covers([{'date': '2020-08-01'}, {'date': '2020-06-01'}], [112]))
+        self.assertFalse(cube.covers([{'date': '2019-06-01'}], [112]))
+        # 2020-06-01 was fetched, but not for orbit 26
+        self.assertFalse(cube.covers([{'date': '2020-06-01'}], [112, 26]))
+
+        del cube.metadata['fetched_orbits']
+        self.assertFalse(cube.covers([{'date': '2020-06-01'}], [112]))
+
+    def test_select(self):
+        """Test scenes are selected by orbit, month and year."""
+        cube = BandCube(self.folder)
+        self.assertEqual(cube.select([112], [6, 7], [2020]), [0, 2])
+        self.assertEqual(cube.select([112, 69], [6], [2020, 2021]), [0, 1, 3])
+        with self.assertRaises(AssertionError):
+            cube.select([69], [7], [2020])
+
+    def test_composite(self):
+        """Test the composite matches compositing the selected scenes."""
+        cube = BandCube(self.folder)
+        np.testing.assert_array_equal(
+            cube.composite([112], [6, 7], [2020]),
+            composite_stack(self.data[[0, 2]]))
+
+    def test_year_counts(self):
+        """Test valid samples are counted for cumulative sets of years."""
+        cube = BandCube(self.folder)
+        counts = cube.year_counts([112], [6, 7], [2020, 2021])
+        self.assertEqual(counts.shape, (2, 5, 6))
+        self.assertTrue((counts[0] == 1).all())
+        self.assertTrue((counts[1] == 3).all())
+
+    def test_fetch_in_chunks(self):
+        """Test a cube is fetched a few dates per request and replaces the old one."""
+        old_cube = BandCube(self.folder)
+        scenes = [
+            {'date': f'2020-06-{day:02d}', 'relative_orbit': 112 if day % 2 else 69}
+            for day in range(1, 8)
+        ]
+        with MockSentinelHub() as server:
+            fractions = []
+            cube = BandCube.fetch(
+                self.folder, BBox(bbox=[-93.1, 45.0, -93.0, 45.1], crs=CRS.WGS84), scenes,
+                max_cc=0.5, config=server.config(), size=(6, 5), chunk_dates=3,
+                progress=fractions.append, orbits=[112, 69, 26])
+            self.assertEqual(server.request_count('/api/v1/process'), 3)
+
+        self.assertEqual(fractions, [1 / 3, 2 / 3, 1])
+        self.assertEqual(cube.dates, [scene['date'] for scene in scenes])
+        self.assertEqual(cube.orbits[0], [112])
+        # orbits without scenes are covered too, they need not be fetched again
+        self.assertTrue(cube.covers(scenes, [26, 69, 112]))
+        self.assertEqual(cube.data.shape, (7, 4, 5, 6))
+        days = [dt.date.fromisoformat(scene['date']).timetuple().tm_yday for scene in scenes]
+        np.testing.assert_array_equal(cube.data[:, 0, 0, 0], days)
+
+        # the new cube has its own data file, the old one was unaffected
+        self.assertEqual(BandCube(self.folder).dates, cube.dates)
+        self.assertNotIn('cube.npy', os.listdir(self.folder))
+        np.testing.assert_array_equal(old_cube.data, self.data)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BandCubeTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""Batch command line test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import csv
+import datetime as dt
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester import async_orders
+from SentinelMosaicTester.cli import check_file_names, run_batch, run_batch_async, \
+    write_summary
+from SentinelMosaicTester.test.mock_sentinel_hub import MockSentinelHub
+
+
+def fake_preview_dates(bbox, orbits, months, years, max_cc, config, catalog=None):
+    """Fail for the AOI without scenes."""
+    assert bbox != 'empty', 'No dates available'
+    return ['2020-06-01', '2020-07-01'], [[dt.date(2020, 6, 1), dt.date(2020, 7, 1)]]
+
+
+class CliTest(unittest.TestCase):
+    """Test AOIs are previewed in bulk and summarized."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.TemporaryDirectory()
+        self.response = os.path.join(self.folder.name, 'response.tiff')
+        with open(self.response, 'w') as f:
+            f.write('tiff')
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.folder.cleanup()
+
+    def test_run_batch(self):
+        """Test one GeoTIFF per AOI and failures recorded in the summary."""
+        output_folder = os.path.join(self.folder.name, 'previews')
+        aois = [('plot 1', 'bbox'), ('plot/2', 'empty')]
+        with mock.patch('SentinelMosaicTester.cli.get_preview_dates',
+                        side_effect=fake_preview_dates), \
+                mock.patch('SentinelMosaicTester.cli.get_preview_request'), \
+                mock.patch('SentinelMosaicTester.cli.download_preview',
+                           return_value=self.response):
+            rows = run_batch(aois, [112], [6, 7], [2020], 0.2, None, output_folder, max_workers=2)
+
+        self.assertEqual([row['status'] for row in rows], ['ok', 'failed'])
+        self.assertEqual(rows[0]['file'], os.path.join(output_folder, 'plot_1.tif'))
+        self.assertTrue(os.path.exists(rows[0]['file']))
+        self.assertEqual(rows[0]['n_dates'], 2)
+        self.assertIn('No dates available', rows[1]['error'])
+
+        summary = write_summary(os.path.join(output_folder, 'summary.csv'), rows)
+        with open(summary) as f:
+            summary_rows = list(csv.DictReader(f))
+        self.assertEqual([row['aoi'] for row in summary_rows], ['plot 1', 'plot/2'])
+
+    def test_file_name_clash(self):
+        """Test AOIs whose ids map to one file name are refused before ordering."""
+        check_file_names([('plot 1', 'bbox'), ('plot/2', 'bbox')])
+        for aois in [[('plot/2', 'bbox'), ('plot_2', 'bbox')],
+                     [('Plot 2', 'bbox'), ('plot_2', 'bbox')]]:
+            with self.assertRaises(AssertionError):
+                run_batch(aois, [112], [6], [2020], 0.2, None, self.folder.name)
+
+    @unittest.skipIf(async_orders.aiohttp is None, 'the asyncio engine needs aiohttp')
+    def test_run_batch_async(self):
+        """Test the asyncio engine writes the same files and summary rows."""
+        output_folder = os.path.join(self.folder.name, 'previews')
+        bbox = BBox(bbox=[-93.1, 45.0, -93.0, 45.1], crs=CRS.WGS84)
+        with MockSentinelHub(relative_orbits=[112, 69]) as server:
+            rows = run_batch_async(
+                [('plot 1', bbox), ('plot 2', bbox)], [112], [6, 7], [2020], 1.0,
+                server.config(), output_folder, evalscript_options={'reducer': 'max'},
+                data_folder=self.folder.name)
+
+            self.assertEqual([row['status'] for row in rows], ['ok', 'ok'])
+            self.assertEqual(rows[0]['file'], os.path.join(output_folder, 'plot_1.tif'))
+            self.assertTrue(os.path.exists(rows[0]['file']))
+            # orbit 112 is revisited every 5 days
+            self.assertEqual(rows[0]['n_dates'], len(rows[0]['dates'].split()))
+            self.assertGreaterEqual(rows[0]['n_dates'], 12)
+            self.assertIn('max of the valid samples', server.process_payloads[0]['evalscript'])
+
+            # the mock server has no scenes of other orbits
+            rows = run_batch_async(
+                [('plot 3', bbox)], [10], [6], [2020], 1.0, server.config(), output_folder,
+                data_folder=self.folder.name)
+        self.assertEqual(rows[0]['status'], 'failed')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CliTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
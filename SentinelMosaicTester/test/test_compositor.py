@@ -0,0 +1,103 @@
+# coding=utf-8
+"""Local compositor test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import unittest
+
+import numpy as np
+
+from SentinelMosaicTester.compositor import INVALID_SCL_CLASSES, composite_median, \
+    composite_stack, cumulative_year_counts, minimal_year_set, year_set_coverage
+
+
+def evaluate_pixel(b08, b03, b02, scl):
+    """Straight port of the preview evalscript's evaluatePixel."""
+    valid, invalid = [], []
+    for sample in zip(b08, b03, b02, scl):
+        if sample[0] > 0 and sample[1] > 0 and sample[2] > 0:
+            if sample[3] in INVALID_SCL_CLASSES:
+                invalid.append(sample[:3])
+            else:
+                valid.append(sample[:3])
+
+    samples = valid or invalid
+    if not samples:
+        return [0, 0, 0]
+    return [sorted(band)[len(band) // 2] for band in zip(*samples)]
+
+
+class CompositorTest(unittest.TestCase):
+    """Test the NumPy compositor matches the evalscript."""
+
+    def test_matches_evalscript(self):
+        """Test every pixel against a port of the evalscript."""
+        rng = np.random.default_rng(0)
+        shape = (7, 9, 11)
+        b08, b03, b02 = [rng.integers(0, 4, shape, dtype=np.uint16) * 1000 for _ in range(3)]
+        scl = rng.integers(0, 12, shape, dtype=np.uint8)
+
+        composite = composite_median(b08, b03, b02, scl, chunk_rows=4)
+
+        for y in range(shape[1]):
+            for x in range(shape[2]):
+                expected = evaluate_pixel(b08[:, y, x], b03[:, y, x], b02[:, y, x], scl[:, y, x])
+                self.assertEqual(list(composite[:, y, x]), expected)
+
+    def test_composite_stack(self):
+        """Test a (time, band, y, x) stack composites the same way."""
+        rng = np.random.default_rng(1)
+        stack = rng.integers(1, 100, (5, 4, 3, 3), dtype=np.uint16)
+        stack[:, 3] = 4  # vegetation, always valid
+        np.testing.assert_array_equal(
+            composite_stack(stack),
+            composite_median(stack[:, 0], stack[:, 1], stack[:, 2], stack[:, 3]))
+        np.testing.assert_array_equal(
+            composite_stack(stack)[0], np.sort(stack[:, 0], axis=0)[2])
+
+    def test_cumulative_year_counts(self):
+        """Test valid samples are counted from the most recent year back."""
+        dates = ['2019-06-01', '2020-06-01', '2020-07-01', '2021-06-01', '2022-06-01']
+        stack = np.ones((5, 4, 1, 2), dtype=np.uint16)
+        stack[:, 3] = 4
+        stack[2, 3, 0, 0] = 9  # cloudy
+        stack[3, 0, 0, 1] = 0  # no data
+
+        counts = cumulative_year_counts(stack, dates, [2019, 2020, 2021], chunk_rows=1)
+        self.assertEqual(counts.dtype, np.uint16)
+        self.assertEqual(counts[:, 0, 0].tolist(), [1, 2, 3])
+        self.assertEqual(counts[:, 0, 1].tolist(), [0, 2, 3])
+
+    def test_minimal_year_set(self):
+        """Test the fewest recent years that reach a threshold everywhere."""
+        counts = np.array([[[3, 0]], [[5, 2]], [[6, 4]]], dtype=np.uint16)
+        years = [2019, 2020, 2021]
+        np.testing.assert_array_equal(year_set_coverage(counts, 2), [0.5, 1, 1])
+        self.assertEqual(minimal_year_set(counts, years, 2), [2020, 2021])
+        self.assertEqual(minimal_year_set(counts, years, 4), [2019, 2020, 2021])
+        self.assertIsNone(minimal_year_set(counts, years, 5))
+        # half of the pixels is enough
+        self.assertEqual(minimal_year_set(counts, years, 3, coverage=0.5), [2021])
+
+    def test_minimal_year_set_tolerance(self):
+        """Test a single pixel that never clears does not rule out every year set."""
+        counts = np.full((2, 10, 10), 6, dtype=np.uint16)
+        counts[0] = 3
+        counts[:, 0, 0] = 0  # permanently cloudy
+        self.assertEqual(minimal_year_set(counts, [2020, 2021], 5), [2020, 2021])
+        self.assertIsNone(minimal_year_set(counts, [2020, 2021], 5, coverage=1))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CompositorTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
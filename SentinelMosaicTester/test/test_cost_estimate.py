@@ -0,0 +1,80 @@
+# coding=utf-8
+"""Cost estimator test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.cost_estimate import estimate_preview_cost, \
+    format_cost_estimate, processing_units
+from SentinelMosaicTester.scene_catalog import SceneCatalog
+from SentinelMosaicTester.test.test_scene_catalog import fake_scenes
+
+
+class CostEstimateTest(unittest.TestCase):
+    """Test dates, scenes and processing units are estimated offline."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.TemporaryDirectory()
+        self.catalog = SceneCatalog(os.path.join(self.folder.name, 'catalog.sqlite'))
+        self.bbox = BBox(bbox=[-90.1, 45.0, -90.0, 45.1], crs=CRS.WGS84)
+        patcher = mock.patch(
+            'SentinelMosaicTester.cost_estimate.suggest_orbits', return_value=[(103, 1.0)])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.folder.cleanup()
+
+    def test_processing_units(self):
+        """Test output size, band and sample multipliers."""
+        self.assertAlmostEqual(processing_units(512, 512, 1, n_bands=3), 1.0)
+        self.assertAlmostEqual(processing_units(512, 512, 10), 40 / 3)
+        # tiny outputs are billed 1% of a unit
+        self.assertAlmostEqual(processing_units(10, 10, 1, n_bands=3), 0.01)
+
+    def test_predicted(self):
+        """Test uncached months are predicted from the covering orbits."""
+        estimate = estimate_preview_cost(self.bbox, [103, 69], [6], [2020], 0.5)
+        self.assertEqual(estimate['predicted_dates'], 6)
+        self.assertEqual(estimate['dates'], 6)
+        self.assertEqual(estimate['tiles'], 0)
+        self.assertIn('6 dates predicted', format_cost_estimate(estimate))
+
+    def test_cached(self):
+        """Test cached months are counted from the scene catalog."""
+        with mock.patch('SentinelMosaicTester.sentinel_utils.query_scenes',
+                        side_effect=fake_scenes):
+            self.catalog.get_scenes(self.bbox, '2020-06-01', '2020-06-30', 0.5, None)
+
+        estimate = estimate_preview_cost(
+            self.bbox, [103], [6, 7], [2020], 0.5, catalog=self.catalog)
+        # June from the catalog, July predicted
+        self.assertEqual(estimate['scenes'], 30 + 6)
+        self.assertEqual(estimate['dates'], 36)
+        self.assertEqual(estimate['tiles'], 1)
+        self.assertEqual(estimate['requests'], 1)
+        self.assertGreater(estimate['processing_units'], 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CostEstimateTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
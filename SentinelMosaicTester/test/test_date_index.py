@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Date index test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import unittest
+
+from SentinelMosaicTester.date_index import DateIndex
+from SentinelMosaicTester.sentinel_utils import select_dates_by_orbit
+
+
+def scene(date, relative_orbit, tile='15TVG'):
+    return {'date': date, 'relative_orbit': relative_orbit, 'tile': tile}
+
+
+# in WFS order: newest first, one date on two tiles
+SCENES = [
+    scene('2020-08-02', 69),
+    scene('2020-07-15', 112, '15TVG'),
+    scene('2020-07-15', 112, '15TWG'),
+    scene('2020-06-30', 69),
+    scene('2019-07-10', 112),
+    scene('2020-06-30', 69, '15TWG'),
+]
+
+
+class DateIndexTest(unittest.TestCase):
+    """Test scene dates are deduplicated, sorted and queried."""
+
+    def test_index(self):
+        """Test dates are unique and sorted with their tiles and orbits."""
+        index = DateIndex(SCENES)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(
+            index.dates, ['2019-07-10', '2020-06-30', '2020-07-15', '2020-08-02'])
+        self.assertEqual(index.tiles['2020-07-15'], ['15TVG', '15TWG'])
+        self.assertEqual(index.orbits['2020-06-30'], [69])
+
+    def test_queries(self):
+        """Test orbit, date range and month queries."""
+        index = DateIndex(SCENES)
+        self.assertEqual(index.orbit_dates([112]), ['2019-07-10', '2020-07-15'])
+        self.assertEqual(index.orbit_dates(69), ['2020-06-30', '2020-08-02'])
+        self.assertEqual(index.orbit_dates([1]), [])
+        self.assertEqual(
+            index.range_dates('2020-06-30', '2020-07-15'), ['2020-06-30', '2020-07-15'])
+        self.assertEqual(index.range_dates('2020-07-01', '2020-12-31', orbits=[69]), ['2020-08-02'])
+        self.assertEqual(index.month_dates([7], [2019, 2020]), ['2019-07-10', '2020-07-15'])
+        self.assertEqual(index.month_dates([6, 7, 8], [2020], orbits=[69]), ['2020-06-30', '2020-08-02'])
+
+    def test_select_dates_by_orbit(self):
+        """Test scene lists and indexes give the same sorted dates."""
+        self.assertEqual(select_dates_by_orbit(SCENES, [112, 69]), DateIndex(SCENES).dates)
+        self.assertEqual(select_dates_by_orbit(DateIndex(SCENES), [112]), ['2019-07-10', '2020-07-15'])
+        with self.assertRaises(AssertionError):
+            select_dates_by_orbit(SCENES, [1])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DateIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,268 @@
+# coding=utf-8
+"""Evalscript builder test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import numpy as np
+
+from SentinelMosaicTester.compositor import cumulative_year_counts
+from SentinelMosaicTester.evalscript import DEFAULT_STATISTICS, build_evalscript, \
+    build_year_counts_evalscript, compile_evalscript
+from SentinelMosaicTester.sentinel_utils import get_preview_evalscript
+
+
+class EvalscriptTest(unittest.TestCase):
+    """Test evalscripts are composed from parameters and cached."""
+
+    def test_default(self):
+        """Test the default preview script."""
+        script = get_preview_evalscript(['2020-06-01', '2020-06-06'])
+        self.assertIn('var allowedDates = ["2020-06-01", "2020-06-06"];', script)
+        self.assertIn('bands: ["B08", "B03", "B02", "SCL"]', script)
+        self.assertIn('sampleType: SampleType.UINT16', script)
+        self.assertIn('var EXCLUDED_SCL = [0, 1, 0, 1, 0, 0, 0, 0, 1, 1, 1, 1];', script)
+        self.assertIn('var k = Math.floor(n / 2);', script)
+        self.assertEqual(script, build_evalscript(['2020-06-01', '2020-06-06']))
+
+    def test_variants(self):
+        """Test bands, SCL classes, reducer and sample type are applied."""
+        script = build_evalscript(
+            ['2020-06-01'], bands=['B04', 'B03'], exclude_scl=[3, 8, 9, 7],
+            reducer='first_quartile', sample_type='FLOAT32')
+        self.assertIn('bands: ["B04", "B03", "SCL"]', script)
+        self.assertIn('bands: 2,', script)
+        self.assertIn('sampleType: SampleType.FLOAT32', script)
+        self.assertIn('var EXCLUDED_SCL = [0, 0, 0, 1, 0, 0, 0, 1, 1, 1, 0, 0];', script)
+        self.assertIn('var k = Math.floor(n / 4);', script)
+        self.assertIn('default: [select(buffers[0], n, k), select(buffers[1], n, k)]', script)
+
+        with self.assertRaises(AssertionError):
+            build_evalscript(['2020-06-01'], reducer='mode')
+        with self.assertRaises(AssertionError):
+            build_evalscript(['2020-06-01'], bands=['B02', 'SCL'])
+
+    def test_statistics(self):
+        """Test every statistic gets its own output."""
+        script = build_evalscript(['2020-06-01'], statistics=DEFAULT_STATISTICS)
+        self.assertNotIn('id: "default"', script)
+        self.assertIn('id: "first_quartile",\n        bands: 3,', script)
+        self.assertIn('id: "valid_count",\n        bands: 1,\n        sampleType: SampleType.UINT16', script)
+        self.assertIn('invalid_fraction: [nInvalid / (nValid + nInvalid)]', script)
+        self.assertNotEqual(script, build_evalscript(['2020-06-01']))
+
+        with self.assertRaises(AssertionError):
+            build_evalscript(['2020-06-01'], statistics=['median', 'mode'])
+
+    def test_year_counts(self):
+        """Test the year count output has one band per year, most recent first."""
+        script = build_year_counts_evalscript(['2020-06-01'], [2019, 2021, 2020])
+        self.assertIn('id: "year_counts",\n        bands: 3,\n        sampleType: SampleType.UINT16', script)
+        self.assertIn('var YEARS = [2021, 2020, 2019];', script)
+
+        with self.assertRaises(AssertionError):
+            build_year_counts_evalscript(['2020-06-01'], [])
+
+    def test_inputs(self):
+        """Test a script of several inputs declares and filters each one."""
+        dates = ['2019-06-01', '2020-06-01']
+        script = get_preview_evalscript(dates)
+        self.assertIn('datasource: "l2a_0",\n    bands: ["B08", "B03", "B02", "SCL"]', script)
+        self.assertIn('datasource: "l2a_1"', script)
+        self.assertIn('var INPUTS = ["l2a_0", "l2a_1"];', script)
+        self.assertIn('function preProcessScenes(collections)', script)
+        self.assertNotIn('function filterScenes', script)
+        self.assertEqual(script, build_evalscript(dates, inputs=2))
+
+        script = get_preview_evalscript(['2020-06-01', '2020-07-01'])
+        self.assertNotIn('datasource', script)
+        self.assertIn('function filterScenes', script)
+
+    def test_cached(self):
+        """Test equivalent parameters share one compiled template."""
+        compile_evalscript.cache_clear()
+        first = build_evalscript(['2020-06-01'], exclude_scl=[9, 3])
+        second = build_evalscript(['2020-06-01'], exclude_scl=(3, 9, 3))
+        build_evalscript(['2021-06-01'], exclude_scl=[3, 9])
+        self.assertEqual(first, second)
+        self.assertEqual(compile_evalscript.cache_info().misses, 1)
+        self.assertEqual(compile_evalscript.cache_info().hits, 2)
+
+    @unittest.skipUnless(shutil.which('node'), 'node is not installed')
+    def test_evaluate_pixel(self):
+        """Test the generated reducer against sorting, for short and long stacks."""
+        rng = random.Random(0)
+        pixels = []
+        for n_samples in [0, 1, 2, 3, 16, 17, 40, 300]:
+            pixels.append([
+                {'B08': rng.randint(0, 50), 'B03': rng.randint(0, 5000),
+                 'B02': rng.randint(0, 5000), 'SCL': rng.choice([4, 5, 9])}
+                for _ in range(n_samples)
+            ])
+        # only invalid samples
+        pixels.append([{'B08': 7, 'B03': 4, 'B02': 8, 'SCL': 9}, {'B08': 5, 'B03': 2, 'B02': 1, 'SCL': 3}])
+
+        def expected(pixel, k_of_n):
+            stack = [s for s in pixel if s['B08'] > 0 and s['B03'] > 0 and s['B02'] > 0]
+            valid = [s for s in stack if s['SCL'] not in (1, 3, 8, 9, 10, 11)]
+            stack = valid or stack
+            if not stack:
+                return [0, 0, 0]
+            k = k_of_n(len(stack))
+            return [sorted(s[band] for s in stack)[k] for band in ('B08', 'B03', 'B02')]
+
+        for reducer, k_of_n in [('median', lambda n: n // 2), ('first_quartile', lambda n: n // 4),
+                                ('max', lambda n: n - 1)]:
+            script = build_evalscript(['2020-06-01'], reducer=reducer)
+            with tempfile.NamedTemporaryFile('w', suffix='.js') as f:
+                f.write(script)
+                f.write(f"""
+var pixels = {json.dumps(pixels)};
+console.log(JSON.stringify(pixels.map(function (pixel) {{
+    return evaluatePixel(pixel).default;
+}})));
+""")
+                f.flush()
+                output = subprocess.run(
+                    ['node', f.name], capture_output=True, text=True, check=True).stdout
+
+            self.assertEqual(
+                json.loads(output), [expected(pixel, k_of_n) for pixel in pixels], reducer)
+
+        script = build_evalscript(['2020-06-01'], statistics=DEFAULT_STATISTICS)
+        with tempfile.NamedTemporaryFile('w', suffix='.js') as f:
+            f.write(script)
+            f.write(f"""
+var pixels = {json.dumps(pixels)};
+console.log(JSON.stringify(pixels.map(function (pixel) {{
+    return evaluatePixel(pixel);
+}})));
+""")
+            f.flush()
+            output = subprocess.run(
+                ['node', f.name], capture_output=True, text=True, check=True).stdout
+
+        for pixel, statistics in zip(pixels, json.loads(output)):
+            stack = [s for s in pixel if s['B08'] > 0 and s['B03'] > 0 and s['B02'] > 0]
+            n_valid = sum(s['SCL'] not in (1, 3, 8, 9, 10, 11) for s in stack)
+            self.assertEqual(statistics['median'], expected(pixel, lambda n: n // 2))
+            self.assertEqual(statistics['first_quartile'], expected(pixel, lambda n: n // 4))
+            self.assertEqual(statistics['valid_count'], [n_valid])
+            if stack:
+                self.assertAlmostEqual(
+                    statistics['invalid_fraction'][0], 1 - n_valid / len(stack))
+
+    @unittest.skipUnless(shutil.which('node'), 'node is not installed')
+    def test_year_counts_pixel(self):
+        """Test the generated year counts match counting a band cube locally."""
+        rng = np.random.default_rng(0)
+        dates = ['2019-06-01', '2019-07-01', '2020-06-01', '2020-06-11', '2021-06-01', '2021-07-01']
+        stack = rng.integers(0, 3, (len(dates), 4, 4, 5), dtype=np.uint16) * 1000
+        stack[:, 3] = rng.choice([4, 5, 9], (len(dates), 4, 5))
+        pixels = [
+            [dict(zip(('B08', 'B03', 'B02', 'SCL'), map(int, stack[t, :, y, x])))
+             for t in range(len(dates))]
+            for y in range(4) for x in range(5)
+        ]
+
+        script = build_year_counts_evalscript(dates, [2019, 2020, 2021])
+        with tempfile.NamedTemporaryFile('w', suffix='.js') as f:
+            f.write(script)
+            f.write(f"""
+var scenes = {json.dumps(dates)}.map(function (date) {{
+    return {{dateFrom: date + "T10:00:00Z", dateTo: date + "T10:10:00Z"}};
+}});
+var pixels = {json.dumps(pixels)};
+console.log(JSON.stringify(pixels.map(function (pixel) {{
+    return evaluatePixel(pixel, {{orbits: scenes}}).year_counts;
+}})));
+""")
+            f.flush()
+            output = subprocess.run(
+                ['node', f.name], capture_output=True, text=True, check=True).stdout
+
+        counts = cumulative_year_counts(stack, dates, [2019, 2020, 2021])
+        self.assertEqual(json.loads(output), counts.reshape(3, -1).T.tolist())
+
+    @unittest.skipUnless(shutil.which('node'), 'node is not installed')
+    def test_data_fusion_pixel(self):
+        """Test a script of several inputs evaluates their concatenated stacks."""
+        rng = random.Random(0)
+        dates = ['2019-06-01', '2019-06-11', '2020-06-01', '2021-06-01']
+        inputs = [dates[:2], dates[2:3], dates[3:]]
+        scenes = [
+            [{'dateFrom': date + 'T10:00:00Z', 'dateTo': date + 'T10:10:00Z'}
+             for date in input_dates + ['2020-01-01']]
+            for input_dates in inputs
+        ]
+        pixels = [
+            [[{'B08': rng.randint(0, 50), 'B03': rng.randint(0, 5000),
+               'B02': rng.randint(0, 5000), 'SCL': rng.choice([4, 5, 9])}
+              for _ in input_dates]
+             for input_dates in inputs]
+            for _ in range(20)
+        ]
+
+        def run(script, expression):
+            with tempfile.NamedTemporaryFile('w', suffix='.js') as f:
+                f.write(script)
+                f.write(f"""
+var scenes = {json.dumps(scenes)};
+var pixels = {json.dumps(pixels)};
+console.log(JSON.stringify({expression}));
+""")
+                f.flush()
+                return json.loads(subprocess.run(
+                    ['node', f.name], capture_output=True, text=True, check=True).stdout)
+
+        # the scene filter drops the scenes on other dates of every input
+        filtered = run(build_evalscript(dates, inputs=3), """(function () {
+    var collections = {l2a_0: {scenes: {orbits: scenes[0]}},
+                       l2a_1: {scenes: {orbits: scenes[1]}},
+                       l2a_2: {scenes: {orbits: scenes[2]}}};
+    return INPUTS.map(function (id) {
+        return preProcessScenes(collections)[id].scenes.orbits.length;
+    });
+})()""")
+        self.assertEqual(filtered, [2, 1, 1])
+
+        fused = run(build_evalscript(dates, inputs=3), """pixels.map(function (pixel) {
+    return evaluatePixel({l2a_0: pixel[0], l2a_1: pixel[1], l2a_2: pixel[2]}).default;
+})""")
+        single = run(build_evalscript(dates), """pixels.map(function (pixel) {
+    return evaluatePixel([].concat(pixel[0], pixel[1], pixel[2])).default;
+})""")
+        self.assertEqual(fused, single)
+
+        years = [2019, 2020, 2021]
+        fused = run(build_year_counts_evalscript(dates, years, inputs=3), """pixels.map(function (pixel) {
+    var orbits = scenes.map(function (input) { return {orbits: input.slice(0, -1)}; });
+    return evaluatePixel({l2a_0: pixel[0], l2a_1: pixel[1], l2a_2: pixel[2]},
+                         {l2a_0: orbits[0], l2a_1: orbits[1], l2a_2: orbits[2]}).year_counts;
+})""")
+        single = run(build_year_counts_evalscript(dates, years), """pixels.map(function (pixel) {
+    var orbits = [].concat(scenes[0].slice(0, -1), scenes[1].slice(0, -1), scenes[2].slice(0, -1));
+    return evaluatePixel([].concat(pixel[0], pixel[1], pixel[2]), {orbits: orbits}).year_counts;
+})""")
+        self.assertEqual(fused, single)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(EvalscriptTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
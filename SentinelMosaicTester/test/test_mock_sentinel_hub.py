@@ -0,0 +1,132 @@
+# coding=utf-8
+"""Offline request path test against the mock Sentinel Hub server.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.evalscript import DEFAULT_STATISTICS
+from SentinelMosaicTester.sentinel_utils import download_preview, extract_outputs, \
+    get_dates_by_orbit, get_dates_intervals, get_preview_evalscript, get_preview_request, \
+    get_time_interval
+from SentinelMosaicTester.test.mock_sentinel_hub import MockSentinelHub
+from SentinelMosaicTester.wfs_fetcher import WfsFetcher
+
+
+class MockSentinelHubTest(unittest.TestCase):
+    """Test the catalog query and process API flow run offline."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.server = MockSentinelHub(relative_orbits=[112, 69], tiles=['15TVG', '15TWG']).start()
+        self.config = self.server.config()
+        self.bbox = BBox(bbox=[-93.1, 45.0, -93.0, 45.1], crs=CRS.WGS84)
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.server.stop()
+        self.folder.cleanup()
+
+    def test_get_dates_by_orbit(self):
+        """Test paged WFS queries return only the requested orbit."""
+        dates = get_dates_by_orbit(
+            self.bbox, '2020-01-01', '2020-12-31', 1.0, [112], self.config)
+        # one visit every 5 days
+        self.assertEqual(len(dates), 74)
+        # two orbits of two tiles each, 100 features per page
+        self.assertEqual(self.server.request_count('/ogc/wfs/'), 3)
+
+        fetched_dates = get_dates_by_orbit(
+            self.bbox, '2020-01-01', '2020-12-31', 1.0, [112], self.config,
+            fetcher=WfsFetcher(self.config))
+        self.assertEqual(sorted(fetched_dates), sorted(dates))
+
+    def test_download_preview(self):
+        """Test a preview is ordered with an OAuth token and saved."""
+        dates = get_dates_by_orbit(
+            self.bbox, '2020-06-01', '2020-06-30', 1.0, [69], self.config)
+        request = get_preview_request(
+            get_preview_evalscript(dates), self.bbox,
+            get_time_interval('2020-06-01', '2020-06-30'), 1.0, self.config,
+            data_folder=self.folder.name)
+        output_file = download_preview(request)
+
+        self.assertTrue(os.path.exists(output_file))
+        self.assertEqual(request.get_data()[0].shape[2], 3)
+        self.assertEqual(self.server.request_count('/oauth/token'), 1)
+
+    def test_download_data_fusion(self):
+        """Test dates a year apart are ordered as one input per cluster."""
+        first = get_dates_by_orbit(self.bbox, '2019-06-01', '2019-06-30', 1.0, [69], self.config)
+        second = get_dates_by_orbit(self.bbox, '2020-06-01', '2020-06-30', 1.0, [69], self.config)
+        dates = first + second
+        time_intervals = get_dates_intervals(dates)
+        request = get_preview_request(
+            get_preview_evalscript(dates), self.bbox, time_intervals, 1.0, self.config,
+            data_folder=self.folder.name)
+        self.assertTrue(os.path.exists(download_preview(request)))
+
+        inputs = self.server.process_payloads[0]['input']['data']
+        self.assertEqual([data['id'] for data in inputs], ['l2a_0', 'l2a_1'])
+        self.assertEqual(
+            [data['dataFilter']['timeRange']['from'][:10] for data in inputs],
+            [min(first), min(second)])
+
+    def test_download_statistics(self):
+        """Test several statistics are ordered in one request and split into TIFFs."""
+        dates = get_dates_by_orbit(
+            self.bbox, '2020-06-01', '2020-06-30', 1.0, [69], self.config)
+        request = get_preview_request(
+            get_preview_evalscript(dates, statistics=DEFAULT_STATISTICS), self.bbox,
+            get_time_interval('2020-06-01', '2020-06-30'), 1.0, self.config,
+            data_folder=self.folder.name, output_ids=DEFAULT_STATISTICS)
+        output_files = extract_outputs(download_preview(request), data_folder=self.folder.name)
+
+        self.assertEqual(list(output_files), list(DEFAULT_STATISTICS))
+        for output_file in output_files.values():
+            self.assertTrue(os.path.exists(output_file))
+        self.assertEqual(self.server.request_count('/api/v1/process'), 1)
+
+    def test_throttling(self):
+        """Test rate limited requests are retried."""
+        self.server.max_requests_per_second = 2
+        dates = get_dates_by_orbit(
+            self.bbox, '2020-01-01', '2020-12-31', 1.0, [112], self.config)
+        self.assertEqual(len(dates), 74)
+        self.assertGreater(self.server.request_count('/ogc/wfs/'), 3)
+
+
+    def test_restores_environment(self):
+        """Test insecure OAuth transport is only allowed while serving."""
+        self.assertEqual(os.environ.get('OAUTHLIB_INSECURE_TRANSPORT'), '1')
+        with mock.patch.dict(os.environ, clear=True):
+            with MockSentinelHub():
+                self.assertEqual(os.environ['OAUTHLIB_INSECURE_TRANSPORT'], '1')
+            self.assertNotIn('OAUTHLIB_INSECURE_TRANSPORT', os.environ)
+
+            os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '0'
+            with MockSentinelHub():
+                pass
+            self.assertEqual(os.environ['OAUTHLIB_INSECURE_TRANSPORT'], '0')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MockSentinelHubTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
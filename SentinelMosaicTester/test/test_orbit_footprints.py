@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Orbit footprint index test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester import orbit_footprints
+from SentinelMosaicTester.orbit_footprints import OrbitFootprints, \
+    build_footprint_file, load_orbit_footprints, suggest_orbits
+
+
+class OrbitFootprintsTest(unittest.TestCase):
+    """Test orbits are suggested from the shipped footprints."""
+
+    def test_all_orbits_loaded(self):
+        """Test every relative orbit has a footprint."""
+        footprints = load_orbit_footprints()
+        self.assertEqual(sorted(footprints.orbits), list(range(1, 144)))
+
+    def test_suggest_orbits(self):
+        """Test suggestions are ranked by coverage."""
+        bbox = BBox(bbox=[-69.5, 45.0, -69.0, 45.4], crs=CRS.WGS84)
+        suggestions = suggest_orbits(bbox)
+        self.assertEqual(suggestions[0], (111, 1.0))
+        coverages = [coverage for _, coverage in suggestions]
+        self.assertEqual(coverages, sorted(coverages, reverse=True))
+        self.assertTrue(all(0 < coverage <= 1 for coverage in coverages))
+
+    def test_min_coverage(self):
+        """Test slivers are dropped with min_coverage."""
+        bbox = BBox(bbox=[-69.5, 45.0, -69.0, 45.4], crs=CRS.WGS84)
+        self.assertEqual(suggest_orbits(bbox, min_coverage=0.5), [(111, 1.0)])
+
+    def test_antimeridian(self):
+        """Test footprints crossing the antimeridian match on both sides of it."""
+        footprints = OrbitFootprints.from_geojson()
+        self.assertGreaterEqual(footprints.coords[:, 0].min(), -180)
+        self.assertLessEqual(footprints.coords[:, 0].max(), 180)
+
+        # Fiji, orbit 29's footprint runs from -182.5 to -178.1 in the GeoJSON
+        fiji = BBox(bbox=[179.5, -17.0, 179.9, -16.5], crs=CRS.WGS84)
+        self.assertEqual(footprints.suggest_orbits(fiji), [(29, 1.0)])
+        chukotka = BBox(bbox=[-179.9, 65.0, -179.5, 65.4], crs=CRS.WGS84)
+        self.assertIn(116, [orbit for orbit, _ in footprints.suggest_orbits(chukotka)])
+
+    def test_footprint_file_round_trip(self):
+        """Test the footprint file matches the GeoJSON."""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'orbits.footprints')
+            build_footprint_file(out_path=path)
+            from_file = OrbitFootprints.from_file(path)
+            from_geojson = OrbitFootprints.from_geojson()
+
+            for name in ('orbits', 'bounds', 'orbit_offsets', 'polygon_offsets',
+                         'ring_offsets', 'coords'):
+                np.testing.assert_array_equal(
+                    getattr(from_file, name), getattr(from_geojson, name))
+
+            i = list(from_file.orbits).index(111)
+            self.assertTrue(from_file.geometry(i).equals(from_geojson.geometry(i)))
+            del from_file
+
+    def test_footprint_file_antimeridian(self):
+        """Test the shipped footprint file is wrapped like the GeoJSON."""
+        from_file = OrbitFootprints.from_file()
+        np.testing.assert_array_equal(from_file.coords, OrbitFootprints.from_geojson().coords)
+
+        fiji = BBox(bbox=[179.5, -17.0, 179.9, -16.5], crs=CRS.WGS84)
+        self.assertEqual(from_file.suggest_orbits(fiji), [(29, 1.0)])
+        del from_file
+
+    def test_loads_without_shapely(self):
+        """Test the module imports when shapely is missing."""
+        with mock.patch.dict(sys.modules, {'shapely': None, 'shapely.geometry': None}):
+            module = importlib.reload(orbit_footprints)
+            self.assertEqual(len(module.load_orbit_footprints().orbits), 143)
+            with self.assertRaises(ImportError):
+                module.OrbitFootprints.from_file().geometry(0)
+        importlib.reload(orbit_footprints)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(OrbitFootprintsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
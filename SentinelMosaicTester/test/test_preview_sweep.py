@@ -0,0 +1,77 @@
+# coding=utf-8
+"""Preview sweep test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import unittest
+
+from unittest import mock
+
+from SentinelMosaicTester.preview_sweep import parse_sweep_sets, run_sweep, \
+    sweep_configurations
+from SentinelMosaicTester.tracing import Tracer
+
+SCENES = [
+    {'date': '2020-06-01', 'relative_orbit': 112, 'tile': '15TVG'},
+    {'date': '2020-06-04', 'relative_orbit': 69, 'tile': '15TVG'},
+    {'date': '2021-07-01', 'relative_orbit': 112, 'tile': '15TVG'},
+    {'date': '2021-01-01', 'relative_orbit': 69, 'tile': '15TVG'},
+]
+
+
+class PreviewSweepTest(unittest.TestCase):
+    """Test sweep configurations share one catalog query."""
+
+    def test_parse_sweep_sets(self):
+        """Test semicolon separated sets are parsed."""
+        self.assertEqual(parse_sweep_sets('112,69; 112;69;'), [[112, 69], [112], [69]])
+
+    def test_sweep_configurations(self):
+        """Test every combination is expanded."""
+        configurations = sweep_configurations([[112], [69]], [[6, 7]], [[2020], [2021]])
+        self.assertEqual(len(configurations), 4)
+        self.assertIn({'orbits': [69], 'months': [6, 7], 'years': [2021]}, configurations)
+
+    def test_run_sweep(self):
+        """Test one catalog query and one download per combination."""
+        configurations = sweep_configurations([[112], [69]], [[6, 7]], [[2020], [2021]])
+        with mock.patch('SentinelMosaicTester.preview_sweep.query_scene_intervals',
+                        return_value=[SCENES]) as query, \
+                mock.patch('SentinelMosaicTester.preview_sweep.get_preview_request',
+                           side_effect=lambda evalscript, *args: evalscript), \
+                mock.patch('SentinelMosaicTester.preview_sweep.download_preview',
+                           side_effect=lambda evalscript, cache=None, tracer=None: evalscript):
+            tracer = Tracer()
+            results = run_sweep(None, configurations, 0.2, config=None, max_workers=2,
+                                tracer=tracer)
+
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(
+            query.call_args[0][1], [('2020-06-01', '2020-07-31'), ('2021-06-01', '2021-07-31')])
+
+        # orbit 69 has no summer scenes in 2021
+        self.assertEqual([result[0] for result in results], configurations)
+        self.assertIn('"2020-06-01"', results[0][1])
+        self.assertIn('"2021-07-01"', results[1][1])
+        self.assertIsNotNone(results[3][2])
+
+        # every configuration is timed, the failed one up to its date filtering
+        stages = [name for name, _, _, _ in tracer.summary()]
+        self.assertEqual(stages, ['catalog query', 'date filtering', 'evalscript build'])
+        self.assertEqual(
+            sum(1 for span in tracer.spans if span['name'] == 'evalscript build'), 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PreviewSweepTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,57 @@
+# coding=utf-8
+"""Product ID parser test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import unittest
+
+from SentinelMosaicTester.product_id import parse_product_id, parse_product_ids
+
+
+class ProductIdTest(unittest.TestCase):
+    """Test Sentinel 2 granule IDs are parsed."""
+
+    def test_parse_product_id(self):
+        """Test every field is extracted."""
+        product = parse_product_id(
+            'S2B_OPER_MSI_L2A_TL_VGS1_20210310T201253_A020963_T15TVG_N02.14')
+        self.assertEqual(product.sat, '2B')
+        self.assertEqual(product.level, 'L2A')
+        self.assertEqual(product.site_centre, 'VGS1')
+        self.assertEqual(product.creation_date, '20210310T201253')
+        self.assertEqual(product.absolute_orbit, 20963)
+        self.assertEqual(product.tile, '15TVG')
+        self.assertEqual(product.processing_baseline, 'N02.14')
+
+    def test_padded_site_centre(self):
+        """Test site centres padded with an underscore."""
+        product = parse_product_id(
+            'S2A_OPER_MSI_L2A_TL_SGS__20200601T180926_A025770_T12SWH_N02.14')
+        self.assertEqual(product.site_centre, 'SGS_')
+        self.assertEqual(product.absolute_orbit, 25770)
+        self.assertEqual(product.tile, '12SWH')
+
+    def test_parse_product_ids(self):
+        """Test batch parsing and invalid IDs."""
+        products = parse_product_ids([
+            'S2B_OPER_MSI_L2A_TL_VGS1_20210310T201253_A020963_T15TVG_N02.14',
+            'S2A_OPER_MSI_L2A_TL_SGS__20200601T180926_A025770_T12SWH_N02.14',
+        ])
+        self.assertEqual([product.sat for product in products], ['2B', '2A'])
+        with self.assertRaises(ValueError):
+            parse_product_ids(['S2B_MSIL2A_20210310T170109_N0214_R069_T15TVG_20210310T201253'])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ProductIdTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
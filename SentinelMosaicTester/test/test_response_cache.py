@@ -0,0 +1,120 @@
+# coding=utf-8
+"""Response cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import os
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from SentinelMosaicTester.response_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Test cached responses are found and evicted least recently used first."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.folder.name, 'cache'), max_size=25)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.folder.cleanup()
+
+    def write_response(self, name, size=10):
+        """Write a fake downloaded response."""
+        path = os.path.join(self.folder.name, name)
+        with open(path, 'wb') as f:
+            f.write(b'0' * size)
+        return path
+
+    def test_hit_and_miss(self):
+        """Test a stored response is returned for its key only."""
+        self.assertIsNone(self.cache.get('a'))
+        cached_path = self.cache.put('a', self.write_response('response.tiff'))
+        self.assertTrue(cached_path.endswith('a.tiff'))
+        self.assertEqual(self.cache.get('a'), cached_path)
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_lru_eviction(self):
+        """Test the least recently used response is evicted first."""
+        self.cache.put('a', self.write_response('a.tiff'))
+        time.sleep(0.01)
+        self.cache.put('b', self.write_response('b.tiff'))
+        time.sleep(0.01)
+        # use a again so b becomes the least recently used
+        self.cache.get('a')
+        time.sleep(0.01)
+        self.cache.put('c', self.write_response('c.tiff'))
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+        self.assertLessEqual(self.cache.size(), 25)
+
+    def test_pinned_not_evicted(self):
+        """Test pinned responses survive eviction until they are released."""
+        self.cache.put('a', self.write_response('a.tiff'), owner='order')
+        time.sleep(0.01)
+        self.cache.put('b', self.write_response('b.tiff'), owner='order')
+        time.sleep(0.01)
+        self.cache.put('c', self.write_response('c.tiff'))
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+        self.cache.release('order')
+        time.sleep(0.01)
+        self.cache.put('d', self.write_response('d.tiff'))
+        self.assertLessEqual(self.cache.size(), 25)
+
+    def test_locked_file_skipped(self):
+        """Test a response that can't be deleted does not fail the put."""
+        self.cache.put('a', self.write_response('a.tiff'))
+        time.sleep(0.01)
+        self.cache.put('b', self.write_response('b.tiff'))
+        time.sleep(0.01)
+
+        real_remove = os.remove
+
+        def remove(path):
+            if os.path.basename(path).startswith('a.'):
+                raise PermissionError(path)
+            real_remove(path)
+
+        with mock.patch('os.remove', side_effect=remove):
+            self.cache.put('c', self.write_response('c.tiff'))
+            self.cache.clear()
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNone(self.cache.get('c'))
+
+    def test_index(self):
+        """Test lookups don't scan the folder and a new cache finds old entries."""
+        cached_path = self.cache.put('a', self.write_response('a.tiff'))
+        with mock.patch('os.scandir') as scandir:
+            self.assertEqual(self.cache.get('a'), cached_path)
+            self.assertIsNone(self.cache.get('b'))
+        scandir.assert_not_called()
+
+        self.assertEqual(ResponseCache(self.cache.folder).get('a'), cached_path)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ResponseCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,145 @@
+# coding=utf-8
+"""Scene catalog cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import datetime as dt
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sentinelhub import BBox, CRS, DataCollection
+
+from SentinelMosaicTester.scene_catalog import SceneCatalog, catalog_key, missing_spans
+
+
+def fake_scenes(bbox, start_date, end_date, **kwargs):
+    """One scene per day between two dates."""
+    start = dt.date.fromisoformat(start_date)
+    end = dt.date.fromisoformat(end_date)
+    scenes = []
+    while start <= end:
+        scenes.append({
+            'product_id': f'S2A_{start.isoformat()}',
+            'date': start.isoformat(),
+            'sat': '2A',
+            'absolute_orbit': 100,
+            'relative_orbit': 103,
+            'tile': '16TCR',
+            'cloud_cover': 0.0
+        })
+        start += dt.timedelta(days=1)
+    return scenes
+
+
+class SceneCatalogTest(unittest.TestCase):
+    """Test the catalog only queries missing date spans."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.TemporaryDirectory()
+        self.catalog = SceneCatalog(os.path.join(self.folder.name, 'catalog.sqlite'))
+        self.bbox = BBox(bbox=[-90.1, 45.0, -90.0, 45.1], crs=CRS.WGS84)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.folder.cleanup()
+
+    def test_missing_spans(self):
+        """Test gaps between covered spans are found."""
+        date = dt.date.fromisoformat
+        covered = [(date('2020-01-05'), date('2020-01-10'))]
+        self.assertEqual(
+            missing_spans(date('2020-01-01'), date('2020-01-31'), covered),
+            [(date('2020-01-01'), date('2020-01-04')),
+             (date('2020-01-11'), date('2020-01-31'))]
+        )
+        self.assertEqual(
+            missing_spans(date('2020-01-06'), date('2020-01-08'), covered), []
+        )
+
+    def test_incremental_top_up(self):
+        """Test a wider second query only fetches the new span."""
+        with mock.patch(
+                'SentinelMosaicTester.sentinel_utils.query_scenes',
+                side_effect=fake_scenes) as query:
+            scenes = self.catalog.get_scenes(
+                self.bbox, '2020-01-01', '2020-01-10', 0.2, config=None)
+            self.assertEqual(len(scenes), 10)
+
+            scenes = self.catalog.get_scenes(
+                self.bbox, '2020-01-01', '2020-01-20', 0.2, config=None)
+            self.assertEqual(len(scenes), 20)
+            self.assertEqual(query.call_count, 2)
+            self.assertEqual(query.call_args[1]['start_date'], '2020-01-11')
+
+            # fully cached
+            self.catalog.get_scenes(
+                self.bbox, '2020-01-05', '2020-01-15', 0.2, config=None)
+            self.assertEqual(query.call_count, 2)
+
+    def test_ttl_expiry(self):
+        """Test expired spans are queried again."""
+        self.catalog.ttl = -1
+        with mock.patch(
+                'SentinelMosaicTester.sentinel_utils.query_scenes',
+                side_effect=fake_scenes) as query:
+            self.catalog.get_scenes(
+                self.bbox, '2020-01-01', '2020-01-10', 0.2, config=None)
+            scenes = self.catalog.get_scenes(
+                self.bbox, '2020-01-01', '2020-01-10', 0.2, config=None)
+            self.assertEqual(query.call_count, 2)
+            self.assertEqual(len(scenes), 10)
+
+    def test_interval_scenes(self):
+        """Test only the missing parts of disjoint spans are queried."""
+        with mock.patch(
+                'SentinelMosaicTester.sentinel_utils.query_scenes',
+                side_effect=fake_scenes) as query:
+            self.catalog.get_scenes(
+                self.bbox, '2020-06-01', '2020-06-10', 0.2, config=None)
+            scenes = self.catalog.get_interval_scenes(
+                self.bbox,
+                [('2020-06-01', '2020-06-30'), ('2021-06-01', '2021-06-30')],
+                0.2, config=None)
+
+        self.assertEqual(len(scenes), 60)
+        self.assertEqual(scenes[0]['date'], '2020-06-01')
+        self.assertEqual(scenes[-1]['date'], '2021-06-30')
+        self.assertEqual(
+            sorted(call[1]['start_date'] for call in query.call_args_list),
+            ['2020-06-01', '2020-06-11', '2021-06-01'])
+
+    def test_cached_scenes_while_querying(self):
+        """Test cached reads don't wait for a WFS query of the same bbox."""
+        with mock.patch(
+                'SentinelMosaicTester.sentinel_utils.query_scenes',
+                side_effect=fake_scenes):
+            self.catalog.get_scenes(
+                self.bbox, '2020-06-01', '2020-06-10', 0.2, config=None)
+
+        # a worker holds the key lock while it pages the WFS service
+        key = catalog_key(self.bbox, 0.2, DataCollection.SENTINEL2_L2A)
+        with self.catalog._key_lock(key):
+            scenes, missing = self.catalog.get_cached_interval_scenes(
+                self.bbox, [('2020-06-01', '2020-06-30')], 0.2)
+
+        self.assertEqual(missing, [('2020-06-11', '2020-06-30')])
+        self.assertEqual(len(scenes), 10)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SceneCatalogTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
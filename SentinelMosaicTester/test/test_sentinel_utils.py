@@ -0,0 +1,101 @@
+# coding=utf-8
+"""Sentinel utils test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import datetime as dt
+import unittest
+
+from SentinelMosaicTester.sentinel_utils import absolute_to_relative_orbit, \
+    absolute_to_relative_orbits, get_dates_intervals, get_year_span, month_intervals, \
+    parse_scene, parse_scenes, selection_intervals
+
+FEATURES = [
+    {'properties': {
+        'id': 'S2B_OPER_MSI_L2A_TL_VGS1_20210310T201253_A020963_T15TVG_N02.14',
+        'date': '2021-03-10',
+        'cloudCoverPercentage': 12.5}},
+    {'properties': {
+        'id': 'S2A_OPER_MSI_L2A_TL_VGS2_20210305T201253_A029743_T15TVG_N02.14',
+        'date': '2021-03-05',
+        'cloudCoverPercentage': 3.0}},
+]
+
+
+class SentinelUtilsTest(unittest.TestCase):
+    """Test scene parsing and orbit conversion."""
+
+    def test_absolute_to_relative_orbits(self):
+        """Test the batch conversion matches the scalar one."""
+        absolute_orbits = [20963, 29743, 140, 26, 0]
+        sats = ['2B', '2A', '2A', '2B', '2A']
+        self.assertEqual(
+            absolute_to_relative_orbits(absolute_orbits, sats).tolist(),
+            [absolute_to_relative_orbit(orbit, sat) for orbit, sat in zip(absolute_orbits, sats)])
+
+    def test_absolute_to_relative_orbits_unknown_sat(self):
+        """Test unknown satellites are rejected."""
+        with self.assertRaises(AssertionError):
+            absolute_to_relative_orbits([1, 2], ['2A', '2C'])
+
+    def test_parse_scenes(self):
+        """Test batch parsing matches parsing one feature at a time."""
+        scenes = parse_scenes(FEATURES)
+        self.assertEqual(scenes, [parse_scene(feature) for feature in FEATURES])
+        self.assertEqual(scenes[0]['relative_orbit'], (20963 - 26) % 143)
+        self.assertEqual(scenes[1]['tile'], '15TVG')
+        self.assertEqual(parse_scenes([]), [])
+
+    def test_selection_intervals(self):
+        """Test consecutive months are merged into one span."""
+        self.assertEqual(
+            selection_intervals([6, 7, 8], [2019, 2020]),
+            [('2019-06-01', '2019-08-31'), ('2020-06-01', '2020-08-31')])
+        self.assertEqual(
+            selection_intervals([2, 12, 1], [2019, 2020]),
+            [('2019-01-01', '2019-02-28'), ('2019-12-01', '2020-02-29'),
+             ('2020-12-01', '2020-12-31')])
+
+    def test_month_intervals(self):
+        """Test arbitrary (year, month) pairs."""
+        self.assertEqual(
+            month_intervals([(2020, 3), (2021, 3), (2020, 4)]),
+            [('2020-03-01', '2020-04-30'), ('2021-03-01', '2021-03-31')])
+
+    def test_get_dates_intervals(self):
+        """Test there is one tight interval per run of consecutive months."""
+        dates = ['2020-07-04', '2019-06-12', '2020-06-01', '2019-06-20', '2021-01-03']
+        self.assertEqual(
+            get_dates_intervals(dates),
+            [[dt.date(2019, 6, 12), dt.date(2019, 6, 20)],
+             [dt.date(2020, 6, 1), dt.date(2020, 7, 4)],
+             [dt.date(2021, 1, 3), dt.date(2021, 1, 3)]])
+        # the runs six months apart are merged before the one a year apart
+        self.assertEqual(
+            get_dates_intervals(dates, max_intervals=2),
+            [[dt.date(2019, 6, 12), dt.date(2019, 6, 20)],
+             [dt.date(2020, 6, 1), dt.date(2021, 1, 3)]])
+        self.assertEqual(
+            get_dates_intervals(dates, max_intervals=1),
+            [[dt.date(2019, 6, 12), dt.date(2021, 1, 3)]])
+        with self.assertRaises(AssertionError):
+            get_dates_intervals([])
+
+    def test_get_year_span(self):
+        """Test the span includes the last day of the last year."""
+        self.assertEqual(get_year_span([2021, 2018, 2020]), ('2018-01-01', '2021-12-31'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SentinelUtilsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""Tiled mosaic test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import unittest
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.tiled_mosaic import MAX_TILE_SIZE, split_bbox
+
+
+class TiledMosaicTest(unittest.TestCase):
+    """Test bounding boxes are split into a regular tile grid."""
+
+    def test_small_bbox_is_one_tile(self):
+        """Test a bbox that fits in one request is not split."""
+        bbox = BBox(bbox=[-69.5, 45.0, -69.4, 45.1], crs=CRS.WGS84)
+        tiles = split_bbox(bbox, resolution=10)
+        self.assertEqual(len(tiles), 1)
+        self.assertEqual(list(tiles[0][0]), list(bbox))
+
+    def test_large_bbox_is_split(self):
+        """Test tiles cover the bbox and respect the pixel limit."""
+        bbox = BBox(bbox=[-69.5, 45.0, -69.0, 45.4], crs=CRS.WGS84)
+        tiles = split_bbox(bbox, resolution=10)
+        self.assertEqual(len(tiles), 4)
+
+        sizes = set(size for _, size in tiles)
+        self.assertEqual(len(sizes), 1)
+        width, height = sizes.pop()
+        self.assertLessEqual(width, MAX_TILE_SIZE)
+        self.assertLessEqual(height, MAX_TILE_SIZE)
+
+        self.assertAlmostEqual(min(tile.min_x for tile, _ in tiles), bbox.min_x)
+        self.assertAlmostEqual(max(tile.max_x for tile, _ in tiles), bbox.max_x)
+        self.assertAlmostEqual(min(tile.min_y for tile, _ in tiles), bbox.min_y)
+        self.assertAlmostEqual(max(tile.max_y for tile, _ in tiles), bbox.max_y)
+
+    def test_too_many_tiles(self):
+        """Test huge orders are refused."""
+        bbox = BBox(bbox=[-80.0, 40.0, -60.0, 50.0], crs=CRS.WGS84)
+        with self.assertRaises(AssertionError):
+            split_bbox(bbox, resolution=10)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TiledMosaicTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
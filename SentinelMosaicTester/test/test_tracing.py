@@ -0,0 +1,115 @@
+# coding=utf-8
+"""Tracing test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.response_cache import ResponseCache
+from SentinelMosaicTester.sentinel_utils import download_preview, get_preview_evalscript, \
+    get_preview_request, get_time_interval
+from SentinelMosaicTester.test.mock_sentinel_hub import MockSentinelHub
+from SentinelMosaicTester.tracing import Tracer, trace_span, write_trace
+
+
+class TracingTest(unittest.TestCase):
+    """Test spans are collected and exported."""
+
+    def test_chrome_trace(self):
+        """Test spans from several threads are exported as complete events."""
+        tracer = Tracer('preview')
+
+        def fetch_page(offset):
+            with trace_span(tracer, 'wfs page', offset=offset) as details:
+                details['features'] = 100 - offset
+
+        with tracer.span('catalog query', intervals=2):
+            threads = [threading.Thread(target=fetch_page, args=(offset,)) for offset in (0, 100)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        trace = tracer.to_chrome_trace()
+        events = trace['traceEvents']
+        self.assertEqual(sorted(event['name'] for event in events),
+                         ['catalog query', 'wfs page', 'wfs page'])
+        self.assertTrue(all(event['ph'] == 'X' and event['dur'] >= 0 for event in events))
+        self.assertIn({'offset': '100', 'features': '0'}, [event['args'] for event in events])
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = tracer.write(os.path.join(folder, 'traces', 'preview.json'))
+            with open(path) as f:
+                self.assertEqual(json.load(f), trace)
+
+    def test_summary(self):
+        """Test spans are summarized per stage in start order."""
+        tracer = Tracer()
+        for stage in ['bbox transform', 'wfs page', 'wfs page', 'download']:
+            with tracer.span(stage):
+                pass
+
+        summary = tracer.summary()
+        self.assertEqual([(name, count) for name, count, _, _ in summary],
+                         [('bbox transform', 1), ('wfs page', 2), ('download', 1)])
+        self.assertIn('wfs page:', tracer.summary_text())
+        self.assertIn('(2 spans', tracer.summary_text())
+
+    def test_write_trace_prunes(self):
+        """Test only the most recent traces are kept."""
+        with tempfile.TemporaryDirectory() as folder:
+            for i, name in enumerate(['1/2/3/4', 'old', 'recent']):
+                path = Tracer(name).write(os.path.join(folder, f'{name.replace("/", "_")}.json'))
+                os.utime(path, (1000 + i, 1000 + i))
+            with open(os.path.join(folder, 'notes.txt'), 'w') as f:
+                f.write('not a trace')
+
+            path = write_trace(Tracer('S2 preview: 1/2/3/4'), folder=folder, max_traces=2)
+
+            self.assertTrue(os.path.basename(path).startswith('S2_preview__1_2_3_4_'))
+            self.assertEqual(sorted(os.listdir(folder)),
+                             sorted([os.path.basename(path), 'notes.txt', 'recent.json']))
+
+    def test_download_preview_spans(self):
+        """Test processing and the disk write are timed apart, with or without a cache."""
+        bbox = BBox(bbox=[-93.1, 45.0, -93.0, 45.1], crs=CRS.WGS84)
+        with MockSentinelHub() as server, tempfile.TemporaryDirectory() as folder:
+            for cache in (None, ResponseCache(os.path.join(folder, 'cache'))):
+                tracer = Tracer()
+                request = get_preview_request(
+                    get_preview_evalscript(['2020-06-05']), bbox,
+                    get_time_interval('2020-06-01', '2020-06-30'), 1.0, server.config(),
+                    data_folder=os.path.join(folder, 'data'))
+                output_file = download_preview(request, cache=cache, tracer=tracer)
+
+                spans = {span['name']: span['args'] for span in tracer.spans}
+                self.assertIn('process request', spans)
+                self.assertIn('disk write', spans)
+                self.assertNotIn('download', spans)
+                self.assertEqual(spans['disk write']['bytes'], os.path.getsize(output_file))
+
+    def test_no_tracer(self):
+        """Test spans are a no-op without a tracer."""
+        with trace_span(None, 'download', bytes=10) as details:
+            self.assertEqual(details, {'bytes': 10})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TracingTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
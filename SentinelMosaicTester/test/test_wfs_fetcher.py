@@ -0,0 +1,85 @@
+# coding=utf-8
+"""WFS fetcher test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'henry@silviaterra.com'
+__date__ = '2021-03-03'
+__copyright__ = 'Copyright 2021, SilviaTerra'
+
+import datetime as dt
+import unittest
+
+from unittest import mock
+
+from sentinelhub import BBox, CRS, SHConfig
+
+from SentinelMosaicTester.wfs_fetcher import WfsFetcher, split_date_range
+
+
+def fake_get(url, params, timeout):
+    """One feature per day of the requested range, paged."""
+    start, end = [time.split('T')[0] for time in params['TIME'].split('/')]
+    day = dt.date.fromisoformat(start)
+    features = []
+    while day <= dt.date.fromisoformat(end):
+        features.append({'properties': {'date': day.isoformat()}})
+        day += dt.timedelta(days=1)
+
+    offset = params['FEATURE_OFFSET']
+    response = mock.Mock()
+    response.json.return_value = {
+        'features': features[offset:offset + params['MAXFEATURES']]
+    }
+    return response
+
+
+class WfsFetcherTest(unittest.TestCase):
+    """Test date ranges are paged concurrently and merged in order."""
+
+    def setUp(self):
+        """Runs before each test."""
+        config = SHConfig()
+        config.instance_id = 'test-instance'
+        config.max_wfs_records_per_query = 10
+        self.fetcher = WfsFetcher(config, max_connections=3, sub_range_days=30)
+        self.bbox = BBox(bbox=[-90.1, 45.0, -90.0, 45.1], crs=CRS.WGS84)
+
+    def test_split_date_range(self):
+        """Test sub-ranges are consecutive and cover the range."""
+        self.assertEqual(
+            split_date_range('2020-01-01', '2020-03-15', days=31),
+            [('2020-01-01', '2020-01-31'), ('2020-02-01', '2020-03-02'),
+             ('2020-03-03', '2020-03-15')])
+        self.assertEqual(
+            split_date_range('2020-01-01', '2020-01-01'), [('2020-01-01', '2020-01-01')])
+
+    def test_request_params(self):
+        """Test WGS84 bounding boxes are sent in lat/lon order."""
+        params = self.fetcher.request_params(
+            self.bbox, '2020-01-01', '2020-01-31', 0.2, mock.Mock(wfs_id='DSS2'))
+        self.assertEqual(params['BBOX'], '45.0,-90.1,45.1,-90.0')
+        self.assertEqual(params['TIME'], '2020-01-01T00:00:00Z/2020-01-31T23:59:59Z')
+        self.assertEqual(params['MAXCC'], 20.0)
+
+    def test_fetch(self):
+        """Test every page of every sub-range is merged in date order."""
+        with mock.patch.object(self.fetcher.session, 'get', side_effect=fake_get) as get:
+            features = self.fetcher.fetch(self.bbox, '2020-01-01', '2020-12-31', 0.2)
+
+        dates = [feature['properties']['date'] for feature in features]
+        self.assertEqual(len(dates), 366)
+        self.assertEqual(dates, sorted(dates))
+        # 12 30 day sub-ranges of 3 full pages and an empty one, then 6 days
+        self.assertEqual(get.call_count, 12 * 4 + 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(WfsFetcherTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
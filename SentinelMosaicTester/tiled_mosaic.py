@@ -0,0 +1,140 @@
+import hashlib
+import math
+import os
+
+from osgeo import gdal
+from sentinelhub import BBox, bbox_to_dimensions, SentinelHubDownloadClient
+
+from .response_cache import request_key
+from .sentinel_utils import DATA_FOLDER, get_preview_request
+from .tracing import trace_span
+
+# the process API refuses requests wider or taller than this many pixels
+MAX_TILE_SIZE = 2500
+
+# guard against ordering a continent at 10 m by accident, every tile is billed
+MAX_TILES = 64
+
+# concurrent tile downloads, the download client also backs off when Sentinel
+# Hub responds with too many requests
+DEFAULT_MAX_THREADS = 4
+
+
+def split_bbox(bbox, resolution, max_tile_size=MAX_TILE_SIZE):
+    '''
+    Split a bounding box into a grid of equally sized tiles that can each be
+    ordered in a single process API request at a target resolution.
+
+    * bbox is a WGS84 bounding box created by sentinelhub.Geometry.BBox
+    * resolution is the target pixel size in meters
+    * max_tile_size is the largest width/height of a tile in pixels
+
+    Returns a list of (tile bbox, (width, height)) tuples, row by row from the
+    north west corner. Every tile has the same extent and pixel size so the
+    tiles line up on one pixel grid.
+    '''
+    width, height = bbox_to_dimensions(bbox, resolution=resolution)
+    n_x = max(1, math.ceil(width / max_tile_size))
+    n_y = max(1, math.ceil(height / max_tile_size))
+    assert n_x * n_y <= MAX_TILES, \
+        f'{n_x * n_y} tiles needed at {resolution} m, please use a coarser resolution.'
+
+    tile_size = (max(1, math.ceil(width / n_x)), max(1, math.ceil(height / n_y)))
+
+    min_x, min_y, max_x, max_y = bbox
+    step_x = (max_x - min_x) / n_x
+    step_y = (max_y - min_y) / n_y
+
+    tiles = []
+    for row in range(n_y):
+        for col in range(n_x):
+            tile_bbox = BBox(
+                bbox=[
+                    min_x + col * step_x,
+                    max_y - (row + 1) * step_y,
+                    min_x + (col + 1) * step_x,
+                    max_y - row * step_y
+                ],
+                crs=bbox.crs
+            )
+            tiles.append((tile_bbox, tile_size))
+
+    return tiles
+
+
+def get_tiled_preview_requests(evalscript, bbox, time_interval, max_cc, config,
+                               resolution, data_folder=DATA_FOLDER):
+    '''
+    Build one process API request per tile of a bounding box at a target
+    resolution (meters), see get_preview_request
+    '''
+    return [
+        get_preview_request(
+            evalscript, tile_bbox, time_interval, max_cc, config,
+            data_folder=data_folder, size=tile_size)
+        for tile_bbox, tile_size in split_bbox(bbox, resolution)
+    ]
+
+
+def download_tiled_preview(requests, config, max_threads=DEFAULT_MAX_THREADS, cache=None,
+                           tracer=None):
+    '''
+    Download every tile request concurrently through one rate limited client
+    and assemble the tiles into a GDAL VRT. If a response_cache.ResponseCache
+    is given, tiles that were ordered before are taken from the cache. An
+    optional tracing.Tracer times the download, disk writes and VRT build.
+
+    Cached tiles are pinned while the order runs so tiles put later can't
+    evict them, and stay pinned under the VRT path once it is built, until
+    the cache releases it (see ResponseCache.release).
+
+    Returns the path to the VRT
+    '''
+    # pins the tiles of this order only
+    order = object()
+    try:
+        tile_files = [None] * len(requests)
+        keys = [None] * len(requests)
+        download_requests = []
+        for i, request in enumerate(requests):
+            if cache is not None:
+                keys[i] = request_key(request)
+                tile_files[i] = cache.get(keys[i], owner=order)
+                if tile_files[i] is not None:
+                    continue
+
+            for download_request in request.download_list:
+                download_request.save_response = True
+                download_request.return_data = False
+                download_request.data_folder = request.data_folder
+                download_requests.append(download_request)
+
+        # the client writes the tiles as they arrive
+        with trace_span(tracer, 'download', tiles=len(download_requests)):
+            client = SentinelHubDownloadClient(config=config)
+            client.download(download_requests, max_threads=max_threads, decode_data=False)
+
+        with trace_span(tracer, 'disk write'):
+            for i, request in enumerate(requests):
+                if tile_files[i] is None:
+                    tile_files[i] = os.path.join(
+                        request.data_folder, request.get_filename_list()[0])
+                    if cache is not None:
+                        tile_files[i] = cache.put(keys[i], tile_files[i], owner=order)
+
+        # name the mosaic after its tiles so identical orders share a file
+        mosaic_id = hashlib.md5('\n'.join(tile_files).encode()).hexdigest()
+        vrt_file = os.path.join(requests[0].data_folder, f'mosaic_{mosaic_id}.vrt')
+        with trace_span(tracer, 'vrt build'):
+            vrt = gdal.BuildVRT(vrt_file, tile_files)
+            assert vrt is not None, f'Could not build {vrt_file}: {gdal.GetLastErrorMsg()}'
+            # closing the dataset writes the VRT to disk
+            vrt = None
+
+        if cache is not None:
+            cache.pin(vrt_file, tile_files)
+    finally:
+        if cache is not None:
+            cache.release(order)
+
+    return vrt_file
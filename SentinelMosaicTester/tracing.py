@@ -0,0 +1,158 @@
+import datetime as dt
+import json
+import os
+import re
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+
+# folder preview traces are written to
+DEFAULT_TRACE_FOLDER = os.path.join(
+    os.path.expanduser('~'), '.cache', 'sentinel_mosaic_tester', 'traces'
+)
+
+# only the most recent traces are kept in the trace folder
+DEFAULT_MAX_TRACES = 50
+
+
+class Tracer:
+    '''
+    Collect timing spans of one mosaic order (bbox transform, catalog pages,
+    date filtering, evalscript build, process request, download, disk write,
+    layer load...) from any thread, and export them as a Chrome trace
+    (chrome://tracing or https://ui.perfetto.dev) or a per-stage summary.
+
+    * name labels the trace, e.g. the layer name
+    '''
+
+    def __init__(self, name=''):
+        self.name = name
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **args):
+        '''
+        Time the body of a with block as a span, keyword arguments are kept
+        as span details (e.g. page offset or number of dates)
+        '''
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    'name': name,
+                    'start': start - self._origin,
+                    'duration': end - start,
+                    'thread': threading.get_ident(),
+                    'args': args
+                })
+
+    def to_chrome_trace(self):
+        '''
+        Return the spans as a Chrome trace event format document
+        '''
+        with self._lock:
+            spans = list(self.spans)
+
+        events = [
+            {
+                'name': span['name'],
+                'cat': self.name,
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': os.getpid(),
+                'tid': span['thread'],
+                'args': {key: str(value) for key, value in span['args'].items()}
+            }
+            for span in spans
+        ]
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        '''
+        Write the Chrome trace to a JSON file and return its path
+        '''
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+        return path
+
+    def summary(self):
+        '''
+        Return (span name, count, total seconds, longest seconds) tuples per
+        span name, in the order each name first started
+        '''
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start'])
+
+        stages = {}
+        for span in spans:
+            count, total, longest = stages.get(span['name'], (0, 0.0, 0.0))
+            stages[span['name']] = (
+                count + 1, total + span['duration'], max(longest, span['duration']))
+
+        return [(name, *stage) for name, stage in stages.items()]
+
+    def summary_text(self):
+        '''
+        Format the summary as one line per span name
+        '''
+        lines = []
+        for name, count, total, longest in self.summary():
+            line = f'{name}: {total * 1000:.0f} ms'
+            if count > 1:
+                line += f' ({count} spans, longest {longest * 1000:.0f} ms)'
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+
+def trace_span(tracer, name, **args):
+    '''
+    Tracer.span of an optional tracer, a no-op context when tracer is None
+    '''
+    if tracer is None:
+        return nullcontext(args)
+    return tracer.span(name, **args)
+
+
+def prune_traces(folder=DEFAULT_TRACE_FOLDER, max_traces=DEFAULT_MAX_TRACES):
+    '''
+    Delete all but the max_traces most recently written traces of a folder
+    '''
+    if not os.path.isdir(folder):
+        return
+
+    traces = sorted(
+        (entry for entry in os.scandir(folder)
+         if entry.is_file() and entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in traces[max_traces:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            # removed by another order or still open
+            pass
+
+
+def write_trace(tracer, folder=DEFAULT_TRACE_FOLDER, max_traces=DEFAULT_MAX_TRACES):
+    '''
+    Write a tracer's Chrome trace to <folder>/<tracer name>_<timestamp>.json,
+    prune the folder to the max_traces most recent traces and return the path
+    '''
+    file_name = re.sub(r'[^\w.-]', '_', tracer.name)
+    path = tracer.write(os.path.join(
+        folder, f'{file_name}_{dt.datetime.now():%Y%m%dT%H%M%S%f}.json'))
+    prune_traces(folder, max_traces)
+
+    return path
@@ -0,0 +1,184 @@
+import datetime as dt
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from sentinelhub import CRS, DataCollection, MimeType
+from urllib3.util.retry import Retry
+
+from .tracing import trace_span
+
+# long date ranges are split into sub-ranges of this many days that are paged
+# concurrently
+DEFAULT_SUB_RANGE_DAYS = 92
+
+# maximum number of open connections to the WFS service, requests beyond this
+# wait for a pooled connection to free up
+DEFAULT_MAX_CONNECTIONS = 4
+
+
+def split_date_range(start_date, end_date, days=DEFAULT_SUB_RANGE_DAYS):
+    '''
+    Split an inclusive yyyy-mm-dd date range into consecutive (start, end)
+    sub-ranges of at most a number of days
+    '''
+    start = dt.date.fromisoformat(start_date)
+    end = dt.date.fromisoformat(end_date)
+    assert start <= end, f'start_date {start_date} is after end_date {end_date}'
+
+    sub_ranges = []
+    while start <= end:
+        sub_end = min(start + dt.timedelta(days=days - 1), end)
+        sub_ranges.append((start.isoformat(), sub_end.isoformat()))
+        start = sub_end + dt.timedelta(days=1)
+
+    return sub_ranges
+
+
+def wfs_service_url(config, data_collection):
+    '''
+    WFS endpoint of a data collection
+    '''
+    if not config.instance_id:
+        raise ValueError(
+            'Sentinel Hub instance ID must be set in the config to query the WFS catalog.')
+
+    base_url = f'{config.sh_base_url}/ogc'
+    if data_collection.service_url:
+        base_url = base_url.replace(config.sh_base_url, data_collection.service_url)
+
+    return f'{base_url}/wfs/{config.instance_id}'
+
+
+def wfs_request_params(bbox, start_date, end_date, max_cc, data_collection, max_features):
+    '''
+    GetFeature parameters of a bounding box, inclusive yyyy-mm-dd date range
+    and maximum cloud cover, without the page offset. Pages hold at most
+    max_features features.
+    '''
+    # WFS expects WGS84 coordinates in lat/lon order
+    coords = bbox.reverse() if bbox.crs is CRS.WGS84 else bbox
+    return {
+        'SERVICE': 'wfs',
+        'WARNINGS': False,
+        'REQUEST': 'GetFeature',
+        'TYPENAMES': data_collection.wfs_id,
+        'BBOX': ','.join(map(str, coords)),
+        'OUTPUTFORMAT': MimeType.JSON.get_string(),
+        'SRSNAME': bbox.crs.ogc_string(),
+        'TIME': f'{start_date}T00:00:00Z/{end_date}T23:59:59Z',
+        'MAXCC': 100.0 * max_cc,
+        'MAXFEATURES': max_features,
+    }
+
+
+class WfsFetcher:
+    '''
+    Fetch Sentinel Hub WFS catalog features concurrently over one pooled HTTP
+    session. Builds the same GetFeature requests as sentinelhub's
+    WebFeatureService, which pages a date range strictly sequentially.
+
+    A date range is split into sub-ranges that are paged concurrently and the
+    features are merged back in sub-range order, so results are deterministic
+    no matter which request finishes first.
+
+    * config is the Sentinel Hub config object created by sentinelhub.SHConfig()
+    * max_connections bounds the number of concurrent WFS requests
+    * sub_range_days is the length of the sub-ranges a date range is split into
+    '''
+
+    def __init__(self, config, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 sub_range_days=DEFAULT_SUB_RANGE_DAYS):
+        self.config = config
+        self.max_connections = max_connections
+        self.sub_range_days = sub_range_days
+
+        # pool_block makes threads wait for a free connection instead of
+        # opening extra ones, which bounds the concurrency of nested fetches
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_connections,
+            pool_block=True,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def service_url(self, data_collection):
+        '''
+        WFS endpoint of a data collection, see wfs_service_url
+        '''
+        return wfs_service_url(self.config, data_collection)
+
+    def request_params(self, bbox, start_date, end_date, max_cc, data_collection):
+        '''
+        GetFeature parameters of a date range, see wfs_request_params
+        '''
+        return wfs_request_params(
+            bbox, start_date, end_date, max_cc, data_collection,
+            self.config.max_wfs_records_per_query)
+
+    def fetch_range(self, bbox, start_date, end_date, max_cc,
+                    data_collection=DataCollection.SENTINEL2_L2A, tracer=None):
+        '''
+        Page every feature of one date range sequentially, an optional
+        tracing.Tracer times every page
+        '''
+        url = self.service_url(data_collection)
+        params = self.request_params(bbox, start_date, end_date, max_cc, data_collection)
+        page_size = params['MAXFEATURES']
+
+        features = []
+        offset = 0
+        while True:
+            with trace_span(tracer, 'wfs page', start_date=start_date, offset=offset) as details:
+                response = self.session.get(
+                    url, params={**params, 'FEATURE_OFFSET': offset},
+                    timeout=self.config.download_timeout_seconds)
+                response.raise_for_status()
+                page = response.json()['features']
+                details['features'] = len(page)
+            features += page
+
+            # a short page is the last one
+            if len(page) < page_size:
+                return features
+            offset += page_size
+
+    def fetch(self, bbox, start_date, end_date, max_cc,
+              data_collection=DataCollection.SENTINEL2_L2A, tracer=None):
+        '''
+        Return the WFS features of a bounding box between two inclusive
+        yyyy-mm-dd dates, ordered by sub-range and within a sub-range in the
+        order returned by the service.
+
+        * bbox is a bounding box created by sentinelhub.Geometry.BBox
+        * start_date and end_date are date strings formatted as yyyy-mm-dd
+        * max_cc is the maximum allowed cloud cover (0-1 scale)
+        * data_collection is a sentinelhub.DataCollection (Sentinel 2 only, the
+          Sentinel 1 product filtering of WebFeatureService is not applied)
+        * tracer is an optional tracing.Tracer that times every page
+        '''
+        sub_ranges = split_date_range(start_date, end_date, self.sub_range_days)
+
+        def fetch_sub_range(sub_range):
+            return self.fetch_range(bbox, *sub_range, max_cc, data_collection, tracer=tracer)
+
+        if len(sub_ranges) == 1:
+            return fetch_sub_range(sub_ranges[0])
+
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            # map keeps the sub-range order
+            pages = list(executor.map(fetch_sub_range, sub_ranges))
+
+        return [feature for page in pages for feature in page]
+
+    def close(self):
+        '''
+        Close the pooled connections
+        '''
+        self.session.close()
@@ -0,0 +1,72 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+# catalog sizes benchmarked by default, pass --catalog-sizes to change them,
+# e.g. --catalog-sizes 1000,1000000
+DEFAULT_CATALOG_SIZES = '1000,10000,100000'
+
+ORBIT_ADJUSTMENTS = {'2A': -140, '2B': -26}
+
+_catalogs = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--catalog-sizes', default=DEFAULT_CATALOG_SIZES,
+        help='comma separated numbers of WFS features in the synthetic catalogs')
+
+
+def pytest_generate_tests(metafunc):
+    if 'n_features' in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption('catalog_sizes').split(',')]
+        metafunc.parametrize('n_features', sizes, ids=[f'{size}_features' for size in sizes])
+
+
+def synthetic_features(n_features, seed=0):
+    '''
+    WFS tile info features of a synthetic catalog: random dates between 2018
+    and 2021, satellites, relative orbits and tiles with consistent granule IDs
+    '''
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 4 * 365, n_features)
+    is_2a = rng.random(n_features) < 0.5
+    relative_orbits = rng.integers(0, 143, n_features)
+    tiles = [f'{zone}{band}{square}' for zone in range(10, 20) for band in 'TU' for square in ('VG', 'WG')]
+    tile_index = rng.integers(0, len(tiles), n_features)
+    cloud_cover = rng.random(n_features) * 100
+
+    start = dt.date(2018, 1, 1)
+    features = []
+    for i in range(n_features):
+        date = start + dt.timedelta(days=int(days[i]))
+        sat = '2A' if is_2a[i] else '2B'
+        absolute_orbit = 143 * (100 + i % 100) + (relative_orbits[i] - ORBIT_ADJUSTMENTS[sat]) % 143
+        features.append({'properties': {
+            'id': f'S{sat}_OPER_MSI_L2A_TL_VGS1_{date:%Y%m%d}T201253_'
+                  f'A{absolute_orbit:06d}_T{tiles[tile_index[i]]}_N02.14',
+            'date': date.isoformat(),
+            'cloudCoverPercentage': float(cloud_cover[i])
+        }})
+
+    return features
+
+
+@pytest.fixture
+def features(n_features):
+    '''
+    Synthetic WFS features, generated once per catalog size
+    '''
+    if n_features not in _catalogs:
+        _catalogs[n_features] = synthetic_features(n_features)
+    return _catalogs[n_features]
+
+
+@pytest.fixture
+def scenes(features):
+    '''
+    Parsed scene records of the synthetic catalog
+    '''
+    from SentinelMosaicTester.sentinel_utils import parse_scenes
+    return parse_scenes(features)
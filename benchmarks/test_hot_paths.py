@@ -0,0 +1,84 @@
+'''
+Benchmarks of the catalog query hot paths. Run from the repository root:
+
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+'''
+import pytest
+
+from sentinelhub import BBox, CRS
+
+from SentinelMosaicTester.date_index import DateIndex
+from SentinelMosaicTester.evalscript import compile_evalscript
+from SentinelMosaicTester.orbit_footprints import ORBITS_FOOTPRINTS, ORBITS_GEOJSON, \
+    OrbitFootprints
+from SentinelMosaicTester.product_id import parse_product_ids
+from SentinelMosaicTester.sentinel_utils import absolute_to_relative_orbit, \
+    absolute_to_relative_orbits, filter_dates, get_preview_evalscript, parse_scenes, \
+    select_dates_by_orbit
+
+
+def test_absolute_to_relative_orbit(benchmark, scenes):
+    benchmark(lambda: [
+        absolute_to_relative_orbit(scene['absolute_orbit'], scene['sat'])
+        for scene in scenes
+    ])
+
+
+def test_absolute_to_relative_orbits(benchmark, scenes):
+    absolute_orbits = [scene['absolute_orbit'] for scene in scenes]
+    sats = [scene['sat'] for scene in scenes]
+    benchmark(absolute_to_relative_orbits, absolute_orbits, sats)
+
+
+def test_parse_product_ids(benchmark, features):
+    product_ids = [feature['properties']['id'] for feature in features]
+    benchmark(parse_product_ids, product_ids)
+
+
+def test_parse_scenes(benchmark, features):
+    benchmark(parse_scenes, features)
+
+
+def test_select_dates_by_orbit(benchmark, scenes):
+    benchmark(select_dates_by_orbit, scenes, [112, 69, 26])
+
+
+def test_build_date_index(benchmark, scenes):
+    benchmark(DateIndex, scenes)
+
+
+def test_date_index_month_dates(benchmark, scenes):
+    index = DateIndex(scenes)
+    benchmark(index.month_dates, [6, 7, 8], [2019, 2020], orbits=[112, 69, 26])
+
+
+def test_filter_dates(benchmark, scenes):
+    dates = [scene['date'] for scene in scenes]
+    benchmark(filter_dates, dates, [6, 7, 8], [2019, 2020])
+
+
+@pytest.mark.parametrize('n_dates', [10, 100, 1000])
+def test_get_preview_evalscript(benchmark, n_dates):
+    dates = [f'2020-{month:02d}-{day:02d}' for month in range(1, 13) for day in range(1, 29)]
+    benchmark(get_preview_evalscript, (dates * 3)[:n_dates])
+
+
+def test_compile_evalscript(benchmark):
+    # the uncached compile, build_evalscript reuses compiled templates
+    benchmark(compile_evalscript.__wrapped__, ('B08', 'B03', 'B02'), (1, 3, 8, 9, 10, 11),
+              'median', 'UINT16')
+
+
+def test_load_orbit_footprints(benchmark):
+    benchmark(OrbitFootprints.from_file, ORBITS_FOOTPRINTS)
+
+
+def test_load_orbit_footprints_geojson(benchmark):
+    benchmark(OrbitFootprints.from_geojson, ORBITS_GEOJSON)
+
+
+def test_suggest_orbits(benchmark):
+    footprints = OrbitFootprints.from_file(ORBITS_FOOTPRINTS)
+    bbox = BBox(bbox=[-93.1, 45.0, -92.9, 45.2], crs=CRS.WGS84)
+    benchmark(footprints.suggest_orbits, bbox)